@@ -0,0 +1,410 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:52:08 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import os, sys, copy, json, timeit, socket, platform, datetime, tempfile, shutil, warnings, collections, contextlib, multiprocessing
+import numpy as np
+import fitsio
+
+import ngtsio
+import ngtsio_get
+import ngtsio_lazy
+import ngtsio_synthetic
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+
+
+###############################################################################
+# Benchmark suite on synthetic data
+###############################################################################
+'''
+Times the get() hot paths on synthetic prodstore trees and megafiles (see
+ngtsio_synthetic.py), so that no real NGTS data are needed. The results are
+written as JSON, to track regressions from release to release, e.g.
+
+    python benchmark_ngtsio.py                      # default size, print JSON
+    python benchmark_ngtsio.py 5000 20000 out.json  # N_obj N_time outfname
+
+In memory mode, the peak memory of every stage of get() is recorded instead,
+and compared against the committed baseline (BASELINE_MEMORY):
+
+    python benchmark_ngtsio.py memory               # default size, print JSON and regressions
+    python benchmark_ngtsio.py memory 1000 4000 out.json
+'''
+
+FIELDNAME = 'NG0304-1115'
+NGTS_VERSION = 'CYCLE1706'
+
+KEYS = {'prodstore': ['OBJ_ID','RA','DEC','HJD','FLUX3','FLUX3_ERR','FLAGS','CCDX','CENTDX',
+                      'SYSREM_FLUX3','DECORR_FLUX3','PERIOD','DEPTH'],
+        'megafile':  ['OBJ_ID','RA','DEC','HJD','FLUX','FLUX_ERR','FLAGS','CCDX','CENTDX']}
+
+#::: find() only needs RA and DEC of all objects of every candidate field
+KEYS_FIND = ['RA','DEC']
+
+
+
+def scenarios(N_obj, N_nights, layout='prodstore'):
+    '''(name, keys, selection) of all benchmark scenarios that apply to layout (the megafile has no BLS candidates)'''
+    obj_id = N_obj//2
+    obj_ids = range(1, N_obj+1, max(1, N_obj//100))
+    date0 = datetime.datetime.strptime(ngtsio_synthetic.START_DATE, '%Y-%m-%d')
+    dates = [ (date0 + datetime.timedelta(days=n)).strftime('%Y-%m-%d') for n in (0, N_nights//2) ]
+    hjds = [ ngtsio_synthetic.START_HJD, ngtsio_synthetic.START_HJD + N_nights//2 ]
+    selected = [
+        ('single_object', None,      {'obj_id':obj_id}),
+        ('object_list',   None,      {'obj_id':obj_ids}),
+        ('all_objects',   None,      {}),
+        ('time_date',     None,      {'obj_id':obj_ids, 'time_date':dates}),
+        ('time_hjd',      None,      {'obj_id':obj_ids, 'time_hjd':hjds}),
+        ('bls',           None,      {'obj_id':'bls'}),
+        ('find',          KEYS_FIND, {}),
+        ]
+    if layout == 'megafile':
+        selected = [ s for s in selected if s[0] != 'bls' ]
+    return selected
+
+
+
+def run(outdir=None, N_obj=1000, N_time=2000, N_nights=20, fitsreaders=['fitsio','pyfits'],
+        layouts=['prodstore','megafile'], repeat=3, outfname=None):
+    '''
+    generate the synthetic data, time all scenarios and return (and optionally save) the results
+
+    Parameters
+    ----------
+    outdir : str
+        where to write the synthetic data; if None, a temporary directory is used and removed afterwards
+    N_obj, N_time, N_nights : int
+        size of the synthetic field
+    fitsreaders : list of str
+        the fitsreaders to benchmark, e.g. ['fitsio','pyfits','mmap']
+    layouts : list of str
+        'prodstore' and/or 'megafile'
+    repeat : int
+        every scenario is timed repeat times (after one warm-up call), the best time is reported
+    outfname : str
+        if given, the results are saved as JSON into this file
+
+    Returns
+    -------
+    results : dict
+        the environment (versions, host, sizes) and one entry per layout, fitsreader and scenario
+        with the best and mean time in s, or the error if a scenario failed
+    '''
+
+    tmpdir = None
+    if outdir is None:
+        outdir = tmpdir = tempfile.mkdtemp(prefix='ngtsio_benchmark_')
+
+    try:
+        #::: synthetic data
+        kwargs = {}
+        if 'prodstore' in layouts:
+            kwargs['prodstore'] = {'roots': ngtsio_synthetic.make_prodstore(outdir, FIELDNAME, NGTS_VERSION, N_obj=N_obj, N_time=N_time, N_nights=N_nights)}
+        if 'megafile' in layouts:
+            kwargs['megafile'] = {'fnames': {'BLSPipe_megafile': ngtsio_synthetic.make_megafile(outdir, FIELDNAME, N_obj=N_obj, N_time=N_time, N_nights=N_nights)}}
+
+        results = {'date': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+                   'host': socket.gethostname(),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'fitsio': fitsio.__version__,
+                   'ngtsio': ngtsio.__version__,
+                   'N_obj': N_obj, 'N_time': N_time, 'N_nights': N_nights, 'repeat': repeat,
+                   'results': []}
+
+        for layout in layouts:
+            for fitsreader in fitsreaders:
+                for name, keys, selection in scenarios(N_obj, N_nights, layout):
+                    if keys is None:
+                        keys = KEYS[layout]
+                    result = {'layout':layout, 'fitsreader':fitsreader, 'scenario':name}
+                    result.update( time_get(keys, selection, fitsreader, kwargs[layout], repeat) )
+                    results['results'].append(result)
+
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    if outfname is not None:
+        with open(outfname, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    return results
+
+
+
+def time_get(keys, selection, fitsreader, kwargs, repeat):
+    '''best and mean time of one get() call, or the error if it fails'''
+
+    #::: silence warnings and check_dic reports, they would end up in the timings (and the JSON output)
+    def test():
+        with warnings.catch_warnings(), open(os.devnull, 'w') as devnull:
+            warnings.simplefilter('ignore')
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                return ngtsio.get(FIELDNAME, NGTS_VERSION, list(keys), fitsreader=fitsreader, silent=True,
+                              **dict(copy.deepcopy(kwargs), **selection))
+            finally:
+                sys.stdout = stdout
+
+    try:
+        dic = test()
+        times = timeit.repeat(test, number=1, repeat=repeat)
+    except (Exception, SystemExit) as e:
+        return {'error': repr(e)}
+
+    if dic is None:
+        return {'error': 'get() returned None'}
+
+    return {'best_s': min(times), 'mean_s': np.mean(times)}
+
+
+
+
+
+###############################################################################
+# Peak memory per stage of get()
+###############################################################################
+BASELINE_MEMORY = os.path.join( os.path.dirname(os.path.abspath(__file__)), 'benchmark_ngtsio_memory_baseline.json' )
+
+KEYS_MEMORY = ['OBJ_ID','HJD','FLUX3','FLUX3_ERR','SYSREM_FLUX3','FLAGS','CCDX','CENTDX']
+
+
+
+class MemoryProfiler(object):
+    '''
+    Records the peak memory of every stage of get() (see ngtsio_get.stage),
+    above the memory in use when the stage started, in MB:
+        traced : memory traced by tracemalloc (Python >= 3.9, includes numpy arrays)
+        rss    : resident set size (Linux; the high-water mark VmHWM is reset at every
+                 stage boundary via /proc/self/clear_refs)
+    Stages are nested (e.g. 'read FLUX3' within 'get_data'); the peaks of the inner
+    stages count towards the outer ones. Repeated stages keep their largest peak.
+    '''
+
+    def __init__(self):
+        self.stack = []
+        self.peaks = collections.OrderedDict()
+        self.traced = (tracemalloc is not None) and hasattr(tracemalloc, 'reset_peak')
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            self.rss = True
+        except (IOError, OSError):
+            self.rss = False
+        if self.traced and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.update()
+        current = self.read()
+        frame = {'name':name, 'start':current, 'peak':dict(current)}
+        self.stack.append(frame)
+        self.reset()
+        try:
+            yield
+        finally:
+            self.update()
+            self.stack.pop()
+            self.reset()
+            peaks = self.peaks.setdefault(name, {})
+            for kind in frame['start']:
+                peak_MB = (frame['peak'][kind] - frame['start'][kind]) / 2.**20
+                peaks[kind] = max(peaks.get(kind, 0.), peak_MB)
+
+
+    def read(self, peak=False):
+        '''current (or peak) memory in bytes, per kind'''
+        memory = {}
+        if self.traced:
+            memory['traced'] = tracemalloc.get_traced_memory()[1 if peak else 0]
+        if self.rss:
+            memory['rss'] = read_proc_status('VmHWM' if peak else 'VmRSS')
+        return memory
+
+
+    def update(self):
+        '''let all running stages know about the peak since the last reset'''
+        peak = self.read(peak=True)
+        for frame in self.stack:
+            for kind in peak:
+                frame['peak'][kind] = max(frame['peak'][kind], peak[kind])
+
+
+    def reset(self):
+        if self.traced:
+            tracemalloc.reset_peak()
+        if self.rss:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+
+
+
+def read_proc_status(field):
+    '''a memory field of /proc/self/status in bytes'''
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field+':'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+
+def memory_scenarios(N_obj, N_nights):
+    '''
+    (name, selection) of all memory scenarios, all with set_nan=True;
+    the big reads are repeated with preserve_dtype and lazy_decode, to track what they save
+    '''
+    memory = []
+    for name, keys, selection in scenarios(N_obj, N_nights):
+        if name in ('single_object', 'object_list', 'all_objects', 'time_date'):
+            memory.append( (name, selection) )
+        if name in ('object_list', 'all_objects'):
+            memory.append( (name+'_preserve_dtype', dict(selection, preserve_dtype=True)) )
+            memory.append( (name+'_lazy_decode', dict(selection, lazy_decode=True)) )
+    return memory
+
+
+
+def run_memory(outdir=None, N_obj=1000, N_time=4000, N_nights=20, fitsreaders=['fitsio','pyfits','mmap'], outfname=None):
+    '''
+    generate a synthetic prodstore tree and record the peak memory of every stage of get()
+    for every scenario and fitsreader.
+    Parameters and output as in run, with the peaks (in MB) per stage instead of the times.
+    '''
+
+    tmpdir = None
+    if outdir is None:
+        outdir = tmpdir = tempfile.mkdtemp(prefix='ngtsio_benchmark_')
+
+    #::: every step runs in a fresh process (forked from this one, which never holds large arrays),
+    #::: so that memory freed by one step cannot hide the allocations of the next one
+    def in_process(func, *args):
+        pool = multiprocessing.Pool(1)
+        try:
+            return pool.apply(func, args)
+        finally:
+            pool.terminate()
+
+    try:
+        roots = in_process(ngtsio_synthetic.make_prodstore, outdir, FIELDNAME, NGTS_VERSION, N_obj, N_time, N_nights)
+
+        results = {'date': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+                   'host': socket.gethostname(),
+                   'python': platform.python_version(),
+                   'numpy': np.__version__,
+                   'fitsio': fitsio.__version__,
+                   'ngtsio': ngtsio.__version__,
+                   'N_obj': N_obj, 'N_time': N_time, 'N_nights': N_nights, 'keys': KEYS_MEMORY,
+                   'results': []}
+
+        for fitsreader in fitsreaders:
+            for name, selection in memory_scenarios(N_obj, N_nights):
+                result = {'layout':'prodstore', 'fitsreader':fitsreader, 'scenario':name}
+                result.update( in_process(profile_get, KEYS_MEMORY, selection, fitsreader, {'roots':roots}) )
+                results['results'].append(result)
+
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+    if outfname is not None:
+        with open(outfname, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+
+    return results
+
+
+
+def profile_get(keys, selection, fitsreader, kwargs):
+    '''peak memory per stage of one get() call (runs in a fresh process)'''
+
+    profiler = MemoryProfiler()
+    ngtsio_get.profiler = profiler
+    try:
+        with warnings.catch_warnings(), open(os.devnull, 'w') as devnull:
+            warnings.simplefilter('ignore')
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                with profiler.stage('get'):
+                    dic = ngtsio.get(FIELDNAME, NGTS_VERSION, list(keys), fitsreader=fitsreader, silent=True, set_nan=True,
+                                     **dict(copy.deepcopy(kwargs), **selection))
+            finally:
+                sys.stdout = stdout
+    except (Exception, SystemExit) as e:
+        return {'error': repr(e)}
+    finally:
+        ngtsio_get.profiler = None
+
+    #::: lazy_decode returns CCDX/Y and CENTDX/Y as FixedPointArray, which only hold the raw integers
+    output_MB = sum( value.nbytes if isinstance(value, np.ndarray) else value.raw.nbytes
+                     for value in dic.values() if isinstance(value, (np.ndarray, ngtsio_lazy.FixedPointArray)) ) / 2.**20
+    return {'output_MB': output_MB, 'stages': profiler.peaks}
+
+
+
+def compare_memory(results, baseline, tolerance=0.2, slack_MB=2.):
+    '''
+    compare the peaks of all stages with a baseline (same N_obj, N_time);
+    returns a list of regressions, i.e. peaks that grew by more than tolerance (relative) and slack_MB
+    '''
+
+    if (results['N_obj'], results['N_time']) != (baseline['N_obj'], baseline['N_time']):
+        return [ 'baseline has a different size (N_obj=%d, N_time=%d), nothing compared' % (baseline['N_obj'], baseline['N_time']) ]
+
+    base = dict( ((r['layout'], r['fitsreader'], r['scenario']), r) for r in baseline['results'] )
+    regressions = []
+    for r in results['results']:
+        b = base.get( (r['layout'], r['fitsreader'], r['scenario']) )
+        if (b is None) or ('stages' not in r) or ('stages' not in b):
+            continue
+        for name, peaks in r['stages'].items():
+            for kind, peak_MB in peaks.items():
+                if kind not in b['stages'].get(name, {}):
+                    continue
+                base_MB = b['stages'][name][kind]
+                if peak_MB > base_MB*(1.+tolerance) + slack_MB:
+                    regressions.append( '%s %s %s, stage %s: %s peak %.1f MB (baseline %.1f MB)'
+                                        % (r['layout'], r['fitsreader'], r['scenario'], name, kind, peak_MB, base_MB) )
+    return regressions
+
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    memory = (len(args) > 0) and (args[0] == 'memory')
+    if memory: args = args[1:]
+    N_obj = int(args[0]) if len(args) > 0 else 1000
+    N_time = int(args[1]) if len(args) > 1 else (4000 if memory else 2000)
+    outfname = args[2] if len(args) > 2 else None
+    if memory:
+        results = run_memory(N_obj=N_obj, N_time=N_time, outfname=outfname)
+    else:
+        results = run(N_obj=N_obj, N_time=N_time, outfname=outfname)
+    if outfname is None:
+        print(json.dumps(results, indent=1, sort_keys=True))
+    if memory and os.path.exists(BASELINE_MEMORY):
+        with open(BASELINE_MEMORY) as f:
+            regressions = compare_memory(results, json.load(f))
+        for line in regressions:
+            print('Memory regression: '+line)
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -15,6 +15,11 @@ Email: mg719@cam.ac.uk
 import numpy as np
 import ngtsio_find
 import ngtsio_get
+from ngtsio_field import Field, iter_objects
+from ngtsio_many import get_many
+import ngtsio_aio as aio
+import ngtsio_results as results
+import ngtsio_store
 import pickle
 
 
@@ -55,11 +60,19 @@ def find_list(fname, usecols=(0,1), ngts_version='all', unit='hmsdms', frame='ic
     
     print('#RA\tDEC\tfieldname\tngts_version\tobj_id')
     RAs, DECs = np.genfromtxt(fname, usecols=usecols, delimiter='\t', dtype=None, unpack=True)
-    for i in range(len(RAs)):
-        ngtsio_find.find(RAs[i], DECs[i], ngts_version=ngts_version, unit=unit, frame=frame, 
+    ngtsio_find.find_list(RAs, DECs, ngts_version=ngts_version, unit=unit, frame=frame, 
                      give_obj_id=give_obj_id, search_radius=search_radius, 
                      field_radius=field_radius, outfname=outfname)
 
+    
+    
+    
+def cone_search(RA, DEC, search_radius=0.0014, ngts_version='all', unit='deg', frame='icrs', field_radius=2.):
+    '''find all objects within search_radius of a given RA and Dec with ngtsio_find.py; see ngtsio_find.py for docstring'''
+    
+    return ngtsio_find.cone_search(RA, DEC, search_radius=search_radius, ngts_version=ngts_version, 
+                                   unit=unit, frame=frame, field_radius=field_radius)
+
 
 
 
@@ -70,19 +83,40 @@ def find_list(fname, usecols=(0,1), ngts_version='all', unit='hmsdms', frame='ic
 def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, 
         time_index=None, time_date=None, time_hjd=None, time_actionid=None, 
         bls_rank=1, indexing='fits', fitsreader='fitsio', simplify=True, 
-        fnames=None, root=None, roots=None, silent=False, set_nan=False):
+        fnames=None, root=None, roots=None, silent=False, set_nan=False, flag_mask=None, preserve_dtype=False, lazy_decode=False, lazy=False):
     '''get data for a given object with ngtsio_get.py; see ngtsio_get.py for docstring'''
             
     dic = ngtsio_get.get(fieldname, ngts_version, keys, obj_id=obj_id, obj_row=obj_row, 
         time_index=time_index, time_date=time_date, time_hjd=time_hjd, time_actionid=time_actionid, 
         bls_rank=bls_rank, indexing=indexing, fitsreader=fitsreader, simplify=simplify, 
-        fnames=fnames, root=root, roots=roots, silent=silent, set_nan=set_nan)
+        fnames=fnames, root=root, roots=roots, silent=silent, set_nan=set_nan, flag_mask=flag_mask, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode, lazy=lazy)
             
     return dic
     
     
     
 
+###############################################################################
+# Converter
+###############################################################################
+def convert(fieldname, ngts_version, outfname=None, obj_chunk=8, time_chunk=4096, 
+            compression='gzip', compression_opts=1, fnames=None, root=None, roots=None, silent=False):
+    '''convert all fits files of a field into one chunked HDF5 store, which get() then reads from; see ngtsio_store.py for docstring'''
+    
+    return ngtsio_store.convert(fieldname, ngts_version, outfname=outfname, obj_chunk=obj_chunk, time_chunk=time_chunk, 
+                                compression=compression, compression_opts=compression_opts, 
+                                fnames=fnames, root=root, roots=roots, silent=silent)
+
+
+
+def transpose(fieldname, ngts_version, keys=None, fnames=None, root=None, roots=None, block_rows=None, silent=False):
+    '''build time-major copies of DATA images, which get() then reads for queries of a few exposures of many objects; see ngtsio_get.py for docstring'''
+    
+    return ngtsio_get.transpose(fieldname, ngts_version, keys=keys, fnames=fnames, root=root, roots=roots, block_rows=block_rows, silent=silent)
+
+
+
+
 ###############################################################################
 # Save to pickle
 ###############################################################################
@@ -90,13 +124,13 @@ def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None,
 def save(outfilename, fieldname, ngts_version, keys, obj_id=None, obj_row=None, 
         time_index=None, time_date=None, time_hjd=None, time_actionid=None, 
         bls_rank=1, indexing='fits', fitsreader='fitsio', simplify=True, 
-        fnames=None, root=None, roots=None, silent=False, set_nan=False):
+        fnames=None, root=None, roots=None, silent=False, set_nan=False, flag_mask=None, preserve_dtype=False, lazy_decode=False):
     '''save data for a given object to outfilename.pickle via ngtsio_get.py; see ngtsio_get.py for docstring'''
             
     dic = ngtsio_get.get(fieldname, ngts_version, keys, obj_id=obj_id, obj_row=obj_row, 
         time_index=time_index, time_date=time_date, time_hjd=time_hjd, time_actionid=time_actionid, 
         bls_rank=bls_rank, indexing=indexing, fitsreader=fitsreader, simplify=simplify, 
-        fnames=fnames, root=root, roots=roots, silent=silent, set_nan=set_nan)
+        fnames=fnames, root=root, roots=roots, silent=silent, set_nan=set_nan, flag_mask=flag_mask, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode)
         
     pickle.dump( dic, open( outfilename+'.pickle', 'wb' ) )
     
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:02:36 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import threading, collections
+from ngtsio_field import Field
+from ngtsio_results import freeze
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+try:
+    import concurrent.futures as futures
+except ImportError:
+    futures = None
+
+
+
+
+###############################################################################
+# asyncio interface (ngtsio.aio)
+###############################################################################
+'''
+Non-blocking versions of get() for use within an asyncio event loop, e.g.
+
+    dic = await ngtsio.aio.get('NG0304-1115', 'CYCLE1706', ['HJD','SYSREM_FLUX3'], obj_id=46)
+    dics = await ngtsio.aio.gather_many(requests)
+
+(or "yield From(...)" with trollius on Python 2).
+
+- The blocking reads run in a thread pool of at most MAX_WORKERS threads.
+- All requests to the same field share one ngtsio.Field, i.e. its open file
+  handles and cached columns; requests to the same field are read one after
+  another, requests to different fields in parallel.
+- At most MAX_FIELDS fields are kept open; the least recently used field is
+  closed once no request is reading from it any more.
+- Identical requests that are in flight at the same time are read only once,
+  and all callers receive the same dictionary (do not modify it in place).
+
+Needs asyncio (Python 3) or trollius (Python 2).
+'''
+
+#::: maximum number of threads reading at the same time
+MAX_WORKERS = 8
+
+#::: maximum number of fields that are kept open (each Field holds about 20 file handles)
+MAX_FIELDS = 16
+
+executor = None
+fields = collections.OrderedDict()
+users = {}
+fields_lock = threading.Lock()
+inflight = {}
+
+
+
+def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None,
+        time_index=None, time_date=None, time_hjd=None, time_actionid=None,
+        bls_rank=1, indexing='fits', fitsreader='fitsio', simplify=True,
+        fnames=None, root=None, roots=None, silent=True, set_nan=False, flag_mask=None, preserve_dtype=False, lazy_decode=False, loop=None):
+    '''
+    get data for a given object without blocking the event loop; returns an awaitable
+    future of the dictionary returned by ngtsio_get.get (see there for the parameters)
+    '''
+
+    if asyncio is None:
+        raise ImportError('ngtsio.aio needs asyncio (Python 3) or trollius (Python 2).')
+
+    if loop is None:
+        loop = asyncio.get_event_loop()
+
+    if isinstance(keys, str): keys = [keys]
+
+    field_kwargs = { 'fnames':fnames, 'root':root, 'roots':roots }
+    get_kwargs = { 'obj_id':obj_id, 'obj_row':obj_row,
+                   'time_index':time_index, 'time_date':time_date, 'time_hjd':time_hjd, 'time_actionid':time_actionid,
+                   'bls_rank':bls_rank, 'indexing':indexing, 'fitsreader':fitsreader, 'simplify':simplify,
+                   'silent':silent, 'set_nan':set_nan, 'flag_mask':flag_mask,
+                   'preserve_dtype':preserve_dtype, 'lazy_decode':lazy_decode }
+
+    #::: identical requests in flight share one read
+    requestkey = freeze( (id(loop), fieldname, ngts_version, keys, field_kwargs, get_kwargs) )
+    if requestkey not in inflight:
+        future = loop.run_in_executor(get_executor(), read, fieldname, ngts_version, list(keys), field_kwargs, get_kwargs)
+        inflight[requestkey] = future
+        future.add_done_callback(lambda f: inflight.pop(requestkey, None))
+
+    #::: a caller that gives up (cancels) does not cancel the read for the others
+    return asyncio.shield(inflight[requestkey])
+
+
+
+def gather_many(requests, fitsreader='fitsio', return_exceptions=False, loop=None):
+    '''
+    get data for many requests concurrently; requests are (fieldname, ngts_version, keys, selection)
+    tuples as in ngtsio.get_many; returns an awaitable future of the list of dictionaries (in order)
+    '''
+
+    if asyncio is None:
+        raise ImportError('ngtsio.aio needs asyncio (Python 3) or trollius (Python 2).')
+
+    requests_futures = []
+    for request in requests:
+        if len(request) == 3:
+            fieldname, ngts_version, keys = request
+            selection = {}
+        else:
+            fieldname, ngts_version, keys, selection = request
+        selection = dict(selection)
+        selection.setdefault('fitsreader', fitsreader)
+        requests_futures.append( get(fieldname, ngts_version, keys, loop=loop, **selection) )
+
+    return asyncio.gather(*requests_futures, return_exceptions=return_exceptions)
+
+
+
+def close():
+    '''close all shared fields and shut down the thread pool'''
+    global executor
+    with fields_lock:
+        for field in fields.values():
+            field.close()
+        fields.clear()
+    if executor is not None:
+        executor.shutdown(wait=False)
+        executor = None
+
+
+
+
+###############################################################################
+# Helpers (run in the thread pool)
+###############################################################################
+def read(fieldname, ngts_version, keys, field_kwargs, get_kwargs):
+    '''read one request through the shared Field'''
+    #::: get() and Field() exit on invalid input; do not let this stop the event loop
+    try:
+        field = acquire_field(fieldname, ngts_version, field_kwargs)
+        try:
+            return field.get(keys, **get_kwargs)
+        finally:
+            release_field(field)
+    except SystemExit as e:
+        raise RuntimeError('ngtsio.aio.get failed for field '+str(fieldname)+' '+str(ngts_version)+': '+str(e))
+
+
+
+def acquire_field(fieldname, ngts_version, field_kwargs):
+    '''
+    the shared Field for a fieldname, ngts_version and fnames/root/roots, marked as in use;
+    beyond MAX_FIELDS, the least recently used fields are closed (or as soon as they are no longer in use);
+    fields that are not found are not kept, so that they are looked up again by the next request
+    '''
+    fieldkey = freeze( (fieldname, ngts_version, field_kwargs) )
+    with fields_lock:
+        if fieldkey in fields:
+            field = fields.pop(fieldkey)
+            fields[fieldkey] = field
+            users[field] = users.get(field, 0) + 1
+            return field
+
+    #::: resolving the file names globs the prodstore (slow on network file systems), so other fields are not held up
+    new = Field(fieldname, ngts_version, silent=True, **field_kwargs)
+
+    with fields_lock:
+        #::: another thread may have opened the same field meanwhile
+        field = fields.pop(fieldkey, new)
+        if field is not new:
+            new.close()
+        if field.fnames is not None:
+            fields[fieldkey] = field
+        users[field] = users.get(field, 0) + 1
+        while len(fields) > MAX_FIELDS:
+            evicted = fields.popitem(last=False)[1]
+            if evicted not in users:
+                evicted.close()
+        return field
+
+
+
+def release_field(field):
+    '''mark the Field as no longer in use by one request, and close it if it has been evicted meanwhile'''
+    with fields_lock:
+        users[field] -= 1
+        if users[field] == 0:
+            del users[field]
+            if not any( f is field for f in fields.values() ):
+                field.close()
+
+
+
+def get_executor():
+    '''the bounded thread pool (or None for the event loop's default executor if concurrent.futures is missing)'''
+    global executor
+    if (executor is None) and (futures is not None):
+        executor = futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return executor
+
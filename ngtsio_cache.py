@@ -0,0 +1,509 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 13:05:52 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import os, stat, glob, fnmatch, json, time, threading, hashlib, tempfile
+import numpy as np
+
+
+
+
+###############################################################################
+# Local cache directory
+###############################################################################
+'''
+Small derived files (indices, binary copies of text tables, ...) are kept in
+a local cache directory, one file per source file. The name of each cache file
+contains the modification time and size of its source file, so cache files are
+invalidated automatically whenever the source file changes.
+
+Set NGTSIO_CACHE_DIR (or ngtsio_cache.CACHE_DIR) to move the cache,
+or set NGTSIO_CACHE_DIR to an empty string (or ngtsio_cache.CACHE_DIR = None)
+to disable it.
+'''
+#::: an empty NGTSIO_CACHE_DIR disables the cache (instead of writing into the working directory)
+CACHE_DIR = os.environ.get( 'NGTSIO_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.ngtsio_cache') ) or None
+
+
+
+def fingerprint(fname):
+    '''modification time and size of a file'''
+    stat = os.stat(fname)
+    return '%d_%d' % (int(stat.st_mtime*1e6), stat.st_size)
+
+
+
+def cache_fname(fname, kind, ext='.npy'):
+    '''name of the cache file of kind "kind" for the (current version of the) source file fname'''
+    name = hashlib.md5( os.path.abspath(fname).encode('utf-8') ).hexdigest()
+    return os.path.join( CACHE_DIR, kind, name + '_' + fingerprint(fname) + ext )
+
+
+
+def save_npy(fname, kind, data):
+    '''
+    save data as the cache file for fname (atomically), and remove outdated cache files of fname;
+    returns False if the cache directory is disabled or not writable
+    '''
+    if CACHE_DIR is None:
+        return False
+
+    outfname = cache_fname(fname, kind)
+    try:
+        if not os.path.exists(os.path.dirname(outfname)): os.makedirs(os.path.dirname(outfname))
+        fd, tmpfname = tempfile.mkstemp(dir=os.path.dirname(outfname), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, data)
+        os.rename(tmpfname, outfname)
+    except (IOError, OSError):
+        return False
+
+    remove_outdated(outfname)
+    return True
+
+
+
+def remove_outdated(outfname):
+    '''remove the cache files of older versions of the source file of outfname'''
+    for oldfname in glob.glob( outfname.rsplit('_',2)[0] + '_*.npy' ):
+        if oldfname != outfname:
+            try: os.remove(oldfname)
+            except OSError: pass
+
+
+
+def find_outdated(fname, kind):
+    '''the cache file of an older version of the source file fname, or None'''
+    if CACHE_DIR is None:
+        return None
+    current = cache_fname(fname, kind)
+    for oldfname in glob.glob( current.rsplit('_',2)[0] + '_*.npy' ):
+        if oldfname != current:
+            return oldfname
+    return None
+
+
+
+def kind_state(kind):
+    '''modification time of the directory of all cache files of kind (None if there is none), which changes whenever one is added or removed'''
+    if CACHE_DIR is None:
+        return None
+    try:
+        return os.stat( os.path.join(CACHE_DIR, kind) ).st_mtime
+    except OSError:
+        return None
+
+
+
+def load_npy(fname, kind, mmap_mode='r'):
+    '''load the cache file for fname, or return None if there is none (or it is outdated)'''
+    if CACHE_DIR is None:
+        return None
+    infname = cache_fname(fname, kind)
+    if os.path.exists(infname):
+        try:
+            return np.load(infname, mmap_mode=mmap_mode)
+        except (IOError, OSError, ValueError):
+            return None
+    return None
+
+
+
+
+###############################################################################
+# Time-major copies of images (epoch queries)
+###############################################################################
+'''
+The DATA images are stored object-major (N_obj x N_time) in the fits files,
+so reading a few exposures of all objects touches every row of the image.
+The time-major copy is the transposed (N_time x N_obj) image, where one
+exposure is N_obj contiguous values. It is memory-mapped when read.
+When nights are appended to a fits file, its outdated copy can be extended
+by the new exposures instead of being rebuilt (see ngtsio_get.transpose).
+'''
+
+#::: objects per block while building a copy (at most TIME_MAJOR_BLOCK x N_time values in memory)
+TIME_MAJOR_BLOCK = 1024
+
+
+
+def load_time_major(fname, hdukey):
+    '''the time-major copy of the image hdukey of fname, or None if there is none (or it is outdated)'''
+    return load_npy(fname, 'time_major_'+hdukey)
+
+
+
+def load_outdated_time_major(fname, hdukey):
+    '''the time-major copy of an older version of fname (e.g. before nights were appended), or None'''
+    infname = find_outdated(fname, 'time_major_'+hdukey)
+    if infname is None:
+        return None
+    try:
+        return np.load(infname, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+
+def save_time_major(fname, hdukey, shape, dtype, read_rows, block_rows=TIME_MAJOR_BLOCK, old=None):
+    '''
+    write the time-major copy of the (N_obj, N_time) image hdukey of fname (atomically), reading
+    read_rows(row_start, row_stop, time_start) (the exposures from time_start on) in blocks of
+    block_rows objects; the first N_time_old exposures are copied from old (a time-major
+    (N_time_old, N_obj) copy) if given; returns False if the cache directory is disabled or not writable
+    '''
+    if CACHE_DIR is None:
+        return False
+
+    N_obj, N_time = shape
+    time_start = 0 if old is None else len(old)
+    outfname = cache_fname(fname, 'time_major_'+hdukey)
+    try:
+        if not os.path.exists(os.path.dirname(outfname)): os.makedirs(os.path.dirname(outfname))
+        fd, tmpfname = tempfile.mkstemp(dir=os.path.dirname(outfname), suffix='.tmp')
+        os.close(fd)
+        try:
+            out = np.lib.format.open_memmap(tmpfname, mode='w+', dtype=dtype, shape=(N_time, N_obj))
+            #::: as many values per block as when reading the fits file
+            time_block = max( 1, block_rows*N_time//max(N_obj,1) )
+            for t in range(0, time_start, time_block):
+                out[t:min(t+time_block, time_start)] = old[t:min(t+time_block, time_start)]
+            if time_start < N_time:
+                for row_start in range(0, N_obj, block_rows):
+                    row_stop = min(row_start+block_rows, N_obj)
+                    out[time_start:, row_start:row_stop] = read_rows(row_start, row_stop, time_start).T
+            out.flush()
+            del out
+            os.rename(tmpfname, outfname)
+        except:
+            if os.path.exists(tmpfname): os.remove(tmpfname)
+            raise
+    except (IOError, OSError):
+        return False
+
+    remove_outdated(outfname)
+    return True
+
+
+
+
+###############################################################################
+# OBJ_ID -> row index of CATALOGUE files
+###############################################################################
+'''
+The index is a (3, N_obj) int64 array:
+    index[0] : all OBJ_IDs as integers, sorted
+    index[1] : the CATALOGUE rows of index[0]
+    index[2] : the OBJ_IDs as integers, in row order
+It is memory-mapped, so looking up a few objects with np.searchsorted only
+touches O(log N_obj) entries of the index, and never the CATALOGUE itself.
+'''
+
+def get_objid_index(fname, read_objids):
+    '''
+    load the OBJ_ID index of the CATALOGUE file fname, or build it (from read_objids()) on first use;
+    returns None if the OBJ_IDs are not plain 6-digit integers or the index cannot be saved
+    '''
+
+    index = load_npy(fname, 'objid_index')
+
+    if index is None:
+        obj_ids = np.asarray( read_objids() )
+        try:
+            obj_ids_int = obj_ids.astype(np.int64)
+        except ValueError:
+            return None
+        #::: only use the index if the OBJ_IDs can be recovered from the integers exactly
+        if not np.array_equal( format_objids(obj_ids_int), obj_ids ):
+            return None
+        ind_sort = np.argsort(obj_ids_int, kind='mergesort')
+        index = np.vstack(( obj_ids_int[ind_sort], ind_sort, obj_ids_int )).astype(np.int64)
+        if not save_npy(fname, 'objid_index', index):
+            return None
+
+    return index
+
+
+
+def lookup_objids(index, obj_ids):
+    '''
+    rows of the given OBJ_IDs (str); returns the sorted rows and the found OBJ_IDs (in the same order),
+    or None if the given OBJ_IDs are not plain integers
+    '''
+    try:
+        obj_ids_int = np.atleast_1d( np.asarray(obj_ids).astype(np.int64) )
+    except ValueError:
+        return None
+    pos = np.searchsorted(index[0], obj_ids_int)
+    pos[pos == index.shape[1]] = 0
+    found = np.asarray(index[0][pos]) == obj_ids_int
+    ind_objs = np.unique( np.asarray(index[1][pos[found]]) )
+    return ind_objs, format_objids( np.asarray(index[2][ind_objs]) )
+
+
+
+def lookup_rows(index, ind_objs):
+    '''OBJ_IDs (str) of the given rows (or slice)'''
+    return format_objids( np.asarray(index[2][ind_objs]) )
+
+
+
+def format_objids(obj_ids_int):
+    '''integers to 6-digit OBJ_ID strings'''
+    obj_ids_int = np.asarray(obj_ids_int)
+    #::: np.char.mod returns a float array for empty input (e.g. none of the requested OBJ_IDs exists)
+    if obj_ids_int.size == 0:
+        return np.zeros(obj_ids_int.shape, dtype='S6')
+    return np.char.zfill( np.char.mod('%d', obj_ids_int), 6 )
+
+
+
+
+###############################################################################
+# OBJ_ID/RANK of the CANDIDATES of BLS files
+###############################################################################
+'''
+The index is a (2, N_cand) int64 array, in row order of the CANDIDATES:
+    index[0] : the OBJ_IDs as integers
+    index[1] : the RANKs
+It replaces reading and stripping the (S26) OBJ_ID column on every request.
+'''
+
+def get_candidates_index(fname, read_candidates):
+    '''
+    OBJ_IDs and RANKs of all CANDIDATES rows of the BLS file fname, built (from read_candidates()) on first use;
+    the OBJ_IDs are integers if they are plain 6-digit integers, otherwise the stripped strings (not cached)
+    '''
+
+    index = load_npy(fname, 'candidates_index', mmap_mode=None)
+
+    if index is None:
+        obj_ids, ranks = read_candidates()
+        obj_ids = np.asarray(obj_ids)
+        try:
+            obj_ids_int = obj_ids.astype(np.int64)
+        except ValueError:
+            return obj_ids, ranks
+        #::: only use the index if the OBJ_IDs can be recovered from the integers exactly
+        if not np.array_equal( format_objids(obj_ids_int), obj_ids ):
+            return obj_ids, ranks
+        index = np.vstack(( obj_ids_int, ranks )).astype(np.int64)
+        save_npy(fname, 'candidates_index', index)
+
+    return index[0], index[1]
+
+
+
+
+###############################################################################
+# Binary copies of CANVAS text files
+###############################################################################
+def get_canvas_table(fname, read_table):
+    '''the CANVAS table of the text file fname as a structured array, parsed (with read_table()) only on first use'''
+
+    table = load_npy(fname, 'canvas_table', mmap_mode=None)
+
+    if table is None:
+        table = read_table()
+        save_npy(fname, 'canvas_table', table)
+
+    return table
+
+
+
+
+###############################################################################
+# Sky positions of CATALOGUE objects (cone searches)
+###############################################################################
+'''
+The index is a structured array with one entry per object, sorted by Dec:
+    DEC     : Dec in degree
+    X, Y, Z : the unit vector of RA and Dec
+    OBJ_ID  : the OBJ_ID (str)
+It is memory-mapped, so a cone search only reads the objects in the Dec band
+of the cone (found with np.searchsorted).
+'''
+
+def get_sky_index(fname, read_catalogue):
+    '''the sky index of the CATALOGUE file fname, built (from read_catalogue() -> OBJ_ID, RA, DEC in degree) on first use'''
+
+    index = load_npy(fname, 'sky_index')
+
+    if index is None:
+        obj_ids, ra, dec = read_catalogue()
+        obj_ids = np.asarray(obj_ids)
+        index = np.zeros( len(obj_ids), dtype=[('DEC',float), ('X',float), ('Y',float), ('Z',float), ('OBJ_ID',obj_ids.dtype)] )
+        index['DEC'] = dec
+        ra = np.deg2rad( np.asarray(ra, dtype=float) )
+        dec = np.deg2rad( np.asarray(dec, dtype=float) )
+        index['X'] = np.cos(dec)*np.cos(ra)
+        index['Y'] = np.cos(dec)*np.sin(ra)
+        index['Z'] = np.sin(dec)
+        index['OBJ_ID'] = obj_ids
+        index = index[ np.argsort(index['DEC'], kind='mergesort') ]
+        save_npy(fname, 'sky_index', index)
+
+    return index
+
+
+
+###############################################################################
+# Directory listings of the prodstore (discovery index)
+###############################################################################
+'''
+standard_roots, standard_fnames and find look for the directories and files
+of a field with glob patterns, e.g. /ngts/prodstore/*/MergePipe*NG0304-1115*CYCLE1706*.
+On a network file system with thousands of entries, listing these directories
+dominates the time of small queries.
+
+cached_glob() returns the same as glob.glob(), but keeps the listing of every
+directory it has seen in CACHE_DIR/listings/listings.json, shared by all
+processes. A directory is only listed again when its modification time has
+changed (i.e. entries were added, removed or renamed), and its modification
+time is checked at most once every LISTING_MAX_AGE seconds per process.
+'''
+
+#::: seconds for which a directory listing is used without checking the directory again
+LISTING_MAX_AGE = 10.
+
+#::: listings younger than this (seconds after the last change of the directory) are not trusted
+LISTING_SETTLE_TIME = 2.
+
+listings = None
+listings_checked = {}
+listings_changed = set()
+listings_lock = threading.Lock()
+
+
+
+def cached_glob(pattern):
+    '''glob.glob(pattern), using the cached directory listings'''
+
+    if (CACHE_DIR is None) or (not glob.has_magic(pattern)):
+        return glob.glob(pattern)
+
+    #::: the part of the pattern without wildcards is used as it is
+    parts = pattern.split(os.sep)
+    i = [ glob.has_magic(part) for part in parts ].index(True)
+    if '' in parts[i:]:
+        return glob.glob(pattern)
+    base = os.sep.join(parts[:i])
+    if (i > 0) and (base == ''): base = os.sep
+    paths = [ base ]
+
+    with listings_lock:
+        load_listings()
+        for part in parts[i:]:
+            if glob.has_magic(part):
+                paths = [ os.path.join(path, name) for path in paths for name in match_names(cached_listdir(path), part) ]
+            else:
+                paths = [ os.path.join(path, part) for path in paths if part in cached_listdir(path) ]
+        save_listings()
+
+    return paths
+
+
+
+def match_names(names, part):
+    '''the names matching one component of a glob pattern (hidden names only if asked for, as in glob)'''
+    if not part.startswith('.'):
+        names = [ name for name in names if not name.startswith('.') ]
+    return fnmatch.filter(names, part)
+
+
+
+def cached_listdir(dirname):
+    '''os.listdir(dirname) from the cached listings, listed again only if the directory has changed; [] if it is not a directory'''
+
+    key = os.path.abspath(dirname or os.curdir)
+    now = time.time()
+
+    if (key in listings) and (now - listings_checked.get(key, -np.inf) < LISTING_MAX_AGE):
+        return listings[key][2]
+    listings_checked[key] = now
+
+    try:
+        st = os.stat(key)
+    except OSError:
+        return []
+    if not stat.S_ISDIR(st.st_mode):
+        return []
+
+    #::: [mtime, time of listing, names]
+    if (key in listings) and (listings[key][0] == st.st_mtime) and (listings[key][1] - st.st_mtime > LISTING_SETTLE_TIME):
+        return listings[key][2]
+
+    try:
+        names = os.listdir(key)
+    except OSError:
+        return []
+    listings[key] = [st.st_mtime, now, names]
+    listings_changed.add(key)
+
+    return names
+
+
+
+def listings_fname():
+    return os.path.join( CACHE_DIR, 'listings', 'listings.json' )
+
+
+
+def read_listings():
+    '''the listings saved in the cache directory'''
+    try:
+        with open(listings_fname(), 'r') as f:
+            data = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    return dict( (native_str(key), [value[0], value[1], [ native_str(name) for name in value[2] ]])
+                 for key, value in data.items() )
+
+
+
+def load_listings():
+    '''read the saved listings once per process'''
+    global listings
+    if listings is None:
+        listings = read_listings()
+
+
+
+def save_listings():
+    '''save the listings that have changed (merged with those saved by other processes in the meantime, atomically)'''
+
+    if len(listings_changed) == 0:
+        return
+
+    data = read_listings()
+    for key in listings_changed:
+        if (key not in data) or (data[key][1] < listings[key][1]):
+            data[key] = listings[key]
+    listings_changed.clear()
+
+    outfname = listings_fname()
+    try:
+        if not os.path.exists(os.path.dirname(outfname)): os.makedirs(os.path.dirname(outfname))
+        fd, tmpfname = tempfile.mkstemp(dir=os.path.dirname(outfname), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(tmpfname, outfname)
+    except (IOError, OSError, ValueError):
+        pass
+
+
+
+def native_str(s):
+    '''json gives unicode on Python 2; file names are kept as str'''
+    if isinstance(s, str):
+        return s
+    return s.encode('utf-8')
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 12:20:31 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import copy, threading
+import ngtsio_get
+
+
+
+
+###############################################################################
+# Field session (keeps files open across get() calls)
+###############################################################################
+class Field(object):
+    '''
+    A session for one NGTS field and version.
+
+    The file names are resolved once, the fitsio handles are kept open, and the
+    OBJ_ID column, the IMAGELIST columns and the HDU directories are read only once.
+    Use it when calling get() many times on the same field, e.g.
+
+        with ngtsio.Field('NG0304-1115', 'CYCLE1706') as field:
+            for obj_id in obj_ids:
+                dic = field.get(['HJD','SYSREM_FLUX3'], obj_id=obj_id)
+
+    Parameters
+    ----------
+    fieldname, ngts_version, fnames, root, roots, silent :
+        see ngtsio_get.get
+    '''
+
+    def __init__(self, fieldname, ngts_version, fnames=None, root=None, roots=None, silent=True):
+
+        self.fieldname = fieldname
+        self.ngts_version = ngts_version
+
+        if (roots is None) and (fnames is None):
+            roots = ngtsio_get.standard_roots(fieldname, ngts_version, root, silent)
+
+        if fnames is None:
+            fnames = ngtsio_get.standard_fnames(fieldname, ngts_version, roots, silent)
+
+        self.fnames = fnames
+        self.handles = {}
+        self.cache = {}
+        self.lock = threading.RLock()
+
+
+
+    def get(self, keys, obj_id=None, obj_row=None,
+            time_index=None, time_date=None, time_hjd=None, time_actionid=None,
+            bls_rank=1, indexing='fits', fitsreader='fitsio', simplify=True,
+            silent=True, set_nan=False, flag_mask=None, preserve_dtype=False, lazy_decode=False, lazy=False):
+        '''get data for this field with ngtsio_get.py; see ngtsio_get.py for docstring'''
+
+        if self.fnames is None:
+            return None
+
+        if isinstance(keys, str): keys = [keys]
+
+        #::: get() appends to keys and fnames, so hand over copies
+        with self.lock, ngtsio_get.use_session(self.handles, self.cache):
+            return ngtsio_get.get(self.fieldname, self.ngts_version, list(keys), obj_id=obj_id, obj_row=obj_row,
+                    time_index=time_index, time_date=time_date, time_hjd=time_hjd, time_actionid=time_actionid,
+                    bls_rank=bls_rank, indexing=indexing, fitsreader=fitsreader, simplify=simplify,
+                    fnames=copy.copy(self.fnames), silent=silent, set_nan=set_nan, flag_mask=flag_mask, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode, lazy=lazy)
+
+
+
+    def iter_objects(self, keys, chunk_size=1000,
+                     time_index=None, time_date=None, time_hjd=None, time_actionid=None,
+                     bls_rank=1, fitsreader='fitsio', silent=True, set_nan=False, flag_mask=None, preserve_dtype=False, lazy_decode=False):
+        '''
+        iterate over all objects of this field in blocks of (at most) chunk_size consecutive rows;
+        yields one dictionary per block (never simplified), see iter_objects
+        '''
+
+        N_obj = self.get_nobjs()
+
+        for row_start in range(0, N_obj, chunk_size):
+            yield self.get(keys, obj_row=range(row_start, min(row_start+chunk_size, N_obj)),
+                           time_index=time_index, time_date=time_date, time_hjd=time_hjd, time_actionid=time_actionid,
+                           bls_rank=bls_rank, indexing='python', fitsreader=fitsreader, simplify=False,
+                           silent=silent, set_nan=set_nan, flag_mask=flag_mask, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode)
+
+
+
+    def get_nobjs(self):
+        '''number of objects (rows of the CATALOGUE) of this field'''
+        if self.fnames is None:
+            return 0
+        if 'BLSPipe_megafile' in self.fnames:
+            fname = self.fnames['BLSPipe_megafile']
+        else:
+            fname = self.fnames['CATALOGUE']
+        with self.lock, ngtsio_get.use_session(self.handles, self.cache):
+            with ngtsio_get.fitsio_open(fname) as hdulist:
+                return int( hdulist['CATALOGUE'].get_nrows() )
+
+
+
+    def close(self):
+        '''close all open file handles and forget all cached columns'''
+        with self.lock:
+            for hdulist in self.handles.values():
+                hdulist.close()
+            self.handles = {}
+            self.cache = {}
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
+
+
+
+
+###############################################################################
+# Iterate over all objects of a field in chunks
+###############################################################################
+def iter_objects(fieldname, ngts_version, keys, chunk_size=1000,
+                 time_index=None, time_date=None, time_hjd=None, time_actionid=None,
+                 bls_rank=1, fitsreader='fitsio', fnames=None, root=None, roots=None,
+                 silent=True, set_nan=False, flag_mask=None, preserve_dtype=False, lazy_decode=False):
+    '''
+    Iterate over all objects of a field in blocks of (at most) chunk_size consecutive rows.
+
+    Only one block is held in memory at a time (about chunk_size * N_time * 8 bytes
+    per requested image key), and set_nan is applied per block, e.g.
+
+        for dic in ngtsio.iter_objects('NG0304-1115', 'CYCLE1706', ['SYSREM_FLUX3','FLAGS'], chunk_size=500):
+            rms = np.nanstd(dic['SYSREM_FLUX3'], axis=1)
+
+    The dictionaries are never simplified, i.e. image keys always have the shape
+    (N_obj_chunk, N_time). All other parameters are as in ngtsio_get.get.
+    '''
+
+    with Field(fieldname, ngts_version, fnames=fnames, root=root, roots=roots, silent=silent) as field:
+        for dic in field.iter_objects(keys, chunk_size=chunk_size,
+                                      time_index=time_index, time_date=time_date, time_hjd=time_hjd, time_actionid=time_actionid,
+                                      bls_rank=bls_rank, fitsreader=fitsreader, silent=silent, set_nan=set_nan, flag_mask=flag_mask, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode):
+            yield dic
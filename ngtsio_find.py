@@ -14,8 +14,9 @@ Email: mg719@cam.ac.uk
 import numpy as np
 from astropy import units as u
 from astropy.coordinates import SkyCoord
-import glob, socket
+import socket
 import ngtsio_get
+import ngtsio_cache
 
 
 def find(RA, DEC, ngts_version='all', unit='hmsdms', frame='icrs', 
@@ -43,6 +44,7 @@ def find(RA, DEC, ngts_version='all', unit='hmsdms', frame='icrs',
         0.0014 degree = 4.97 arcsec = 1 NGTS pixel
     field_radius : float
         1.92 degree, from center to the corner for square 7.4 sq deg FoV
+        (angular distance from the field center)
     ''' 
     
     #list of NGTS fields, lying in the same directory
@@ -56,34 +58,14 @@ def find(RA, DEC, ngts_version='all', unit='hmsdms', frame='icrs',
     #convert RA and DEC from string into skycoords
     RA_input  = str(RA)
     DEC_input = str(DEC)
-    if unit=='hmsdms':
-        c   = SkyCoord(RA+' '+DEC, frame=frame, unit=(u.hourangle, u.deg))
-        RA  = c.ra.deg
-        DEC = c.dec.deg
-    elif unit=='deg':
-        pass
-    elif unit=='rad':
-        RA  = RA*180./np.pi
-        DEC = DEC*180./np.pi
-    
+    RA, DEC = to_degree(RA, DEC, unit, frame)
     
     
-    #read list of observed NGTS fields from opis (needs to be manually updated)
-    fieldnames = []
-    ngts_versions = []
     
-    #::: on Cambridge servers
-    if 'ra.phy.cam.ac.uk' in socket.gethostname():
-        dirs = glob.glob('/appch/data/mg719/ngts_pipeline_output/prodstore/*/MergePipe*')
-        
-    #::: on ngtshead (LINUX)
-    elif 'ngts' in socket.gethostname():
-        dirs = glob.glob('/ngts/prodstore/*/MergePipe*')
-        
-    for dir1 in dirs:
-        f, n = [dir1.split('/')[-1].replace('_','.').split('.')[i] for i in (4,-1)]
-        fieldnames.append(f)
-        ngts_versions.append(n)
+    #read list of observed NGTS fields from the prodstore
+    fields        = get_field_index(prodstore_dirs())
+    fieldnames    = fields['FIELDNAME']
+    ngts_versions = fields['NGTS_VERSION']
         
 #    d = np.genfromtxt(fname_fieldlist, usecols=[0,3], dtype=None)
 #    fieldnames    = d[:,0]
@@ -91,22 +73,8 @@ def find(RA, DEC, ngts_version='all', unit='hmsdms', frame='icrs',
     
     
     
-    #fc = field_center
-    RA_DEC_fc = [ x[2:4]+' '+x[4:6]+' 00' + ' ' + x[6:9]+' '+x[9:11]+' 00' for x in fieldnames ] 
-    c_fc      = [ SkyCoord(x, frame='icrs', unit=(u.hourangle, u.deg)) for x in RA_DEC_fc ] 
-    RA_fc     = np.array([ x.ra.deg for x in c_fc ])
-    DEC_fc    = np.array([ x.dec.deg for x in c_fc ])
-    
-    
-    
     #indices where the searched RA / DEC may be covered in an NGTS field (upper limit)
-    if ngts_version == 'all':
-        ind_field = np.where( (np.abs(RA_fc - RA) < field_radius) 
-                      & (np.abs(DEC_fc - DEC) < field_radius) )[0]
-    else:
-        ind_field = np.where( (np.abs(RA_fc - RA) < field_radius) 
-                      & (np.abs(DEC_fc - DEC) < field_radius) 
-                      & (ngts_versions == ngts_version) )[0]
+    ind_field = find_fields(fields, RA, DEC, field_radius, ngts_version)
     
     
 
@@ -115,18 +83,12 @@ def find(RA, DEC, ngts_version='all', unit='hmsdms', frame='icrs',
         obj_id = ['None']*len(fieldnames)
         for i in ind_field:
             
-            dic = ngtsio_get.get(fieldnames[i][0:11], ngts_versions[i], ['RA','DEC'], silent=True) 
+            #objects within search_radius, closest first
+            matches = search_field(fieldnames[i][0:11], ngts_versions[i], RA, DEC, search_radius)
             
-            if dic is not None:  
-                #RA and DEC come out in degree
-                RA_objs = dic['RA']
-                DEC_objs = dic['DEC']
-                
-                ind_obj = np.where( (np.abs(RA_objs - RA) < search_radius) 
-                                  & (np.abs(DEC_objs - DEC) < search_radius) )[0]
-                                 
-                if len(ind_obj) > 0:
-                    obj_id[i] = dic['OBJ_ID'][ind_obj]
+            if matches is not None:  
+                if len(matches[0]) > 0:
+                    obj_id[i] = matches[0]
             
             else:
                 obj_id[i] = 'fits_not_available'
@@ -160,6 +122,319 @@ def find(RA, DEC, ngts_version='all', unit='hmsdms', frame='icrs',
     else:
         printer(None)
         
+
+
+
+
+def find_list(RAs, DECs, ngts_version='all', unit='hmsdms', frame='icrs', 
+              give_obj_id=True, search_radius=0.0014, field_radius=2.,
+              outfname=None):
+    
+    '''
+    find the obj_ids of many given RAs and Decs at once; prints (and writes) the same
+    lines as calling find() for each of them, in the same order
+    
+    All coordinates are converted in one go and grouped by field, so that the
+    sky index of every field is loaded at most once, and all targets in a
+    field are matched together.
+    
+    Parameters
+    ----------
+    RAs, DECs : arrays
+        as RA and DEC in find()
+    others :
+        see find()
+    '''
+    
+    RA_inputs  = [ str(x) for x in np.atleast_1d(RAs) ]
+    DEC_inputs = [ str(x) for x in np.atleast_1d(DECs) ]
+    RA, DEC = to_degree(np.atleast_1d(RAs), np.atleast_1d(DECs), unit, frame)
+    RA  = np.atleast_1d(RA).astype(float)
+    DEC = np.atleast_1d(DEC).astype(float)
+    xyz = unit_vectors(RA, DEC)
+    
+    fields = get_field_index(prodstore_dirs())
+    
+    
+    #matches[i] is the list of (field index, obj_id string) of target i
+    matches = [ [] for _ in range(len(RA)) ]
+    for j in range(len(fields['FIELDNAME'])):
+        if (ngts_version != 'all') and (fields['NGTS_VERSION'][j] != ngts_version):
+            continue
+        
+        #targets that may be covered by this field (as in find_fields)
+        ind_targets = np.where( np.dot(xyz, fields['XYZ'][j]) > np.cos( np.deg2rad(field_radius) ) )[0]
+        if len(ind_targets) == 0:
+            continue
+        
+        if (give_obj_id is True):
+            index = get_field_sky_index(fields['FIELDNAME'][j][0:11], fields['NGTS_VERSION'][j])
+            if index is not None:
+                obj_id_strs = [ '\t'.join(list(obj_ids)) if len(obj_ids) > 0 else 'None' 
+                                for obj_ids, _ in search_index_many(index, RA[ind_targets], DEC[ind_targets], search_radius) ]
+            else:
+                obj_id_strs = ['fits_not_available']*len(ind_targets)
+        else:
+            obj_id_strs = ['']*len(ind_targets)
+            
+        for i, obj_id_str in zip(ind_targets, obj_id_strs):
+            matches[i].append( (j, obj_id_str) )
+            
+            
+    #output
+    lines = []
+    for i in range(len(RA)):
+        if len(matches[i]) == 0:
+            lines.append( RA_inputs[i] +'\t'+ DEC_inputs[i] +'\t'+ 'no match' )
+        for j, obj_id_str in matches[i]:
+            lines.append( RA_inputs[i] +'\t'+ DEC_inputs[i] +'\t'+ fields['FIELDNAME'][j][0:11] +'\t'+ fields['NGTS_VERSION'][j] +'\t'+ obj_id_str )
+    
+    for line in lines:
+        print(line)
+    if outfname is not None:            
+        with open(outfname, 'a') as outfile:
+            for line in lines:
+                outfile.write(line+'\n')
+        
+
+
+###############################################################################
+# Field footprints
+###############################################################################
+'''
+The field centres are parsed from the field names (e.g. NG0304-1115 is centred
+on RA 03h04m, Dec -11d15m) once per prodstore listing, and kept as unit
+vectors; a field may cover a position if the angular distance to its centre
+is smaller than field_radius (from the centre to the corners of the FoV).
+'''
+
+#::: field index per prodstore listing (tuple of MergePipe directories)
+field_indices = {}
+
+
+
+def get_field_index(dirs):
+    '''
+    the fields of the given MergePipe directories; returns a dictionary with the arrays
+    FIELDNAME, NGTS_VERSION, RA and DEC (of the field centres, in degree) and XYZ (unit vectors, N_fields x 3)
+    '''
+    
+    dirs = tuple(dirs)
+    
+    if dirs not in field_indices:
+        fieldnames = []
+        ngts_versions = []
+        for dir1 in dirs:
+            f, n = [dir1.split('/')[-1].replace('_','.').split('.')[i] for i in (4,-1)]
+            fieldnames.append(f)
+            ngts_versions.append(n)
+        
+        RA_DEC_fc = np.array([ field_center(x) for x in fieldnames ]).reshape((-1,2))
+        
+        fields = {}
+        fields['FIELDNAME']    = np.array(fieldnames)
+        fields['NGTS_VERSION'] = np.array(ngts_versions)
+        fields['RA']           = RA_DEC_fc[:,0]
+        fields['DEC']          = RA_DEC_fc[:,1]
+        fields['XYZ']          = unit_vectors(fields['RA'], fields['DEC'])
+        field_indices[dirs] = fields
+        
+    return field_indices[dirs]
+
+
+
+def find_fields(fields, RA, DEC, field_radius, ngts_version='all'):
+    '''indices of the fields whose centre lies within field_radius (degree) of RA, DEC (degree)'''
+    cos_sep = np.dot( fields['XYZ'], unit_vectors(RA, DEC)[0] )
+    match = cos_sep > np.cos( np.deg2rad(field_radius) )
+    if ngts_version != 'all':
+        match &= (fields['NGTS_VERSION'] == ngts_version)
+    return np.where(match)[0]
+
+
+
+def field_center(fieldname):
+    '''RA and Dec of the field centre in degree, from a field name like NG0304-1115 (nan if it cannot be parsed)'''
+    try:
+        RA = ( int(fieldname[2:4]) + int(fieldname[4:6])/60. ) * 15.
+        DEC = int(fieldname[7:9]) + int(fieldname[9:11])/60.
+    except ValueError:
+        return np.nan, np.nan
+    if fieldname[6] == '-': 
+        DEC = -DEC
+    return RA, DEC
+
+
+
+def unit_vectors(RA, DEC):
+    '''unit vectors (N x 3) of RA and Dec in degree'''
+    RA  = np.deg2rad( np.atleast_1d(RA).astype(float) )
+    DEC = np.deg2rad( np.atleast_1d(DEC).astype(float) )
+    return np.column_stack(( np.cos(DEC)*np.cos(RA), np.cos(DEC)*np.sin(RA), np.sin(DEC) ))
+        
+
+
+
+
+###############################################################################
+# Cone search
+###############################################################################
+'''
+The sky positions of all objects of a field are kept in the local cache
+(ngtsio_cache.get_sky_index, one file per CATALOGUE, i.e. per field and
+version), sorted by Dec; a cone search reads only the objects in the Dec band
+of the cone from the memory-mapped index of each field that may cover it.
+The index of a field is built on its first search, and the FITS catalogues
+are not touched again until they change.
+'''
+
+def cone_search(RA, DEC, search_radius=0.0014, ngts_version='all', unit='deg', frame='icrs', field_radius=2.):
+    '''
+    find all objects within search_radius of a given RA and Dec, in all fields
+    
+    Parameters
+    ----------
+    RA, DEC, unit, frame, ngts_version, field_radius : 
+        see find(); here unit is 'deg' by default
+    search_radius : float
+        degree
+        
+    Returns
+    -------
+    list of (fieldname, ngts_version, obj_id, separation in degree), closest first
+    '''
+    
+    RA, DEC = to_degree(RA, DEC, unit, frame)
+    
+    fields = get_field_index(prodstore_dirs())
+    
+    results = []
+    for i in find_fields(fields, RA, DEC, field_radius+search_radius, ngts_version):
+        fieldname = fields['FIELDNAME'][i][0:11]
+        matches = search_field(fieldname, fields['NGTS_VERSION'][i], RA, DEC, search_radius)
+        if matches is not None:
+            results += [ (fieldname, fields['NGTS_VERSION'][i], obj_id, sep) for obj_id, sep in zip(*matches) ]
+            
+    return sorted(results, key=lambda x: x[3])
+
+
+
+def search_field(fieldname, ngts_version, RA, DEC, search_radius):
+    '''
+    the obj_ids and separations (degree, closest first) of all objects within search_radius of RA, DEC (degree)
+    in one field, or None if its files are not available
+    '''
+    
+    index = get_field_sky_index(fieldname, ngts_version)
+    if index is None:
+        return None
+    
+    return search_index(index, RA, DEC, search_radius)
+
+
+
+def get_field_sky_index(fieldname, ngts_version):
+    '''the sky index of one field (see ngtsio_cache.get_sky_index), or None if its files are not available'''
+    
+    roots = ngtsio_get.standard_roots(fieldname, ngts_version, None, True)
+    fnames = ngtsio_get.standard_fnames(fieldname, ngts_version, roots, True)
+    if (fnames is None) or (fnames['CATALOGUE'] is None):
+        return None
+    
+    def read_catalogue():
+        dic = ngtsio_get.get(fieldname, ngts_version, ['RA','DEC'], fnames=dict(fnames), silent=True)
+        return dic['OBJ_ID'], dic['RA'], dic['DEC']
+        
+    return ngtsio_cache.get_sky_index(fnames['CATALOGUE'], read_catalogue)
+
+
+
+def search_index(index, RA, DEC, search_radius):
+    '''the obj_ids and separations (degree, closest first) of all objects of a sky index within search_radius of RA, DEC (degree)'''
+    
+    #::: only the Dec band of the cone is read
+    start, stop = np.searchsorted(index['DEC'], [DEC-search_radius, DEC+search_radius])
+    rows = index[start:stop]
+    
+    sep = separations(rows, unit_vectors(RA, DEC)[0])
+    
+    ind = np.where(sep < search_radius)[0]
+    ind = ind[ np.argsort(sep[ind], kind='mergesort') ]
+    
+    return np.array(rows['OBJ_ID'][ind]), sep[ind]
+
+
+
+def search_index_many(index, RA, DEC, search_radius, chunksize=1000):
+    '''
+    search_index() for many positions at once (arrays of RA, DEC in degree); returns a list of (obj_ids, separations),
+    one per position; all (position, object) pairs within the Dec bands are compared in one go, chunksize positions at a time
+    '''
+    
+    results = []
+    
+    for i in range(0, len(RA), chunksize):
+        RA_chunk, DEC_chunk = RA[i:i+chunksize], DEC[i:i+chunksize]
+        
+        #::: all (position, row) pairs within the Dec bands
+        starts = np.searchsorted(index['DEC'], DEC_chunk-search_radius)
+        counts = np.searchsorted(index['DEC'], DEC_chunk+search_radius) - starts
+        ind_pos = np.repeat( np.arange(len(RA_chunk)), counts )
+        rows = np.arange(counts.sum()) + np.repeat( starts - np.cumsum(counts) + counts, counts )
+        
+        sep = separations(index[rows], unit_vectors(RA_chunk, DEC_chunk)[ind_pos])
+        
+        #::: group by position, closest first
+        ind = np.where(sep < search_radius)[0]
+        ind = ind[ np.lexsort((sep[ind], ind_pos[ind])) ]
+        bounds = np.searchsorted(ind_pos[ind], np.arange(len(RA_chunk)+1))
+        obj_ids = np.array(index['OBJ_ID'][rows[ind]])
+        results += [ (obj_ids[a:b], sep[ind][a:b]) for a, b in zip(bounds[:-1], bounds[1:]) ]
+        
+    return results
+
+
+
+def separations(rows, xyz):
+    '''angular distance (degree) of the rows of a sky index to the unit vector(s) xyz, from the chord length (accurate for small separations)'''
+    xyz = np.asarray(xyz).T
+    chord = np.sqrt( (rows['X']-xyz[0])**2 + (rows['Y']-xyz[1])**2 + (rows['Z']-xyz[2])**2 )
+    return np.rad2deg( 2.*np.arcsin( np.clip(chord/2., 0., 1.) ) )
+
+
+
+def to_degree(RA, DEC, unit='hmsdms', frame='icrs'):
+    '''convert RA and DEC (strings in h m s and d m s, degree or radian; single values or arrays) into degree'''
+    if unit=='hmsdms':
+        if np.ndim(RA) == 0:
+            c = SkyCoord(RA+' '+DEC, frame=frame, unit=(u.hourangle, u.deg))
+        else:
+            c = SkyCoord([ str(x)+' '+str(y) for x, y in zip(RA, DEC) ], frame=frame, unit=(u.hourangle, u.deg))
+        RA  = c.ra.deg
+        DEC = c.dec.deg
+    elif unit=='deg':
+        pass
+    elif unit=='rad':
+        RA  = np.asarray(RA)*180./np.pi
+        DEC = np.asarray(DEC)*180./np.pi
+    return RA, DEC
+
+
+
+def prodstore_dirs():
+    '''all MergePipe directories in the prodstore (one per field and version)'''
+    
+    #::: on Cambridge servers
+    if 'ra.phy.cam.ac.uk' in socket.gethostname():
+        return ngtsio_cache.cached_glob('/appch/data/mg719/ngts_pipeline_output/prodstore/*/MergePipe*')
+        
+    #::: on ngtshead (LINUX)
+    elif 'ngts' in socket.gethostname():
+        return ngtsio_cache.cached_glob('/ngts/prodstore/*/MergePipe*')
+    
+    else:
+        return []
+        
             
     
 if __name__ == '__main__':
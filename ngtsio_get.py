@@ -14,8 +14,15 @@ Email: mg719@cam.ac.uk
 import warnings
 import astropy.io.fits as pyfits
 import fitsio
-import os, sys, glob, socket, collections, datetime
+import os, sys, socket, collections, datetime, threading, contextlib, functools
+import multiprocessing.pool
 import numpy as np
+import ngtsio_mmap
+import ngtsio_cache
+import ngtsio_lazy
+import ngtsio_store
+import ngtsio_stage
+import ngtsio_results
 
 
 
@@ -29,11 +36,120 @@ warnings.formatwarning = warning_on_one_line
 
     
 
+###############################################################################
+# Open file handles and cached columns
+###############################################################################
+'''
+By default every fits file is opened and closed within each get() call.
+Within a session (see ngtsio_field.Field), file handles are kept open and
+frequently needed columns (OBJ_IDs, IMAGELIST columns, ...) are read only once.
+'''
+session = threading.local()
+
+
+@contextlib.contextmanager
+def use_session(handles, cache):
+    '''keep fitsio handles and cached columns in the given dicts while inside this context (per thread)'''
+    previous = getattr(session, 'handles', None), getattr(session, 'cache', None)
+    session.handles, session.cache = handles, cache
+    try:
+        yield
+    finally:
+        session.handles, session.cache = previous
+
+
+
+def fitsio_open(fname):
+    '''open a fits file with fitsio (or from its converted store, see ngtsio_store), or reuse the open handle of the current session'''
+    handles = getattr(session, 'handles', None)
+    if handles is None:
+        return open_fits(fname)
+    if fname not in handles:
+        handles[fname] = open_fits(fname)
+    return keep_open(handles[fname])
+
+
+
+def open_fits(fname):
+    store = ngtsio_store.open_source(fname)
+    if store is not None:
+        return store
+    return ngtsio_stage.open_local(fname, lambda f: fitsio.FITS(f, vstorage='object'))
+
+
+
+def pyfits_open(fname):
+    '''open a fits file with astropy (from its local copy, if staging is on, see ngtsio_stage)'''
+    return ngtsio_stage.open_local(fname, lambda f: pyfits.open(f, mode='denywrite'))
+
+
+
+@contextlib.contextmanager
+def keep_open(hdulist):
+    yield hdulist
+
+
+
+def session_cached(cachekey, read):
+    '''return read(), but only call it once per session'''
+    cache = getattr(session, 'cache', None)
+    if cache is None:
+        return read()
+    if cachekey not in cache:
+        cache[cachekey] = read()
+    return cache[cachekey]
+
+
+
+def fitsio_read_column(hdulist, fname, hdukey, column, rows=None):
+    '''read (rows of) a table column; within a session the full column is read once and cached'''
+    if getattr(session, 'cache', None) is None:
+        return hdulist[hdukey].read(columns=column, rows=rows)
+    data = session_cached( (fname,hdukey,column), lambda: hdulist[hdukey].read(columns=column) )
+    if rows is None:
+        return data.copy()
+    else:
+        return data[rows]
+
+
+
+def fitsio_read_columns(hdulist, fname, hdukey, columns, rows=None):
+    '''read (rows of) several table columns, see fitsio_read_column'''
+    if getattr(session, 'cache', None) is None:
+        return hdulist[hdukey].read(columns=columns, rows=rows)
+    return dict( (column, fitsio_read_column(hdulist, fname, hdukey, column, rows=rows)) for column in np.atleast_1d(columns) )
+
+
+
+###############################################################################
+# Profiling hook
+###############################################################################
+'''
+If a profiler is set, get() reports its stages (finding the files, object and
+time indices, reading and rescaling each key, set_nan, ...) to profiler.stage(name);
+see benchmark_ngtsio.MemoryProfiler.
+'''
+profiler = None
+
+
+def stage(name):
+    '''context of one stage of get(), for the profiler (if any)'''
+    if profiler is None:
+        return no_stage()
+    return profiler.stage(name)
+
+
+@contextlib.contextmanager
+def no_stage():
+    yield
+
+
+
 ###############################################################################
 # Getter (Main Program)
 ###############################################################################
 
-def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, time_index=None, time_date=None, time_hjd=None, time_actionid=None, bls_rank=1, indexing='fits', fitsreader='fitsio', simplify=True, fnames=None, root=None, roots=None, silent=False, set_nan=False):
+def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, time_index=None, time_date=None, time_hjd=None, time_actionid=None, bls_rank=1, indexing='fits', fitsreader='fitsio', simplify=True, fnames=None, root=None, roots=None, silent=False, set_nan=False, flag_mask=None, preserve_dtype=False, lazy_decode=False, lazy=False):
 
     """
     Convenient wrapper for astropy and cfitsio readers for various NGTS data files.
@@ -71,6 +187,9 @@ def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, time_index=Non
     fitsreader : str
         'pyfits' or 'astropy': use the astropy.io.fits module. 
         'fitsio' or 'cfitsio': use the fitsio module (standard) 
+        'mmap': memory-map uncompressed image HDUs (FLUX3, SYSREM_FLUX3, CCDX, ...) via numpy.memmap and read tables with fitsio.
+            Contiguous selections are returned as read-only views into the files (with the big-endian on-disk dtype), 
+            repeated look-ups are served from the page cache.
         fitsio seems to perform best, see below for performance tests.
      
     simplify : bool  
@@ -110,6 +229,24 @@ def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, time_index=Non
     set_nan : bool
         Whether all flagged values in CCDX/Y, CENDTX/Y and FLUX should be replaced with NAN or not (if not, they might be zeros or any reasonable/unreasonable real numbers).
 
+    flag_mask : int
+        Bitmask of the FLAGS bits that count as flagged for set_nan, e.g. flag_mask=1|4. Default (None): any FLAGS > 0.
+
+    preserve_dtype : bool
+        Keep the data types of the files (e.g. float32 fluxes, integer FLAGS) instead of converting image keys to float64,
+        and decode CCDX/Y and CENTDX/Y into float32. Halves the memory of these keys (see the preserve_dtype scenarios
+        of benchmark_ngtsio_memory_baseline.json for whole requests). Default: False.
+
+    lazy_decode : bool
+        Return CCDX/Y and CENTDX/Y as ngtsio_lazy.FixedPointArray, i.e. the raw integers which are only decoded
+        for the values that are accessed. np.asarray(dic['CCDX']), arithmetic (dic['CCDX'] - 1.) and numpy functions
+        decode everything and return plain arrays. Default: False.
+
+    lazy : bool
+        Return an ngtsio_lazy.LazyDict instead of a dictionary: the objects and times are resolved right away,
+        but each key is only read (and set_nan/simplify applied) on first access, and then kept. The files stay open
+        until dic.close() (or the end of a with block, with get(..., lazy=True) as dic). Default: False.
+
 
     Possible keys
     -------------
@@ -188,16 +325,25 @@ def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, time_index=Non
         print('Field name:', fieldname)
         print('NGTS version:', ngts_version)
 
-    if (roots is None) and (fnames is None):
-        roots = standard_roots(fieldname, ngts_version, root, silent)
-    
-    if fnames is None: 
-        fnames = standard_fnames(fieldname, ngts_version, roots, silent)
+    with stage('fnames'):
+        if (roots is None) and (fnames is None):
+            roots = standard_roots(fieldname, ngts_version, root, silent)
         
-    elif 'BLSPipe_megafile' in fnames:
-        fnames['nights'] = fnames['BLSPipe_megafile']
-        fnames['CATALOGUE'] = fnames['BLSPipe_megafile']
-        fnames['IMAGELIST'] = fnames['BLSPipe_megafile']
+        if fnames is None: 
+            fnames = standard_fnames(fieldname, ngts_version, roots, silent)
+            
+        elif 'BLSPipe_megafile' in fnames:
+            fnames['nights'] = fnames['BLSPipe_megafile']
+            fnames['CATALOGUE'] = fnames['BLSPipe_megafile']
+            fnames['IMAGELIST'] = fnames['BLSPipe_megafile']
+
+    #::: in-memory result cache (off by default, see ngtsio_results)
+    if (fnames is not None) and ngtsio_results.enabled() and not (lazy or lazy_decode):
+        selection = { 'obj_id':obj_id, 'obj_row':obj_row,
+                      'time_index':time_index, 'time_date':time_date, 'time_hjd':time_hjd, 'time_actionid':time_actionid,
+                      'bls_rank':bls_rank, 'indexing':indexing, 'fitsreader':fitsreader, 'simplify':simplify,
+                      'set_nan':set_nan, 'flag_mask':flag_mask, 'preserve_dtype':preserve_dtype }
+        return get_cached(fieldname, ngts_version, keys, fnames, silent, selection)
     
     if fnames is not None:
         keys_0 = 1*keys #copy list
@@ -211,54 +357,44 @@ def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, time_index=Non
         if set_nan and ('FLAGS' not in keys_0): 
             keys.append('FLAGS')
         
+        #::: tables (CATALOGUE, IMAGELIST) are read via fitsio in 'mmap' mode
+        tablereader = 'fitsio' if fitsreader == 'mmap' else fitsreader
+        
         #::: objects
-        ind_objs, obj_ids = get_obj_inds(fnames, obj_id, obj_row, indexing, fitsreader, obj_sortby = 'obj_ids')
+        with stage('obj_inds'):
+            ind_objs, obj_ids = get_obj_inds(fnames, obj_id, obj_row, indexing, tablereader, obj_sortby = 'obj_ids')
         if not silent: print('Object IDs (',len(obj_ids),'):', obj_ids)
         
         #::: only proceed if at least one of the requested objects exists
         if isinstance(ind_objs,slice) or len(ind_objs)>0:
             
             #::: time
-            ind_time = get_time_inds(fnames, time_index, time_date, time_hjd, time_actionid, fitsreader, silent)
-            
-            #::: get dictionary
-            dic, keys = get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time, fitsreader)
-            
-            #::: in pipeline only
-            if ('SYSREM_FLUX3' in keys) and (fnames is not None) and ('BLSPipe_megafile' in fnames):
-                dic['SYSREM_FLUX3'] = dic['FLUX']
-                if 'FLUX' not in keys_0:
-                    del dic['FLUX']
-                
-            #::: set flagged values and flux==0 values to nan
-            if set_nan:
-                dic = set_nan_dic(dic)
-            
-            #::: remove entries that were only needed for readout / computing things
-            if ('FLAGS' in dic.keys()) and ('FLAGS' not in keys_0): 
-                del dic['FLAGS']
-            #        if ('FLUX' in dic.keys()) and ('FLUX' not in keys_0): del dic['FLUX']
-            #        if ('FLUX3_ERR' in dic.keys()) and ('FLUX3_ERR' not in keys_0): del dic['FLUX3_ERR']
-            #        if ('SYSREM_FLUX3' in dic.keys()) and ('SYSREM_FLUX3' not in keys_0): del dic['SYSREM_FLUX3']
-            
-            #::: convert RA and DEC from radian into degree if <CYCLE1706 and not in pipeline
-            if ('BLSPipe_megafile' not in fnames) and (ngts_version in ('TEST10','TEST16','TEST16A','TEST18')):
-                if 'RA' in keys:
-                    dic['RA'] = dic['RA']*180./np.pi
-                if 'DEC' in keys:
-                    dic['DEC'] = dic['DEC']*180./np.pi
-    #        
-            #::: simplify output if only for 1 object
-            if simplify: 
-                dic = simplify_dic(dic)
-            
-            #::: add fieldname and ngts_version
-            dic['FIELDNAME'] = fieldname
-            dic['NGTS_VERSION'] = ngts_version
-            
-            #::: check if all keys were retrieved
-            check_dic(dic, keys_0, silent)
+            with stage('time_inds'):
+                ind_time = get_time_inds(fnames, time_index, time_date, time_hjd, time_actionid, tablereader, silent)
             
+            #::: lazy dictionary: every key is read on first access
+            if lazy:
+                memo = ngtsio_lazy.LazyMemo()
+                read = functools.partial(read_lazy_key, fnames=fnames, obj_ids=obj_ids, ind_objs=ind_objs, ind_time=ind_time,
+                                         ngts_version=ngts_version, bls_rank=bls_rank, fitsreader=fitsreader, simplify=simplify,
+                                         set_nan=set_nan, flag_mask=flag_mask, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode, memo=memo)
+                dic = ngtsio_lazy.LazyDict(read, keys_0, {'FIELDNAME':fieldname, 'NGTS_VERSION':ngts_version}, memo=memo)
+
+            else:
+                #::: get dictionary
+                with stage('get_data'):
+                    dic, keys = get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time, fitsreader, preserve_dtype, lazy_decode)
+
+                #::: pipeline renames, set_nan, unit conversions, simplify
+                dic = finish_dic(dic, keys, keys_0, fnames, ngts_version, simplify, set_nan, flag_mask)
+
+                #::: add fieldname and ngts_version
+                dic['FIELDNAME'] = fieldname
+                dic['NGTS_VERSION'] = ngts_version
+
+                #::: check if all keys were retrieved
+                check_dic(dic, keys_0, silent)
+
         else:
             dic = None
  
@@ -270,6 +406,128 @@ def get(fieldname, ngts_version, keys, obj_id=None, obj_row=None, time_index=Non
 
 
 
+###############################################################################
+# Post-processing and lazy reading
+###############################################################################
+def finish_dic(dic, keys, keys_0, fnames, ngts_version, simplify, set_nan, flag_mask):
+    '''everything after reading the files: pipeline renames, set_nan, removal of helper keys, unit conversions and simplify'''
+
+    #::: in pipeline only
+    if ('SYSREM_FLUX3' in keys) and (fnames is not None) and ('BLSPipe_megafile' in fnames):
+        dic['SYSREM_FLUX3'] = dic['FLUX']
+        if 'FLUX' not in keys_0:
+            del dic['FLUX']
+        
+    #::: set flagged values and flux==0 values to nan
+    if set_nan:
+        with stage('set_nan'):
+            dic = set_nan_dic(dic, flag_mask)
+    
+    #::: remove entries that were only needed for readout / computing things
+    if ('FLAGS' in dic.keys()) and ('FLAGS' not in keys_0): 
+        del dic['FLAGS']
+    #        if ('FLUX' in dic.keys()) and ('FLUX' not in keys_0): del dic['FLUX']
+    #        if ('FLUX3_ERR' in dic.keys()) and ('FLUX3_ERR' not in keys_0): del dic['FLUX3_ERR']
+    #        if ('SYSREM_FLUX3' in dic.keys()) and ('SYSREM_FLUX3' not in keys_0): del dic['SYSREM_FLUX3']
+    
+    #::: convert RA and DEC from radian into degree if <CYCLE1706 and not in pipeline
+    if ('BLSPipe_megafile' not in fnames) and (ngts_version in ('TEST10','TEST16','TEST16A','TEST18')):
+        if 'RA' in keys:
+            dic['RA'] = dic['RA']*180./np.pi
+        if 'DEC' in keys:
+            dic['DEC'] = dic['DEC']*180./np.pi
+    #        
+    #::: simplify output if only for 1 object
+    if simplify: 
+        with stage('simplify'):
+            dic = simplify_dic(dic)
+
+    return dic
+
+
+
+def read_lazy_key(key, fnames, obj_ids, ind_objs, ind_time, ngts_version, bls_rank, fitsreader, simplify,
+                  set_nan, flag_mask, preserve_dtype, lazy_decode, memo):
+    '''
+    read a single key of a lazy dictionary (get(..., lazy=True)) for the already resolved objects and times;
+    the files are kept open between the keys, and the FLAGS needed for set_nan are read only once (in memo)
+    '''
+
+    #::: share open files and cached columns between all keys of this dictionary (unless within a session already)
+    if getattr(session, 'handles', None) is None:
+        with use_session(memo.setdefault('handles', {}), memo.setdefault('cache', {})):
+            return read_lazy_key(key, fnames, obj_ids, ind_objs, ind_time, ngts_version, bls_rank, fitsreader, simplify,
+                                 set_nan, flag_mask, preserve_dtype, lazy_decode, memo)
+
+    keys = [key]
+    keys_0 = [key, 'OBJ_ID']
+
+    #::: in pipeline only
+    if (key == 'SYSREM_FLUX3') and ('BLSPipe_megafile' in fnames):
+        keys.append('FLUX')
+
+    dic, keys = get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time, fitsreader, preserve_dtype, lazy_decode)
+
+    #::: set_nan only concerns the NAN_KEYS
+    set_nan = set_nan and (key in NAN_KEYS)
+    if set_nan:
+        if 'FLAGS' not in memo:
+            memo['FLAGS'] = get_data(fnames, obj_ids, ind_objs, ['FLAGS'], bls_rank, ind_time, fitsreader, preserve_dtype, lazy_decode)[0]['FLAGS']
+        dic['FLAGS'] = memo['FLAGS']
+
+    dic = finish_dic(dic, keys, keys_0, fnames, ngts_version, simplify, set_nan, flag_mask)
+
+    if key not in dic:
+        raise KeyError('key '+str(key)+' could not be read.')
+    return dic[key]
+
+
+
+
+###############################################################################
+# In-memory result cache
+###############################################################################
+def get_cached(fieldname, ngts_version, keys, fnames, silent, selection):
+    '''
+    get() through the in-memory result cache (see ngtsio_results): every key is looked up
+    separately, and only the keys that are not cached yet are read (in one get() call)
+    '''
+    if isinstance(keys, str): keys = [keys]
+    keys_0 = []
+    for key in list(keys) + ['OBJ_ID']:
+        if key not in keys_0: keys_0.append(key)
+
+    request = ngtsio_results.freeze( (fieldname, ngts_version, fnames, ngtsio_results.file_state(fnames, selection), selection) )
+
+    dic = {}
+    missing = []
+    for key in keys_0:
+        value = ngtsio_results.lookup( (request, key) )
+        if value is ngtsio_results.MISSING:
+            missing.append(key)
+        else:
+            dic[key] = value
+
+    if len(missing) > 0:
+        with ngtsio_results.reading():
+            data = get(fieldname, ngts_version, list(missing), fnames=fnames, silent=silent, **selection)
+        #::: none of the requested objects exists
+        if data is None:
+            return None
+        for key in missing:
+            if key in data:
+                dic[key] = ngtsio_results.store( (request, key), data[key] )
+    else:
+        check_dic(dic, keys_0, silent)
+
+    dic['FIELDNAME'] = fieldname
+    dic['NGTS_VERSION'] = ngts_version
+
+    return dic
+
+
+
+
 ###############################################################################
 # Fielnames Formatting
 ###############################################################################
@@ -281,30 +539,30 @@ def standard_roots(fieldname, ngts_version, root, silent):
             #::: on laptop (OS X)
             if sys.platform == "darwin":
                 roots = {}
-                roots['nights'] = scalify(glob.glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/MergePipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['sysrem'] = scalify(glob.glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/SysremPipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['bls'] = scalify(glob.glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/BLSPipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['decorr'] = scalify(glob.glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/DecorrPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['nights'] = scalify(ngtsio_cache.cached_glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/MergePipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['sysrem'] = scalify(ngtsio_cache.cached_glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/SysremPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['bls'] = scalify(ngtsio_cache.cached_glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/BLSPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['decorr'] = scalify(ngtsio_cache.cached_glob('/Users/mx/Big_Data/BIG_DATA_NGTS/2017/prodstore/*/DecorrPipe*'+fieldname+'*'+ngts_version+'*'))
                 roots['dilution'] = None
                 roots['canvas'] = None
     
             #::: on Cambridge servers
             elif 'ra.phy.cam.ac.uk' in socket.gethostname():
                 roots = {}
-                roots['nights'] = scalify(glob.glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/MergePipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['sysrem'] = scalify(glob.glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/SysremPipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['bls'] = scalify(glob.glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/BLSPipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['decorr'] = scalify(glob.glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/DecorrPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['nights'] = scalify(ngtsio_cache.cached_glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/MergePipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['sysrem'] = scalify(ngtsio_cache.cached_glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/SysremPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['bls'] = scalify(ngtsio_cache.cached_glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/BLSPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['decorr'] = scalify(ngtsio_cache.cached_glob('/appcg/data2/NGTS/ngts_pipeline_output/prodstore/*/DecorrPipe*'+fieldname+'*'+ngts_version+'*'))
                 roots['dilution'] = None
                 roots['canvas'] = None
     
             #::: on ngtshead (LINUX)
             if 'ngts' in socket.gethostname():
                 roots = {}
-                roots['nights'] = scalify(glob.glob('/ngts/prodstore/*/MergePipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['sysrem'] = scalify(glob.glob('/ngts/prodstore/*/SysremPipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['bls'] = scalify(glob.glob('/ngts/prodstore/*/BLSPipe*'+fieldname+'*'+ngts_version+'*'))
-                roots['decorr'] = scalify(glob.glob('/ngts/prodstore/*/DecorrPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['nights'] = scalify(ngtsio_cache.cached_glob('/ngts/prodstore/*/MergePipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['sysrem'] = scalify(ngtsio_cache.cached_glob('/ngts/prodstore/*/SysremPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['bls'] = scalify(ngtsio_cache.cached_glob('/ngts/prodstore/*/BLSPipe*'+fieldname+'*'+ngts_version+'*'))
+                roots['decorr'] = scalify(ngtsio_cache.cached_glob('/ngts/prodstore/*/DecorrPipe*'+fieldname+'*'+ngts_version+'*'))
                 roots['dilution'] = None
                 roots['canvas'] = None
     
@@ -340,7 +598,7 @@ def standard_fnames(fieldname, ngts_version, roots, silent):
         #a list of all single files (e.g. FLAGS, FLUX3, FLUX3_ERR, CCDX etc.)
         try:
             f_nights = os.path.join( roots['nights'], '*'+fieldname+'*.fits' )
-            fnames['nights'] = glob.glob( f_nights ) 
+            fnames['nights'] = ngtsio_cache.cached_glob( f_nights ) 
         except:
             fnames['nights'] = None
 #            warnings.warn( str(fieldname)+': Fits files "nights" do not exist.' )
@@ -348,7 +606,7 @@ def standard_fnames(fieldname, ngts_version, roots, silent):
         #BLS
         try:
             f_bls = os.path.join( roots['bls'], '*'+fieldname+'*.fits' )
-            fnames['bls'] = glob.glob( f_bls )[-1]
+            fnames['bls'] = ngtsio_cache.cached_glob( f_bls )[-1]
         except:
             fnames['bls'] = None
 #            warnings.warn( str(fieldname)+': Fits files "bls" do not exist.' )
@@ -356,7 +614,7 @@ def standard_fnames(fieldname, ngts_version, roots, silent):
         #SYSREM
         try:
             f_sysrem = os.path.join( roots['sysrem'], '*'+fieldname+'*SYSREM_FLUX3*.fits' )
-            fnames['sysrem'] = glob.glob( f_sysrem )[-1]
+            fnames['sysrem'] = ngtsio_cache.cached_glob( f_sysrem )[-1]
         except:
             fnames['sysrem'] = None
 #            warnings.warn( str(fieldname)+': Fits files "sysrem" do not exist.' )
@@ -364,7 +622,7 @@ def standard_fnames(fieldname, ngts_version, roots, silent):
         #DECORR
         try:
             f_decorr = os.path.join( roots['decorr'], '*'+fieldname+'*DECORR_FLUX3*.fits' )
-            fnames['decorr'] = glob.glob( f_decorr )[-1]
+            fnames['decorr'] = ngtsio_cache.cached_glob( f_decorr )[-1]
         except:
             fnames['decorr'] = None
 #            warnings.warn( str(fieldname)+': Fits files "decorr" does not exist.' )
@@ -480,16 +738,9 @@ def get_obj_inds(fnames, obj_ids, obj_rows, indexing,fitsreader, obj_sortby = 'o
             #d2) the command 'bls' which reads out all 'bls' candidates
             elif obj_ids == 'bls':
                 if fnames['bls'] is not None:
-                    if fitsreader=='astropy' or fitsreader=='pyfits':
-                        with pyfits.open(fnames['bls'], mode='denywrite') as hdulist:
-                            obj_ids = np.unique( hdulist['CANDIDATES'].data['OBJ_ID'].strip() )
-                            del hdulist['CANDIDATES'].data
-
-                    elif fitsreader=='fitsio' or fitsreader=='cfitsio':
-                        with fitsio.FITS(fnames['bls'], vstorage='object') as hdulist_bls:
-                            obj_ids = np.unique( np.char.strip(hdulist_bls['CANDIDATES'].read(columns='OBJ_ID')) )
-
-                    else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
+                    cand_ids, _ = get_bls_candidates(fnames['bls'], fitsreader)
+                    obj_ids = np.unique( cand_ids )
+                    if obj_ids.dtype.kind in 'iu': obj_ids = ngtsio_cache.format_objids(obj_ids)
 
                 else:
                     warnings.warn('BLS files not found or could not be loaded.')
@@ -498,8 +749,8 @@ def get_obj_inds(fnames, obj_ids, obj_rows, indexing,fitsreader, obj_sortby = 'o
             #d3) the command 'canvas' which reads out all 'canvas' candidates
             elif obj_ids == 'canvas':
                 if fnames['canvas'] is not None:
-                    canvasdata = np.genfromtxt(fnames['canvas'], dtype=None, names=True)
-                    obj_ids = objid_6digit( canvasdata['OBJ_ID'].astype('|S6') )
+                    _, obj_ids = get_canvas_table(fnames['canvas'])
+                    obj_ids = obj_ids.copy()
                 else:
                     warnings.warn('CANVAS files not found or could not be loaded.')
                     obj_ids = ['canvas']
@@ -645,43 +896,57 @@ def get_obj_inds(fnames, obj_ids, obj_rows, indexing,fitsreader, obj_sortby = 'o
 
 def get_indobjs_from_objids(fnames, obj_list, fitsreader):
 
-    if fitsreader=='astropy' or fitsreader=='pyfits':
-        with pyfits.open(fnames['CATALOGUE'], mode='denywrite') as hdulist:
-            obj_ids_all = hdulist['CATALOGUE'].data['OBJ_ID'].strip()
-            del hdulist['CATALOGUE'].data
+    #::: look up the rows in the OBJ_ID index of the CATALOGUE (built on first use, see ngtsio_cache.py)
+    index = get_objid_index(fnames, fitsreader)
+    found = ngtsio_cache.lookup_objids(index, obj_list) if index is not None else None
 
-    elif fitsreader=='fitsio' or fitsreader=='cfitsio':
-        with fitsio.FITS(fnames['CATALOGUE'], vstorage='object') as hdulist:
-            obj_ids_all = np.char.strip( hdulist['CATALOGUE'].read(columns='OBJ_ID') )#indices of the candidates
+    if found is not None:
+        ind_objs, obj_ids = found
 
-    else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
+    else:
+        if fitsreader=='astropy' or fitsreader=='pyfits':
+            with pyfits_open(fnames['CATALOGUE']) as hdulist:
+                obj_ids_all = hdulist['CATALOGUE'].data['OBJ_ID'].strip()
+                del hdulist['CATALOGUE'].data
+
+        elif fitsreader=='fitsio' or fitsreader=='cfitsio':
+            with fitsio_open(fnames['CATALOGUE']) as hdulist:
+                obj_ids_all = session_cached( (fnames['CATALOGUE'],'CATALOGUE','OBJ_ID','strip'), lambda: np.char.strip( hdulist['CATALOGUE'].read(columns='OBJ_ID') ) )#indices of the candidates
+
+        else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
+
+        ind_objs = np.in1d(obj_ids_all, obj_list, assume_unique=True).nonzero()[0]
 
-    ind_objs = np.in1d(obj_ids_all, obj_list, assume_unique=True).nonzero()[0]
+        #::: truncate the list of obj_ids, remove obj_ids that are not in fits files
+        obj_ids = obj_ids_all[ind_objs]
+        del obj_ids_all
 
     #::: check if all obj_ids were read out
     for obj_id in obj_list:
-        if obj_id not in obj_ids_all[ind_objs]:
+        if obj_id not in obj_ids:
             warnings.warn('obj_id '+str(obj_id)+' not found in fits file.')
 
-    #::: truncate the list of obj_ids, remove obj_ids that are not in fits files
-    obj_ids = obj_ids_all[ind_objs]
-    del obj_ids_all
-
     return ind_objs, obj_ids
 
 
 
 def get_objids_from_indobjs(fnames, ind_objs, fitsreader):
 
-    if fitsreader=='astropy' or fitsreader=='pyfits':
-        with pyfits.open(fnames['CATALOGUE'], mode='denywrite') as hdulist:
+    #::: look up the OBJ_IDs in the OBJ_ID index of the CATALOGUE (built on first use, see ngtsio_cache.py)
+    index = get_objid_index(fnames, fitsreader)
+
+    if index is not None:
+        obj_ids = ngtsio_cache.lookup_rows(index, ind_objs)
+
+    elif fitsreader=='astropy' or fitsreader=='pyfits':
+        with pyfits_open(fnames['CATALOGUE']) as hdulist:
             obj_ids = hdulist['CATALOGUE'].data['OBJ_ID'][ind_objs].strip() #copy.deepcopy( hdulist['CATALOGUE'].data['OBJ_ID'][ind_objs].strip() )
             del hdulist['CATALOGUE'].data
 
     elif fitsreader=='fitsio' or fitsreader=='cfitsio':
-        with fitsio.FITS(fnames['CATALOGUE'], vstorage='object') as hdulist:
-            if isinstance(ind_objs, slice): obj_ids = np.char.strip( hdulist['CATALOGUE'].read(columns='OBJ_ID') ) #copy.deepcopy( hdulist['CATALOGUE'].data['OBJ_ID'][ind_objs].strip() )
-            else: obj_ids = np.char.strip( hdulist['CATALOGUE'].read(columns='OBJ_ID', rows=ind_objs) ) #copy.deepcopy( hdulist['CATALOGUE'].data['OBJ_ID'][ind_objs].strip() )
+        with fitsio_open(fnames['CATALOGUE']) as hdulist:
+            if isinstance(ind_objs, slice): obj_ids = np.char.strip( fitsio_read_column(hdulist, fnames['CATALOGUE'], 'CATALOGUE', 'OBJ_ID') ) #copy.deepcopy( hdulist['CATALOGUE'].data['OBJ_ID'][ind_objs].strip() )
+            else: obj_ids = np.char.strip( fitsio_read_column(hdulist, fnames['CATALOGUE'], 'CATALOGUE', 'OBJ_ID', rows=ind_objs) ) #copy.deepcopy( hdulist['CATALOGUE'].data['OBJ_ID'][ind_objs].strip() )
 
     else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
 
@@ -692,6 +957,118 @@ def get_objids_from_indobjs(fnames, ind_objs, fitsreader):
 
 
 
+def get_objid_index(fnames, fitsreader):
+    '''
+    the OBJ_ID -> row index of the CATALOGUE, kept as a sidecar file in the local cache directory;
+    returns None if the cache is disabled/not writable or the OBJ_IDs are not plain integers
+    '''
+
+    if ngtsio_cache.CACHE_DIR is None:
+        return None
+
+    def read_objids():
+        if fitsreader=='astropy' or fitsreader=='pyfits':
+            with pyfits_open(fnames['CATALOGUE']) as hdulist:
+                obj_ids_all = hdulist['CATALOGUE'].data['OBJ_ID'].strip()
+                del hdulist['CATALOGUE'].data
+        elif fitsreader=='fitsio' or fitsreader=='cfitsio':
+            with fitsio_open(fnames['CATALOGUE']) as hdulist:
+                obj_ids_all = session_cached( (fnames['CATALOGUE'],'CATALOGUE','OBJ_ID','strip'), lambda: np.char.strip( hdulist['CATALOGUE'].read(columns='OBJ_ID') ) )
+        else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
+        return obj_ids_all
+
+    return session_cached( (fnames['CATALOGUE'],'objid_index'), lambda: ngtsio_cache.get_objid_index(fnames['CATALOGUE'], read_objids) )
+
+
+
+def get_bls_candidates(fname, fitsreader):
+    '''
+    OBJ_IDs (stripped) and RANKs of all rows of the CANDIDATES of the BLS file, read once per session;
+    the OBJ_IDs are integers if they can be kept in the local cache directory (see ngtsio_cache)
+    '''
+
+    def read_candidates():
+        if fitsreader=='astropy' or fitsreader=='pyfits':
+            with pyfits_open(fname) as hdulist:
+                hdu = hdulist['CANDIDATES'].data
+                candidates = ( np.char.strip(np.asarray(hdu['OBJ_ID'])), np.array(hdu['RANK']) )
+                del hdu, hdulist['CANDIDATES'].data
+        elif fitsreader=='fitsio' or fitsreader=='cfitsio':
+            with fitsio_open(fname) as hdulist:
+                data = hdulist['CANDIDATES'].read(columns=['OBJ_ID','RANK'])
+                candidates = ( np.char.strip(data['OBJ_ID']), data['RANK'] )
+        else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
+        return candidates
+
+    if ngtsio_cache.CACHE_DIR is None:
+        return session_cached( (fname,'CANDIDATES','index'), read_candidates )
+    else:
+        return session_cached( (fname,'CANDIDATES','index'), lambda: ngtsio_cache.get_candidates_index(fname, read_candidates) )
+
+
+
+def match_bls_candidates(fname, fitsreader, obj_ids, bls_rank):
+    '''
+    join the requested obj_ids with the CANDIDATES rows of rank bls_rank (one sort + np.searchsorted);
+    returns i_objs and rows_bls, such that obj_ids[i_objs] are found in the CANDIDATES rows rows_bls
+    '''
+
+    cand_ids, cand_ranks = get_bls_candidates(fname, fitsreader)
+    rows_rank = np.where( cand_ranks == bls_rank )[0]
+    i_objs, i_rank = crossmatch_objids(cand_ids[rows_rank], obj_ids)
+
+    return i_objs, rows_rank[i_rank]
+
+
+
+def crossmatch_objids(table_ids, obj_ids):
+    '''
+    find the obj_ids in table_ids (one sort + np.searchsorted); returns i_objs and rows,
+    such that obj_ids[i_objs] == table_ids[rows] (the first row, if an OBJ_ID appears more than once)
+    '''
+
+    table_ids = np.asarray(table_ids)
+    obj_ids = np.atleast_1d( np.asarray(obj_ids) )
+    if table_ids.dtype.kind in 'iu':
+        try:
+            obj_ids = obj_ids.astype(np.int64)
+        except ValueError:
+            return np.array([], dtype=int), np.array([], dtype=int)
+
+    if len(table_ids)==0 or len(obj_ids)==0:
+        return np.array([], dtype=int), np.array([], dtype=int)
+
+    ind_sort = np.argsort(table_ids, kind='mergesort')
+    ids_sorted = table_ids[ind_sort]
+    pos = np.searchsorted(ids_sorted, obj_ids)
+    pos[pos == len(ids_sorted)] = 0
+    found = ( ids_sorted[pos] == obj_ids )
+
+    return np.where(found)[0], ind_sort[pos[found]]
+
+
+
+def get_canvas_table(fname):
+    '''
+    the CANVAS table (structured array) and its 6-digit OBJ_IDs, parsed once per session;
+    the parsed table is kept as a binary copy in the local cache directory (see ngtsio_cache)
+    '''
+
+    def read_table():
+        return np.atleast_1d( np.genfromtxt(fname, dtype=None, names=True) )
+
+    def read():
+        if ngtsio_cache.CACHE_DIR is None:
+            canvasdata = read_table()
+        else:
+            canvasdata = ngtsio_cache.get_canvas_table(fname, read_table)
+        canvas_obj_ids = np.char.zfill( canvasdata['OBJ_ID'].astype('|S6'), 6 )
+        return canvasdata, canvas_obj_ids
+
+    return session_cached( (fname,'canvas'), read )
+
+
+
 def objid_6digit(obj_list):
     for i, obj_id in enumerate(obj_list):
         while len(obj_id)<6:
@@ -866,7 +1243,7 @@ def get_time_inds(fnames, time_index, time_date, time_hjd, time_actionid, fitsre
 
 
 
-def get_indtime_from_timedate(fnames, time_date, fitsreader):
+def get_indtime_from_timedate(fnames, time_date, fitsreader, silent):
     
 
     # if not list, make list
@@ -875,13 +1252,13 @@ def get_indtime_from_timedate(fnames, time_date, fitsreader):
 
 
     if fitsreader=='astropy' or fitsreader=='pyfits':
-        with pyfits.open(fnames['IMAGELIST'], mode='denywrite') as hdulist:
+        with pyfits_open(fnames['IMAGELIST']) as hdulist:
             time_date_all = hdulist['IMAGELIST'].data['DATE-OBS'].strip()
             del hdulist['IMAGELIST'].data
 
     elif fitsreader=='fitsio' or fitsreader=='cfitsio':
-        with fitsio.FITS(fnames['IMAGELIST'], vstorage='object') as hdulist:
-            time_date_all = np.char.strip( hdulist['IMAGELIST'].read(columns='DATE-OBS') )
+        with fitsio_open(fnames['IMAGELIST']) as hdulist:
+            time_date_all = session_cached( (fnames['IMAGELIST'],'IMAGELIST','DATE-OBS','strip'), lambda: np.char.strip( hdulist['IMAGELIST'].read(columns='DATE-OBS') ) )
 
     else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
 
@@ -908,14 +1285,20 @@ def get_indtime_from_timehjd(fnames, time_hjd, fitsreader, silent):
         time_hjd = [time_hjd]
 
 
+    #::: HJD is an extension of the megafile, but its own file in prodstore
+    if ('HJD' in fnames) and (fnames['HJD'] is not None):
+        fname_hjd = fnames['HJD']
+    else:
+        fname_hjd = fnames['IMAGELIST']
+
     if fitsreader=='astropy' or fitsreader=='pyfits':
-        with pyfits.open(fnames['IMAGELIST'], mode='denywrite') as hdulist:
+        with pyfits_open(fname_hjd) as hdulist:
             time_hjd_all = np.int64( hdulist['HJD'].data[0]/3600./24. )
-            del hdulist['IMAGELIST'].data
+            del hdulist['HJD'].data
 
     elif fitsreader=='fitsio' or fitsreader=='cfitsio':
-        with fitsio.FITS(fnames['IMAGELIST'], vstorage='object') as hdulist:
-            time_hjd_all = np.int64( hdulist['HJD'][0,:]/3600./24. )[0]
+        with fitsio_open(fname_hjd) as hdulist:
+            time_hjd_all = session_cached( (fname_hjd,'HJD','day'), lambda: np.int64( hdulist['HJD'][0,:]/3600./24. )[0] )
 
     else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
 
@@ -947,13 +1330,13 @@ def get_indtime_from_timeactionid(fnames, time_actionid, fitsreader):
 
 
     if fitsreader=='astropy' or fitsreader=='pyfits':
-        with pyfits.open(fnames['IMAGELIST'], mode='denywrite') as hdulist:
+        with pyfits_open(fnames['IMAGELIST']) as hdulist:
             time_actionid_all = hdulist['IMAGELIST'].data['ACTIONID']
             del hdulist['IMAGELIST'].data
 
     elif fitsreader=='fitsio' or fitsreader=='cfitsio':
-        with fitsio.FITS(fnames['IMAGELIST'], vstorage='object') as hdulist:
-            time_actionid_all = hdulist['IMAGELIST'].read(columns='ACTIONID')
+        with fitsio_open(fnames['IMAGELIST']) as hdulist:
+            time_actionid_all = fitsio_read_column(hdulist, fnames['IMAGELIST'], 'IMAGELIST', 'ACTIONID')
 
     else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
 
@@ -1048,7 +1431,7 @@ def get_time_actionid_from_range(actionid_range):
 ###############################################################################
 # get dictionary with fitsio/pyfits getters
 ###############################################################################
-def get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time, fitsreader):
+def get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time, fitsreader, preserve_dtype=False, lazy_decode=False):
 
     #::: check keys
     if isinstance (keys, str): keys = [keys]
@@ -1071,11 +1454,13 @@ def get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time, fitsreader):
             keys.append('OBJ_ID')
 
 
-        if fitsreader=='astropy' or fitsreader=='pyfits': dic = pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=ind_time)
-        elif fitsreader=='fitsio' or fitsreader=='cfitsio': dic = fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=ind_time)
-        else: sys.exit('"fitsreader" can only be "astropy"/"pyfits" or "fitsio"/"cfitsio".')
+        if fitsreader=='astropy' or fitsreader=='pyfits': dic = pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=ind_time, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode)
+        elif fitsreader=='fitsio' or fitsreader=='cfitsio': dic = fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=ind_time, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode)
+        elif fitsreader=='mmap': dic = fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=ind_time, mmap=True, preserve_dtype=preserve_dtype, lazy_decode=lazy_decode)
+        else: sys.exit('"fitsreader" can only be "astropy"/"pyfits", "fitsio"/"cfitsio" or "mmap".')
 
-        dic = get_canvas_data( fnames, keys, dic )
+        with stage('canvas'):
+            dic = get_canvas_data( fnames, keys, dic )
 
 
         #TODO: make clear that from now on OBJ_IDs is always part of the dictionary!
@@ -1106,14 +1491,14 @@ def get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time, fitsreader):
 ###############################################################################
 
 
-def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(None), CCD_bzero=0., CCD_precision=32., CENTD_bzero=0., CENTD_precision=1024.):
+def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(None), CCD_bzero=0., CCD_precision=32., CENTD_bzero=0., CENTD_precision=1024., preserve_dtype=False, lazy_decode=False):
 
     dic = {}
 
     ###################### in pipeline: BLSPipe_megafile #####################
     if 'BLSPipe_megafile' in fnames:
         
-        with pyfits.open(fnames['BLSPipe_megafile'], mode='denywrite') as hdulist:
+        with pyfits_open(fnames['BLSPipe_megafile']) as hdulist:
 
             #::: CATALOGUE
             hdukey = 'CATALOGUE'
@@ -1134,11 +1519,13 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
                 hdukey = hdukeyinfo[1]
                 if hdukey in keys:
                     key = hdukey
-                    dic[key] = hdulist[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist[key].data[ind_objs][:,ind_time] )
-                    if key in ['CCDX','CCDY']:
-                        dic[key] = (dic[key] + CCD_bzero) / CCD_precision
-                    if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
-                        dic[key] = (dic[key] + CENTD_bzero) / CENTD_precision
+                    with stage('read '+key):
+                        dic[key] = hdulist[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist[key].data[ind_objs][:,ind_time] )
+                    with stage('rescale '+key):
+                        if key in ['CCDX','CCDY']:
+                            dic[key] = decode_fixed_point(dic[key], CCD_bzero, CCD_precision, preserve_dtype, lazy_decode)
+                        if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
+                            dic[key] = decode_fixed_point(dic[key], CENTD_bzero, CENTD_precision, preserve_dtype, lazy_decode)
                     del hdulist[key].data
 
             del hdulist
@@ -1148,7 +1535,7 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
     elif ('nights' in fnames) and (fnames['nights'] is not None):       
             
         #::: CATALOGUE
-        with pyfits.open(fnames['CATALOGUE'], mode='denywrite') as hdulist:
+        with pyfits_open(fnames['CATALOGUE']) as hdulist:
             hdukey = 'CATALOGUE'
             hdu = hdulist[hdukey].data
             for key in np.intersect1d(hdu.names, keys):
@@ -1156,7 +1543,7 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
             del hdu, hdulist[hdukey].data, hdulist
 
         #::: IMAGELIST
-        with pyfits.open(fnames['IMAGELIST'], mode='denywrite') as hdulist:
+        with pyfits_open(fnames['IMAGELIST']) as hdulist:
             hdukey = 'IMAGELIST'
             hdu = hdulist[hdukey].data
             for key in np.intersect1d(hdu.names, keys):
@@ -1166,22 +1553,25 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
         #::: DATA HDUs
         for key in keys:
             if key in fnames:
-                with pyfits.open(fnames[key], mode='denywrite') as hdulist:
-                    dic[key] = hdulist[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist[key].data[ind_objs][:,ind_time] )
-                    if key in ['CCDX','CCDY']:
-                        dic[key] = (dic[key] + CCD_bzero) / CCD_precision
-                    if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
-                        dic[key] = (dic[key] + CENTD_bzero) / CENTD_precision
+                with pyfits_open(fnames[key]) as hdulist:
+                    with stage('read '+key):
+                        dic[key] = hdulist[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist[key].data[ind_objs][:,ind_time] )
+                    with stage('rescale '+key):
+                        if key in ['CCDX','CCDY']:
+                            dic[key] = decode_fixed_point(dic[key], CCD_bzero, CCD_precision, preserve_dtype, lazy_decode)
+                        if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
+                            dic[key] = decode_fixed_point(dic[key], CENTD_bzero, CENTD_precision, preserve_dtype, lazy_decode)
                     del hdulist[key].data, hdulist
         
 
 
     if ('sysrem' in fnames) and (fnames['sysrem'] is not None):
-        with pyfits.open(fnames['sysrem'], mode='denywrite') as hdulist_sysrem:
+        with pyfits_open(fnames['sysrem']) as hdulist_sysrem:
             for i, hdukey in enumerate(hdulist_sysrem.info(output=False)):
                 if hdukey[1] in keys:
                     key = hdukey[1]
-                    dic[key] = hdulist_sysrem[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist_sysrem[key].data[ind_objs][:,ind_time] )#in s
+                    with stage('read '+key):
+                        dic[key] = hdulist_sysrem[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist_sysrem[key].data[ind_objs][:,ind_time] )#in s
                     del hdulist_sysrem[key].data
 
             del hdulist_sysrem
@@ -1189,13 +1579,10 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
 
 
     if ('bls' in fnames) and (fnames['bls'] is not None):
-        with pyfits.open(fnames['bls'], mode='denywrite') as hdulist_bls:
+        with pyfits_open(fnames['bls']) as hdulist_bls:
 
-            #first little hack: transform from S26 into S6 dtype with .astype('|S6') or .strip()!
-            #second little hack: only choose rank 1 output (5 ranks output by orion into the fits files, in 5 subsequent rows)
-            ind_objs_bls = np.in1d(hdulist_bls['CANDIDATES'].data['OBJ_ID'].strip(), obj_ids).nonzero()[0] #indices of the candidates
-            ind_rank1 = np.where( hdulist_bls['CANDIDATES'].data['RANK'] == bls_rank )[0]
-            ind_objs_bls = np.intersect1d( ind_objs_bls, ind_rank1 )
+            #::: join the requested obj_ids with the rank bls_rank candidates (once for all CANDIDATES keys)
+            i_objs, ind_objs_bls = match_bls_candidates(fnames['bls'], 'pyfits', obj_ids, bls_rank)
 
 
             #::: CATALOGUE
@@ -1219,35 +1606,28 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
             if subkeys.size!=0:
                 # see if any BLS candidates are in the list
                 if len(ind_objs_bls)!=0:
-                    bls_data_objid = np.char.strip( hdu['OBJ_ID'][ind_objs_bls] )
-
                     # go through all subkeys
                     for key in subkeys:
-                        # read out data for this key
-                        bls_data = hdu[key][ind_objs_bls]
-
-                        # write them at the right place into the dictionary
                         # initialize empty dictionary entry, size of all requested ind_objs
-                        dic[key] = np.zeros( N_objs ) * np.nan
-                        # go through all requested obj_ids
-                        for i, singleobj_id in enumerate(obj_ids):
-                            if singleobj_id in bls_data_objid:
-                                i_bls = np.where( bls_data_objid == singleobj_id )[0]
-                                dic[key][i] = bls_data[i_bls]
+                        dic[key] = np.zeros( N_objs, dtype=nan_dtype(hdu[key].dtype, preserve_dtype) ) * np.nan
+                        # and write the candidates at the right place
+                        dic[key][i_objs] = hdu[key][ind_objs_bls]
                 else:
                     # go through all subkeys
                     for key in subkeys:
                         # initialize empty dictionary entry, size of all requested ind_objs
                         dic[key] = np.zeros( N_objs )
+            del hdu, hdulist_bls[hdukey].data
 
 
 
     if ('decorr' in fnames) and (fnames['decorr'] is not None):
-        with pyfits.open(fnames['decorr'], mode='denywrite') as hdulist_sysrem:
+        with pyfits_open(fnames['decorr']) as hdulist_sysrem:
             for i, hdukey in enumerate(hdulist_sysrem.info(output=False)):
                 if hdukey[1] in keys:
                     key = hdukey[1]
-                    dic[key] = hdulist_sysrem[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist_sysrem[key].data[ind_objs][:,ind_time] )#in s
+                    with stage('read '+key):
+                        dic[key] = hdulist_sysrem[key].data[ind_objs][:,ind_time] #copy.deepcopy( hdulist_sysrem[key].data[ind_objs][:,ind_time] )#in s
                     del hdulist_sysrem[key].data
 
             del hdulist_sysrem
@@ -1261,7 +1641,7 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
     '''
 
     if ('dilution' in fnames) and (fnames['dilution'] is not None):
-        with pyfits.open(fnames['dilution'], mode='denywrite') as hdulist_dil:
+        with pyfits_open(fnames['dilution']) as hdulist_dil:
             hdukey = 1
             hdu = hdulist_dil[hdukey].data
             hdunames = hdu.names
@@ -1279,9 +1659,10 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
 
 
 
-    #::: output as numpy ndarrays
+    #::: output as numpy ndarrays (lazily decoded keys stay as they are)
     for key, value in dic.iteritems():
-        dic[key] = np.array(value)
+        if not isinstance(value, ngtsio_lazy.FixedPointArray):
+            dic[key] = np.array(value)
 
 
     return dic
@@ -1292,14 +1673,18 @@ def pyfits_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
 ###############################################################################
 # fitsio getter
 ###############################################################################
-def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(None), CCD_bzero=0., CCD_precision=32., CENTD_bzero=0., CENTD_precision=1024.):
+def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(None), CCD_bzero=0., CCD_precision=32., CENTD_bzero=0., CENTD_precision=1024., mmap=False, preserve_dtype=False, lazy_decode=False):
 
     dic = {}
+    tasks = []
+
+    #::: only time selections (time_index, time_date, ...) may be read from the time-major copies, never all exposures
+    epochs = not isinstance(ind_time, slice)
 
     ###################### in pipeline: BLSPipe_megafile #####################
     if ('BLSPipe_megafile' in fnames) and (fnames['BLSPipe_megafile'] is not None):
         
-        with fitsio.FITS(fnames['nights'], vstorage='object') as hdulist:
+        with fitsio_open(fnames['nights']) as hdulist:
 
             #::: fitsio does not work with slice arguments, convert to list
             allobjects = False
@@ -1318,7 +1703,7 @@ def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
             hdunames = hdulist[hdukey].get_colnames()
             subkeys = np.intersect1d(hdunames, keys)
             if subkeys.size!=0:
-                data = hdulist[hdukey].read(columns=subkeys, rows=ind_objs)
+                data = fitsio_read_columns(hdulist, fnames['nights'], hdukey, subkeys, rows=ind_objs)
                 if isinstance(subkeys, str): subkeys = [subkeys]
                 for key in subkeys:
                     dic[key] = data[key] #copy.deepcopy( data[key] )
@@ -1329,14 +1714,12 @@ def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
             hdunames = hdulist[hdukey].get_colnames()
             subkeys = np.intersect1d(hdunames, keys)
             if subkeys.size!=0:
-                data = hdulist[hdukey].read(columns=subkeys, rows=ind_time)
+                data = fitsio_read_columns(hdulist, fnames['nights'], hdukey, subkeys, rows=ind_time)
                 if isinstance(subkeys, str): subkeys = [subkeys]
                 for key in subkeys:
                     dic[key] = data[key] #copy.deepcopy( data[key] )
                 del data
 
-            # TODO: very inefficient - reads out entire image first, then cuts
-            # TODO: can only give ind_time in a slice, not just respective dates
             #::: DATA HDUs
             j = 0
             while j!=-1:
@@ -1345,31 +1728,15 @@ def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
                     if hdukey in keys:
                         key = hdukey
 
-                        #::: read out individual objects (more memory efficient)
-                        if allobjects == False:
-                            dic[key] = np.zeros(( len(ind_objs), len(ind_time) ))
-                            for i, ind_singleobj in enumerate(ind_objs):
-                                buf = hdulist[hdukey][slice(ind_singleobj,ind_singleobj+1), slice( ind_time[0], ind_time[-1]+1)]
-                                #::: select the wished times only (if some times within the slice are not wished for)
-                                if buf.shape[1] != len(ind_time):
-                                    ind_timeX = [x - ind_time[0] for x in ind_time]
-                                    buf = buf[:,ind_timeX]
-                                dic[key][i,:] = buf
-                            del buf
-
-                        #::: read out all objects at once
-                        else:
-                            buf = hdulist[hdukey][:, slice( ind_time[0], ind_time[-1]+1)]
-                            if buf.shape[1] != len(ind_time):
-                                ind_timeX = [x - ind_time[0] for x in ind_time]
-                                buf = buf[:,ind_timeX]
-                            dic[key] = buf
-                            del buf
+                        #::: read out the requested objects in blocks of (nearly) contiguous rows
+                        with stage('read '+key):
+                            dic[key] = read_image(hdulist, fnames['nights'], hdukey, ind_objs, ind_time, allobjects, mmap, preserve_dtype or (lazy_decode and key in FIXED_POINT_KEYS), epochs)
 
-                        if key in ['CCDX','CCDY']:
-                            dic[key] = (dic[key] + CCD_bzero) / CCD_precision
-                        if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
-                            dic[key] = (dic[key] + CENTD_bzero) / CENTD_precision
+                        with stage('rescale '+key):
+                            if key in ['CCDX','CCDY']:
+                                dic[key] = decode_fixed_point(dic[key], CCD_bzero, CCD_precision, preserve_dtype, lazy_decode)
+                            if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
+                                dic[key] = decode_fixed_point(dic[key], CENTD_bzero, CENTD_precision, preserve_dtype, lazy_decode)
                     j += 1
                 except:
                     break
@@ -1380,7 +1747,7 @@ def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
     elif ('nights' in fnames) and (fnames['nights'] is not None):
         
             #::: CATALOGUE
-            with fitsio.FITS(fnames['CATALOGUE'], vstorage='object') as hdulist:
+            with fitsio_open(fnames['CATALOGUE']) as hdulist:
                 
                 #::: fitsio does not work with slice arguments, convert to list
                 allobjects = False
@@ -1393,14 +1760,14 @@ def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
                 hdunames = hdulist[hdukey].get_colnames()
                 subkeys = np.intersect1d(hdunames, keys)
                 if subkeys.size!=0:
-                    data = hdulist[hdukey].read(columns=subkeys, rows=ind_objs)
+                    data = fitsio_read_columns(hdulist, fnames['CATALOGUE'], hdukey, subkeys, rows=ind_objs)
                     if isinstance(subkeys, str): subkeys = [subkeys]
                     for key in subkeys:
                         dic[key] = data[key] #copy.deepcopy( data[key] )
                     del data
         
             #::: IMAGELIST
-            with fitsio.FITS(fnames['IMAGELIST'], vstorage='object') as hdulist:
+            with fitsio_open(fnames['IMAGELIST']) as hdulist:
         
                 #::: fitsio does not work with slice arguments, convert to list
                 if isinstance (ind_time, slice):
@@ -1411,210 +1778,518 @@ def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
                 hdunames = hdulist[hdukey].get_colnames()
                 subkeys = np.intersect1d(hdunames, keys)
                 if subkeys.size!=0:
-                    data = hdulist[hdukey].read(columns=subkeys, rows=ind_time)
+                    data = fitsio_read_columns(hdulist, fnames['IMAGELIST'], hdukey, subkeys, rows=ind_time)
                     if isinstance(subkeys, str): subkeys = [subkeys]
                     for key in subkeys:
                         dic[key] = data[key] #copy.deepcopy( data[key] )
                     del data
     
-            #::: DATA HDUs
+            #::: DATA HDUs (one file per key)
             for key in keys:
                 if (key in fnames) and (fnames[key] is not None):
-                    with fitsio.FITS(fnames[key], vstorage='object') as hdulist:
-                    
-                        hdukey = hdulist[0].get_extname()
-                        if hdukey in keys:
-    
-                            #::: read out individual objects (more memory efficient)
-                            if allobjects == False:
-                                dic[key] = np.zeros(( len(ind_objs), len(ind_time) ))
-                                for i, ind_singleobj in enumerate(ind_objs):
-                                    buf = hdulist[hdukey][slice(ind_singleobj,ind_singleobj+1), slice( ind_time[0], ind_time[-1]+1)]
-                                    #::: select the wished times only (if some times within the slice are not wished for)
-                                    if buf.shape[1] != len(ind_time):
-                                        ind_timeX = [x - ind_time[0] for x in ind_time]
-                                        buf = buf[:,ind_timeX]
-                                    dic[key][i,:] = buf
-                                del buf
-    
-                            #::: read out all objects at once
-                            else:
-                                buf = hdulist[hdukey][:, slice( ind_time[0], ind_time[-1]+1)]
-                                if buf.shape[1] != len(ind_time):
-                                    ind_timeX = [x - ind_time[0] for x in ind_time]
-                                    buf = buf[:,ind_timeX]
-                                dic[key] = buf
-                                del buf
-    
-                            if key in ['CCDX','CCDY']:
-                                dic[key] = (dic[key] + CCD_bzero) / CCD_precision
-                            if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
-                                dic[key] = (dic[key] + CENTD_bzero) / CENTD_precision
-                       
-                       
+                    tasks.append( (fitsio_read_datafile, (fnames[key], key, keys, ind_objs, ind_time, allobjects, mmap, preserve_dtype, lazy_decode, CCD_bzero, CCD_precision, CENTD_bzero, CENTD_precision, epochs)) )
+
+
 
     if ('sysrem' in fnames) and (fnames['sysrem'] is not None):
-        with fitsio.FITS(fnames['sysrem'], vstorage='object') as hdulist_sysrem:
-            j = 0
-            while j!=-1:
-                try:
-                    hdukey = hdulist_sysrem[j].get_extname()
-                    if hdukey in keys:
-                        key = hdukey
+        tasks.append( (fitsio_read_sysrem, (fnames['sysrem'], keys, ind_objs, ind_time, allobjects, mmap, preserve_dtype, epochs)) )
 
-                        #::: read out individual objects (more memory efficient)
-                        if allobjects == False:
-                            dic[key] = np.zeros(( len(ind_objs), len(ind_time) ))
-                            for i, ind_singleobj in enumerate(ind_objs):
-                                buf = hdulist_sysrem[hdukey][slice(ind_singleobj,ind_singleobj+1), slice( ind_time[0], ind_time[-1]+1)]
-                                #::: select the wished times only (if some times within the slice are not wished for)
-                                if buf.shape[1] != len(ind_time):
-                                    ind_timeX = [x - ind_time[0] for x in ind_time]
-                                    buf = buf[:,ind_timeX]
-                                dic[key][i,:] = buf
-                            del buf
-
-                        #::: read out all objects at once
-                        else:
-                            buf = hdulist_sysrem[hdukey][:, slice( ind_time[0], ind_time[-1]+1)]
-                            if buf.shape[1] != len(ind_time):
-                                ind_timeX = [x - ind_time[0] for x in ind_time]
-                                buf = buf[:,ind_timeX]
-                            dic[key] = buf
-                            del buf
-                    j += 1
-                except:
-                    break
+    if ('bls' in fnames) and (fnames['bls'] is not None):
+        tasks.append( (fitsio_read_bls, (fnames['bls'], keys, obj_ids, ind_objs, bls_rank, preserve_dtype)) )
 
+    if ('decorr' in fnames) and (fnames['decorr'] is not None):
+        tasks.append( (fitsio_read_decorr, (fnames['decorr'], keys, ind_objs, ind_time, allobjects, mmap, preserve_dtype, epochs)) )
 
+    if ('dilution' in fnames) and (fnames['dilution'] is not None):
+        tasks.append( (fitsio_read_dilution, (fnames['dilution'], keys, ind_objs)) )
 
-    if ('bls' in fnames) and (fnames['bls'] is not None):
-        with fitsio.FITS(fnames['bls'], vstorage='object') as hdulist_bls:
+    #::: the files are independent of each other and can be read in parallel (see READ_WORKERS);
+    #::: the results are merged in the order above, i.e. independent of which read finishes first
+    for data in read_files(tasks):
+        dic.update(data)
 
-            #first little hack: transform from S26 into S6 dtype with .astype('|S6') or .strip()!
-            #second little hack: only choose rank 1 output (5 ranks output by orion into the fits files, in 5 subsequent rows)
-            ind_objs_bls = np.in1d( np.char.strip(hdulist_bls['CANDIDATES'].read(columns='OBJ_ID')), obj_ids).nonzero()[0] #indices of the candidates
-            ind_rank1 = np.where( hdulist_bls['CANDIDATES'].read(columns='RANK') == bls_rank )[0]
-            ind_objs_bls = np.intersect1d( ind_objs_bls, ind_rank1 ) #indices of the objects in the BLS file
+    return dic
 
 
-            #::: CATALOGUE
-            hdukey = 'CATALOGUE'
-            hdunames = hdulist_bls[hdukey].get_colnames()
-            subkeys = np.intersect1d(hdunames, keys)
-            # EXCLUDE OBJ_IDs from subkeys
-            if 'OBJ_ID' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='OBJ_ID'))
-            if 'FLAGS' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='FLAGS'))
 
-            if subkeys.size!=0:
-                data = hdulist_bls[hdukey].read(columns=subkeys, rows=ind_objs)
-                if isinstance(subkeys, str): subkeys = [subkeys]
-                for key in subkeys:
-                    dic[key] = data[key] #copy.deepcopy( data[key] )
-                del data
 
+###############################################################################
+# fitsio readers for the individual files (prodstore)
+###############################################################################
+#::: number of files that are read at the same time (in threads); READ_WORKERS = 1 reads them one after another.
+#::: This mostly helps on network file systems, where each file open/read is latency-bound; note that
+#::: older fitsio versions hold the GIL while reading, then only fitsreader='mmap' gains from threads
+READ_WORKERS = int( os.environ.get('NGTSIO_READ_WORKERS', 1) )
 
-            #::: CANDIDATES (different indices!)
-            hdukey = 'CANDIDATES'
-            hdunames = hdulist_bls[hdukey].get_colnames()
-            subkeys = np.intersect1d(hdunames, keys)
-            # EXCLUDE OBJ_IDs from subkeys
-            if 'OBJ_ID' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='OBJ_ID'))
-            if 'FLAGS' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='FLAGS'))
+read_pool = (0, None)
+read_pool_lock = threading.Lock()
 
-            if subkeys.size!=0:
 
-                # see if any BLS candidates are in the list
-                if len(ind_objs_bls)!=0:
+def read_files(tasks):
+    '''
+    run the file readers (func, args) and return their outputs in the same order;
+    with READ_WORKERS > 1 they run in a thread pool, sharing the session of the calling thread
+    '''
+    global read_pool
 
-                    # Now, for this one, again INCLUDE OBJ_IDs in subkeys (as last subkey)
-                    if 'OBJ_ID' not in subkeys: subkeys = np.append(subkeys, 'OBJ_ID')
+    if (READ_WORKERS <= 1) or (len(tasks) <= 1):
+        return [ func(*args) for func, args in tasks ]
 
-                    bls_data = hdulist_bls[hdukey].read(columns=subkeys, rows=ind_objs_bls)
-                # write them at the right place into the dictionary
-                    # EXCLUDE OBJ_IDs from subkeys
-                    if 'OBJ_ID' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='OBJ_ID'))
-                    #typecast to list if needed
-                    if isinstance(subkeys, str): subkeys = [subkeys]
-                    # go through all subkeys
-                    for key in subkeys:
-                        # initialize empty dictionary entry, size of all requested ind_objs
-                        dic[key] = np.zeros( len(ind_objs) ) * np.nan
-                        #go through all requested obj_ids
-                        for i, singleobj_id in enumerate(obj_ids):
-                            if singleobj_id in np.char.strip(bls_data['OBJ_ID']):
-                                i_bls = np.where( np.char.strip(bls_data['OBJ_ID']) == singleobj_id )
-                                dic[key][i] = bls_data[key][i_bls]
+    handles, cache = getattr(session, 'handles', None), getattr(session, 'cache', None)
 
-                else:
-                    # go through all subkeys
-                    for key in subkeys:
-                        # initialize empty dictionary entry, size of all requested ind_objs
-                        dic[key] = np.zeros( len(ind_objs) ) * np.nan
+    def run(task):
+        func, args = task
+        with use_session(handles, cache):
+            return func(*args)
 
+    #::: when READ_WORKERS changes, the previous pool is closed (its threads exit once the tasks
+    #::: already submitted are done); tasks are submitted under the lock, so never to a closed pool
+    with read_pool_lock:
+        if read_pool[0] != READ_WORKERS:
+            if read_pool[1] is not None:
+                read_pool[1].close()
+            read_pool = (READ_WORKERS, multiprocessing.pool.ThreadPool(READ_WORKERS))
+        result = read_pool[1].map_async(run, tasks)
 
+    return result.get()
 
-    if ('decorr' in fnames) and (fnames['decorr'] is not None):
-        '''
-        Note: the extension name in the .fits for DECORR_FLUX3 is DECORR_FLUX (without 3), that's why I needed to put a little hack and do +'3'
-        '''
-        with fitsio.FITS(fnames['decorr'], vstorage='object') as hdulist_sysrem:
-            j = 0
-            while j!=-1:
-                try:
-                    hdukey = hdulist_sysrem[j].get_extname() 
-                    if hdukey + '3' in keys: #little hack because of inconsistent extname convention
-                        key = hdukey + '3' #little hack because of inconsistent extname convention
-
-                        #::: read out individual objects (more memory efficient)
-                        if allobjects == False:
-                            dic[key] = np.zeros(( len(ind_objs), len(ind_time) ))
-                            for i, ind_singleobj in enumerate(ind_objs):
-                                buf = hdulist_sysrem[hdukey][slice(ind_singleobj,ind_singleobj+1), slice( ind_time[0], ind_time[-1]+1)]
-                                #::: select the wished times only (if some times within the slice are not wished for)
-                                if buf.shape[1] != len(ind_time):
-                                    ind_timeX = [x - ind_time[0] for x in ind_time]
-                                    buf = buf[:,ind_timeX]
-                                dic[key][i,:] = buf
-                            del buf
-
-                        #::: read out all objects at once
-                        else:
-                            buf = hdulist_sysrem[hdukey][:, slice( ind_time[0], ind_time[-1]+1)]
-                            if buf.shape[1] != len(ind_time):
-                                ind_timeX = [x - ind_time[0] for x in ind_time]
-                                buf = buf[:,ind_timeX]
-                            dic[key] = buf
-                            del buf
-                    j += 1
-                except:
-                    break
-                
-                
-    ##################### fnames['dilution'] #####################
+
+
+def fitsio_read_datafile(fname, key, keys, ind_objs, ind_time, allobjects, mmap, preserve_dtype, lazy_decode, CCD_bzero, CCD_precision, CENTD_bzero, CENTD_precision, epochs=False):
+    '''read one DATA key from its own file'''
+    dic = {}
+    with fitsio_open(fname) as hdulist:
+
+        hdukey = hdulist[0].get_extname()
+        if hdukey in keys:
+
+            #::: read out the requested objects in blocks of (nearly) contiguous rows
+            with stage('read '+key):
+                dic[key] = read_image(hdulist, fname, hdukey, ind_objs, ind_time, allobjects, mmap, preserve_dtype or (lazy_decode and key in FIXED_POINT_KEYS), epochs)
+
+            with stage('rescale '+key):
+                if key in ['CCDX','CCDY']:
+                    dic[key] = decode_fixed_point(dic[key], CCD_bzero, CCD_precision, preserve_dtype, lazy_decode)
+                if key in ['CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
+                    dic[key] = decode_fixed_point(dic[key], CENTD_bzero, CENTD_precision, preserve_dtype, lazy_decode)
+    return dic
+
+
+
+def fitsio_read_sysrem(fname, keys, ind_objs, ind_time, allobjects, mmap, preserve_dtype=False, epochs=False):
+    '''read the requested keys from the sysrem file'''
+    dic = {}
+    with fitsio_open(fname) as hdulist_sysrem:
+        j = 0
+        while j!=-1:
+            try:
+                hdukey = hdulist_sysrem[j].get_extname()
+                if hdukey in keys:
+                    key = hdukey
+
+                    #::: read out the requested objects in blocks of (nearly) contiguous rows
+                    with stage('read '+key):
+                        dic[key] = read_image(hdulist_sysrem, fname, hdukey, ind_objs, ind_time, allobjects, mmap, preserve_dtype, epochs)
+                j += 1
+            except:
+                break
+    return dic
+
+
+
+def fitsio_read_bls(fname, keys, obj_ids, ind_objs, bls_rank, preserve_dtype=False):
+    '''read the requested keys from the BLS file'''
+    dic = {}
+    with fitsio_open(fname) as hdulist_bls:
+
+        #::: join the requested obj_ids with the rank bls_rank candidates (once for all CANDIDATES keys)
+        i_objs, ind_objs_bls = match_bls_candidates(fname, 'fitsio', obj_ids, bls_rank)
+
+
+        #::: CATALOGUE
+        hdukey = 'CATALOGUE'
+        hdunames = hdulist_bls[hdukey].get_colnames()
+        subkeys = np.intersect1d(hdunames, keys)
+        # EXCLUDE OBJ_IDs from subkeys
+        if 'OBJ_ID' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='OBJ_ID'))
+        if 'FLAGS' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='FLAGS'))
+
+        if subkeys.size!=0:
+            data = hdulist_bls[hdukey].read(columns=subkeys, rows=ind_objs)
+            if isinstance(subkeys, str): subkeys = [subkeys]
+            for key in subkeys:
+                dic[key] = data[key] #copy.deepcopy( data[key] )
+            del data
+
+
+        #::: CANDIDATES (different indices!)
+        hdukey = 'CANDIDATES'
+        hdunames = hdulist_bls[hdukey].get_colnames()
+        subkeys = np.intersect1d(hdunames, keys)
+        # EXCLUDE OBJ_IDs from subkeys
+        if 'OBJ_ID' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='OBJ_ID'))
+        if 'FLAGS' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='FLAGS'))
+
+        if subkeys.size!=0:
+
+            # see if any BLS candidates are in the list
+            if len(ind_objs_bls)!=0:
+
+                # read each candidate row once, in file order
+                rows_read, i_read = np.unique(ind_objs_bls, return_inverse=True)
+                bls_data = hdulist_bls[hdukey].read(columns=subkeys, rows=rows_read)
+                #typecast to list if needed
+                if isinstance(subkeys, str): subkeys = [subkeys]
+                # go through all subkeys
+                for key in subkeys:
+                    # initialize empty dictionary entry, size of all requested ind_objs
+                    dic[key] = np.zeros( len(ind_objs), dtype=nan_dtype(bls_data[key].dtype, preserve_dtype) ) * np.nan
+                    # and write the candidates at the right place
+                    dic[key][i_objs] = bls_data[key][i_read]
+
+            else:
+                # go through all subkeys
+                for key in subkeys:
+                    # initialize empty dictionary entry, size of all requested ind_objs
+                    dic[key] = np.zeros( len(ind_objs) ) * np.nan
+    return dic
+
+
+
+def fitsio_read_decorr(fname, keys, ind_objs, ind_time, allobjects, mmap, preserve_dtype=False, epochs=False):
     '''
+    read the requested keys from the decorr file
+    Note: the extension name in the .fits for DECORR_FLUX3 is DECORR_FLUX (without 3), that's why I needed to put a little hack and do +'3'
+    '''
+    dic = {}
+    with fitsio_open(fname) as hdulist_sysrem:
+        j = 0
+        while j!=-1:
+            try:
+                hdukey = hdulist_sysrem[j].get_extname() 
+                if hdukey + '3' in keys: #little hack because of inconsistent extname convention
+                    key = hdukey + '3' #little hack because of inconsistent extname convention
+
+                    #::: read out the requested objects in blocks of (nearly) contiguous rows
+                    with stage('read '+key):
+                        dic[key] = read_image(hdulist_sysrem, fname, hdukey, ind_objs, ind_time, allobjects, mmap, preserve_dtype, epochs)
+                j += 1
+            except:
+                break
+    return dic
+
+
+
+def fitsio_read_dilution(fname, keys, ind_objs):
+    '''
+    read the requested keys from the dilution file
     dilution fits files contain all object IDs as in the nightly fits files
     row indices in the fits file consequently match
     '''
+    dic = {}
+    with fitsio_open(fname) as hdulist_dil:
+        hdukey = 1
+        hdunames = hdulist_dil[hdukey].get_colnames()
+
+        dilkeys = [ x.lower() for x in keys ]
+        subkeys = np.intersect1d(hdunames, dilkeys)
+        if 'OBJ_ID' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='OBJ_ID'))
+        if 'obj_id' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='obj_id'))
+#
+        if subkeys.size!=0:
+            dil_data = hdulist_dil[hdukey].read(columns=np.append(subkeys, 'obj_id'), rows=ind_objs)
+            for key in subkeys:
+                dic[key.upper()] = dil_data[key]
 
-    if ('dilution' in fnames) and (fnames['dilution'] is not None):
-        with fitsio.FITS(fnames['dilution'], vstorage='object') as hdulist_dil:
-            hdukey = 1
-            hdunames = hdulist_dil[hdukey].get_colnames()
+        del hdulist_dil
+    return dic
 
-            dilkeys = [ x.lower() for x in keys ]
-            subkeys = np.intersect1d(hdunames, dilkeys)
-            if 'OBJ_ID' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='OBJ_ID'))
-            if 'obj_id' in subkeys: subkeys = np.delete(subkeys, np.where(subkeys=='obj_id'))
-#
-            if subkeys.size!=0:
-                dil_data = hdulist_dil[hdukey].read(columns=np.append(subkeys, 'obj_id'), rows=ind_objs)
-                for key in subkeys:
-                    dic[key.upper()] = dil_data[key]
 
-            del hdulist_dil
 
-    return dic
+
+###############################################################################
+# fitsio / mmap image readers (DATA HDUs)
+###############################################################################
+#::: integer-encoded keys, (data + bzero) / precision
+FIXED_POINT_KEYS = ['CCDX','CCDY','CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']
+
+
+
+def decode_fixed_point(data, bzero, precision, preserve_dtype=False, lazy_decode=False):
+    '''
+    (data + bzero) / precision, for the integer-encoded CCDX/Y and CENTDX/Y; in float32 if preserve_dtype;
+    float output buffers are decoded in place, integers into one new array (or only on access if lazy_decode)
+    '''
+    data = np.asarray(data)
+    if preserve_dtype:
+        dtype = np.dtype(np.float32)
+    else:
+        dtype = np.result_type(np.result_type(data, bzero), precision)
+    if lazy_decode:
+        return ngtsio_lazy.FixedPointArray(data, bzero, precision, dtype)
+    if (data.dtype == dtype) and data.dtype.isnative and data.flags.writeable:
+        out = data
+    else:
+        out = np.array(data, dtype=dtype)
+    out += bzero
+    out /= precision
+    return out
+
+
+
+def nan_dtype(dtype, preserve_dtype=False):
+    '''data type of an array that is filled with nan for missing entries (float64, or the smallest float that holds dtype)'''
+    if preserve_dtype:
+        return np.result_type(dtype, np.float32)
+    return float
+
+
+
+def read_image(hdulist, fname, hdukey, ind_objs, ind_time, allobjects, mmap=False, preserve_dtype=False, epochs=False):
+    '''
+    read an image HDU either via numpy.memmap (fitsreader='mmap') or via fitsio;
+    images that cannot be memory-mapped (e.g. compressed ones, or ones in a store) are read via fitsio;
+    time selections (epochs) of fewer exposures than objects are read from the time-major copy, if there is one (see transpose)
+    '''
+    if epochs and (len(ind_time) < len(ind_objs)):
+        data = session_cached( ('time_major',fname,hdukey), lambda: load_time_major(fname, hdukey) )
+        if data is not None:
+            return read_time_major(data, ind_objs, ind_time, allobjects, preserve_dtype=preserve_dtype)
+    if mmap and not isinstance(hdulist, ngtsio_store.StoreFile):
+        try:
+            return ngtsio_stage.open_local(fname, lambda f: ngtsio_mmap.read_image(f, hdukey, ind_objs, ind_time, allobjects))
+        except ValueError:
+            pass
+    return fitsio_read_image(hdulist[hdukey], ind_objs, ind_time, allobjects, preserve_dtype=preserve_dtype)
+
+
+
+
+#::: rows that are at most OBJ_GAP rows apart are read out in one block;
+#::: reading a few unwanted rows is much cheaper than one cfitsio call per row
+OBJ_GAP = 4
+
+#::: cost heuristic for time selections: a separate cfitsio call per run of exposures costs
+#::: about as much as reading TIME_GAP unwanted exposures, so runs that are at most TIME_GAP
+#::: exposures apart are read in one span, and runs further apart are read separately
+TIME_GAP = 256
+
+
+def fitsio_read_image(hdu, ind_objs, ind_time, allobjects, obj_gap=None, time_gap=None, preserve_dtype=False):
+    '''
+    read the requested objects (rows) and times (columns) from a fitsio image HDU
+
+    Neighbouring rows (up to obj_gap rows apart) are grouped into blocks, and each block
+    is read with a single cfitsio call instead of one call per object.
+    The requested times are split into runs of (nearly) contiguous exposures (up to time_gap
+    exposures apart), so that sparse time selections (e.g. a few nights out of a year)
+    only read the exposures around the requested ones instead of the whole [first, last] span.
+    The output is identical to reading out all objects one by one over the full time span
+    (as float64, or in the data type of the file if preserve_dtype).
+    '''
+
+    if obj_gap is None: obj_gap = OBJ_GAP
+    if time_gap is None: time_gap = TIME_GAP
+
+    time_runs = get_runs(ind_time, time_gap)
+
+    #::: read out all objects at once
+    if allobjects == True:
+        for t_start, t_stop, j_start, j_stop in time_runs:
+            buf = hdu[:, slice(t_start,t_stop)]
+            #::: select the wished times only (if some times within the run are not wished for)
+            if buf.shape[1] != j_stop-j_start:
+                buf = buf[:, np.asarray(ind_time[j_start:j_stop]) - t_start]
+            #::: a single run is returned as it is, several runs are stitched together
+            if len(time_runs) == 1:
+                return buf
+            if j_start == 0:
+                data = np.empty(( buf.shape[0], len(ind_time) ), dtype=buf.dtype)
+            data[:,j_start:j_stop] = buf
+            del buf
+        return data
+
+    #::: read out blocks of (nearly) contiguous objects
+    else:
+        ind_objs = np.asarray(ind_objs)
+        data = None
+        for row_start, row_stop, i_start, i_stop in get_runs(ind_objs, obj_gap):
+            for t_start, t_stop, j_start, j_stop in time_runs:
+                buf = hdu[slice(row_start,row_stop), slice(t_start,t_stop)]
+                if data is None:
+                    data = np.zeros(( len(ind_objs), len(ind_time) ), dtype=buf.dtype if preserve_dtype else float)
+                #::: select the wished times only (if some times within the run are not wished for)
+                if buf.shape[1] != j_stop-j_start:
+                    buf = buf[:, np.asarray(ind_time[j_start:j_stop]) - t_start]
+                #::: select the wished objects only (if some rows within the block are not wished for)
+                data[i_start:i_stop,j_start:j_stop] = buf[ ind_objs[i_start:i_stop] - row_start ]
+                del buf
+        if data is None:
+            data = np.zeros(( len(ind_objs), len(ind_time) ))
+        return data
+
+
+
+def get_runs(ind, max_gap=0):
+    '''
+    group indices into runs of (nearly) contiguous, non-decreasing values
+
+    Two neighbouring indices end up in the same run if the second one is at most
+    max_gap+1 larger than the first one.
+
+    Returns
+    -------
+    runs : list of tuples
+        (start, stop, i_start, i_stop) for each run, where start:stop is the slice
+        that has to be read from the file, and i_start:i_stop are the positions of
+        the run's members in ind
+    '''
+
+    ind = np.asarray(ind)
+    if len(ind) == 0:
+        return []
+
+    steps = np.diff(ind)
+    breaks = np.where( (steps > max_gap+1) | (steps < 0) )[0] + 1
+    i_starts = np.append(0, breaks)
+    i_stops = np.append(breaks, len(ind))
+
+    return [ (int(ind[i0]), int(ind[i1-1])+1, int(i0), int(i1)) for i0, i1 in zip(i_starts, i_stops) ]
+
+
+
+
+###############################################################################
+# Time-major copies of DATA images (all objects at a few epochs)
+###############################################################################
+#::: keys of which transpose() builds time-major copies by default
+TIME_MAJOR_KEYS = ['FLUX3','FLAGS','CCDX','CCDY','SKYBKG']
+
+
+
+def transpose(fieldname, ngts_version, keys=None, fnames=None, root=None, roots=None, block_rows=None, silent=False):
+    '''
+    build time-major copies (N_time x N_obj, in the local cache directory) of the given DATA images of a field
+
+    get() then reads all queries for fewer exposures than objects (e.g. time_index or
+    time_actionid for all objects) from these copies, where one exposure is N_obj contiguous
+    values instead of one value in every row of the fits image. The output is identical.
+    Copies that exist and are up to date are kept, so further keys can be added later.
+    Once its fits file changes, get() ignores a copy (with a warning) until transpose() is run again;
+    if only exposures were appended (e.g. a new night), the copy is then extended by the new exposures.
+
+    Parameters
+    ----------
+    fieldname, ngts_version, fnames, root, roots, silent :
+        as in get
+    keys : str or list of str
+        default: TIME_MAJOR_KEYS
+    block_rows : int
+        objects per block while copying (default: ngtsio_cache.TIME_MAJOR_BLOCK)
+
+    Returns
+    -------
+    copies : list of (fname, hdukey) of all time-major copies of the requested keys
+    '''
+
+    if keys is None: keys = TIME_MAJOR_KEYS
+    if isinstance(keys, str): keys = [keys]
+    if block_rows is None: block_rows = ngtsio_cache.TIME_MAJOR_BLOCK
+
+    if ngtsio_cache.CACHE_DIR is None:
+        raise ValueError('transpose needs the local cache directory (ngtsio_cache.CACHE_DIR is None).')
+
+    if (roots is None) and (fnames is None):
+        roots = standard_roots(fieldname, ngts_version, root, silent)
+    if fnames is None:
+        fnames = standard_fnames(fieldname, ngts_version, roots, silent)
+    if fnames is None:
+        raise ValueError('No fits files found for '+str(fieldname)+' '+str(ngts_version)+'.')
+
+    #::: every fits file once (e.g. a megafile is given as several keys)
+    sources = sorted(set( fname for fname in fnames.values() if isinstance(fname, str) and fname.endswith('.fits') and os.path.exists(fname) ))
+
+    copies = []
+    for fname in sources:
+        with fitsio.FITS(fname) as hdulist:
+            for hdu in hdulist:
+                hdukey = hdu.get_extname()
+                #::: DECORR_FLUX3 is called DECORR_FLUX in its file (see fitsio_read_decorr)
+                if (hdukey not in keys) and not (hdukey == 'DECORR_FLUX' and 'DECORR_FLUX3' in keys):
+                    continue
+                if (hdu.get_exttype() != 'IMAGE_HDU') or (len(hdu.get_dims()) != 2) or (0 in hdu.get_dims()):
+                    continue
+                if ngtsio_cache.load_time_major(fname, hdukey) is None:
+                    N_obj, N_time = hdu.get_dims()
+                    #::: in the data type that fitsio returns (e.g. float for scaled integers)
+                    dtype = hdu[0:1, 0:1].dtype
+                    #::: if only exposures were appended (e.g. a new night), only these are read
+                    old = ngtsio_cache.load_outdated_time_major(fname, hdukey)
+                    if (old is not None) and not extends_time_major(old, hdu, (N_obj, N_time), dtype):
+                        old = None
+                    if not ngtsio_cache.save_time_major(fname, hdukey, (N_obj, N_time), dtype,
+                                                        lambda row_start, row_stop, time_start: hdu[row_start:row_stop, time_start:N_time], block_rows, old):
+                        raise IOError('Cannot write to the cache directory '+str(ngtsio_cache.CACHE_DIR)+'.')
+                    if not silent: print('transposed' if old is None else 'extended', hdukey, 'of', fname)
+                copies.append( (fname, hdukey) )
+
+    return copies
+
+
+
+#::: (fname, hdukey) -> state of the directory of the time-major copies of hdukey when none was found for fname
+time_major_missing = {}
+
+
+
+def load_time_major(fname, hdukey):
+    '''
+    the time-major copy of the image hdukey of fname, or None; warns if there is only an outdated one;
+    that there is none is remembered until a copy is added to (or removed from) the cache directory
+    '''
+    state = ngtsio_cache.kind_state('time_major_'+hdukey)
+    if time_major_missing.get( (fname, hdukey), False ) == state:
+        return None
+    data = ngtsio_cache.load_time_major(fname, hdukey)
+    if data is None:
+        time_major_missing[(fname, hdukey)] = state
+        if ngtsio_cache.find_outdated(fname, 'time_major_'+hdukey) is not None:
+            warnings.warn('The time-major copy of '+hdukey+' of '+fname+' is outdated (the file has changed) and is not used; '
+                          'run ngtsio.transpose() to update it (only new exposures are read).')
+    return data
+
+
+
+def extends_time_major(old, hdu, shape, dtype):
+    '''
+    whether the image hdu (N_obj, N_time) is the outdated time-major copy old with exposures appended:
+    same objects, data type and at most as many exposures, and the same first and last exposure
+    '''
+    N_obj, N_time = shape
+    if (old.dtype != dtype) or (old.ndim != 2) or (old.shape[1] != N_obj) or not (0 < old.shape[0] <= N_time):
+        return False
+    for t in (0, old.shape[0]-1):
+        exposure = hdu[:, t:t+1][:,0]
+        same = (exposure == old[t])
+        if exposure.dtype.kind == 'f':
+            same |= np.isnan(exposure) & np.isnan(old[t])
+        if not same.all():
+            return False
+    return True
+
+
+
+def read_time_major(data, ind_objs, ind_time, allobjects, preserve_dtype=False):
+    '''
+    read the requested objects and times from a time-major (N_time, N_obj) copy;
+    the output is identical to fitsio_read_image
+    '''
+    #::: one contiguous row of N_obj values per exposure
+    rows = data[np.asarray(ind_time, dtype=int)]
+    if allobjects == True:
+        return np.ascontiguousarray(rows.T)
+    rows = rows[:, np.asarray(ind_objs, dtype=int)]
+    return np.array(rows.T, dtype=rows.dtype if preserve_dtype else float, order='C')
 
 
 
@@ -1625,19 +2300,16 @@ def fitsio_get_data(fnames, obj_ids, ind_objs, keys, bls_rank, ind_time=slice(No
 def get_canvas_data( fnames, keys, dic ):
     if ('canvas' in fnames) and (fnames['canvas'] is not None):
         #::: load canvasdata
-        canvasdata = np.genfromtxt(fnames['canvas'], dtype=None, names=True)
-        canvas_obj_ids = objid_6digit( canvasdata['OBJ_ID'].astype('|S6') )
+        canvasdata, canvas_obj_ids = get_canvas_table(fnames['canvas'])
+        #::: crossmatch objects (once for all canvaskeys)
+        i_objs, rows_canvas = crossmatch_objids( canvas_obj_ids, dic['OBJ_ID'] )
         #::: cycle through all canvaskeys
         for canvaskey in canvasdata.dtype.names:
             #::: if canvaskey is requested
             if ('CANVAS_' + canvaskey) in keys:
                 #::: initialize dic nan-array
                 dic[ 'CANVAS_' + canvaskey ] = np.zeros( len(dic['OBJ_ID']) ) * np.nan
-
-                #::: crossmatch objects
-                for i, obj_id in enumerate( dic['OBJ_ID'] ):
-                    if obj_id in canvas_obj_ids:
-                        dic[ 'CANVAS_' + canvaskey ][i] = canvasdata[canvaskey][ canvas_obj_ids == obj_id ]
+                dic[ 'CANVAS_' + canvaskey ][i_objs] = canvasdata[canvaskey][rows_canvas]
 
                 #:: rescale period (given in days in canvas)
                 if ('CANVAS_' + canvaskey) == 'CANVAS_PERIOD':
@@ -1645,9 +2317,7 @@ def get_canvas_data( fnames, keys, dic ):
 
                 #::: rescale width (given as fraction of period in canvas)
                 if ('CANVAS_' + canvaskey) == 'CANVAS_WIDTH':
-                    for i, obj_id in enumerate( dic['OBJ_ID'] ):
-                        if obj_id in canvas_obj_ids:
-                            dic[ 'CANVAS_WIDTH' ][i] = ( canvasdata['WIDTH'][ canvas_obj_ids == obj_id ] * canvasdata['PERIOD'][ canvas_obj_ids == obj_id ] ) *24.*3600.
+                    dic[ 'CANVAS_WIDTH' ][i_objs] = ( canvasdata['WIDTH'][rows_canvas] * canvasdata['PERIOD'][rows_canvas] ) *24.*3600.
 
     return dic
 
@@ -1671,54 +2341,45 @@ def simplify_dic(dic):
 ###############################################################################
 # Set flagged values to nan
 ###############################################################################
-def set_nan_dic(dic):
-    if len(dic['OBJ_ID']) == 1:
-        dic = set_nan_single(dic)
-    elif len(dic['OBJ_ID']) > 1:
-        dic = set_nan_multi(dic)
-    return dic
+#::: keys that are replaced with nan where the FLAGS are set
+#::: (not HJD, otherwise the binning will be messed up!!!)
+NAN_KEYS = ['FLUX','FLUX_ERR','FLUX3','FLUX3_ERR',
+            'FLUX4','FLUX4_ERR','FLUX5','FLUX5_ERR',
+            'SYSREM_FLUX3','SYSREM_FLUX3_ERR',
+            'DECORR_FLUX3','DECORR_FLUX3_ERR',
+            'CCDX','CCDX_ERR','CCDY','CCDY_ERR',
+            'CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']
 
 
-#::: if only 1 object is contained in dic
-def set_nan_single(dic):
-    ###### REMOVE BROKEN ITEMS #######
-    #::: nan
-    ind_broken = np.where( dic['FLAGS'] > 0 ) #(dic[key] == 0.) | 
-#    if key in dic: dic[key][ind_broken] = np.nan
-#    dic['HJD'][ind_broken] = np.nan #this is not allowed to be set to nan!!! Otherwise the binning will be messed up!!!
-    for key in ['FLUX','FLUX_ERR','FLUX3','FLUX3_ERR', 
-                'FLUX4','FLUX4_ERR','FLUX5','FLUX5_ERR',
-                'SYSREM_FLUX3','SYSREM_FLUX3_ERR',
-                'DECORR_FLUX3','DECORR_FLUX3_ERR',
-                'CCDX','CCDX_ERR','CCDY','CCDY_ERR',
-                'CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
-        if key in dic: 
-            dic[key][ind_broken] = np.nan
+
+def set_nan_dic(dic, flag_mask=None):
+    '''
+    replace the flagged values of all NAN_KEYS with nan, in place and with one mask for all keys;
+    works on any block of objects/times, as long as dic['FLAGS'] covers the same block
+    '''
+    if len(dic['OBJ_ID']) > 0:
+        ind_broken = get_flagged(dic['FLAGS'], flag_mask)
+        for key in NAN_KEYS:
+            if isinstance(dic.get(key), ngtsio_lazy.FixedPointArray):
+                dic[key].set_nan(ind_broken)
+            elif key in dic:
+                #::: read-only arrays (views into memory-mapped files) are copied before they are modified;
+                #::: all other keys (FLAGS, HJD, ...) stay views
+                if isinstance(dic[key], np.ndarray) and not dic[key].flags.writeable:
+                    dic[key] = np.array(dic[key])
+                np.putmask(dic[key], ind_broken, np.nan)
     return dic
 
 
-#::: if multiple objects are contained in dic
-def set_nan_multi(dic):
-    ###### REMOVE BROKEN ITEMS #######
-    #::: nan
-    N_obj = dic['FLAGS'].shape[0]
-    for obj_nr in range(N_obj):
-        ind_broken = np.where( dic['FLAGS'][obj_nr] > 0 )
-#        if key in dic: dic[key][obj_nr,ind_broken] = np.nan
-#    #    dic['HJD'][ind_broken] = np.nan #this is not allowed to be set to nan!!! Otherwise the binning will be messed up!!!
-#        if 'CCDX' in dic: dic['CCDX'][obj_nr,ind_broken] = np.nan
-#        if 'CCDY' in dic: dic['CCDY'][obj_nr,ind_broken] = np.nan
-#        if 'CENTDX' in dic: dic['CENTDX'][obj_nr,ind_broken] = np.nan
-#        if 'CENTDY' in dic: dic['CENTDY'][obj_nr,ind_broken] = np.nan    
-        for key in ['FLUX','FLUX_ERR','FLUX3','FLUX3_ERR', 
-                'FLUX4','FLUX4_ERR','FLUX5','FLUX5_ERR',
-                'SYSREM_FLUX3','SYSREM_FLUX3_ERR',
-                'DECORR_FLUX3','DECORR_FLUX3_ERR',
-                'CCDX','CCDX_ERR','CCDY','CCDY_ERR',
-                'CENTDX','CENTDX_ERR','CENTDY','CENTDY_ERR']:
-            if key in dic: 
-                dic[key][obj_nr,ind_broken] = np.nan
-    return dic
+
+def get_flagged(flags, flag_mask=None):
+    '''boolean mask of the flagged values: FLAGS > 0, or any of the bits in flag_mask set'''
+    flags = np.asarray(flags)
+    if flag_mask is None:
+        return flags > 0
+    if flags.dtype.kind not in 'iu':
+        flags = flags.astype(np.int64)
+    return np.bitwise_and(flags, flag_mask) != 0
 
 
 
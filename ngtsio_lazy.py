@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:40:21 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import collections
+import numpy as np
+from numpy.lib.mixins import NDArrayOperatorsMixin
+
+
+
+
+###############################################################################
+# Lazily decoded fixed-point images (CCDX/Y, CENTDX/Y)
+###############################################################################
+class FixedPointArray(NDArrayOperatorsMixin):
+    '''
+    An integer-encoded image (CCDX/Y, CENTDX/Y) that is only decoded,
+    (raw + bzero) / precision, when it is accessed (get(..., lazy_decode=True)).
+
+    Indexing decodes the selected values only, e.g. the centroids of a few
+    in-transit points out of an all-object read:
+
+        dic = ngtsio.get('NG0304-1115', 'CYCLE1706', ['CENTDX','FLAGS'], lazy_decode=True)
+        centdx = dic['CENTDX'][ind_objs, ind_transit]
+
+    np.asarray(dic['CENTDX']) decodes everything, and so do arithmetic and numpy
+    functions (dic['CCDX'] - 1., np.nanmedian(dic['CCDX'], axis=1)), which return
+    plain arrays. The raw integers (the attribute raw) stay untouched; values
+    flagged by set_nan are returned as nan. In-place operations (dic['CCDX'] -= 1.)
+    replace the entry by a decoded array.
+    '''
+
+    def __init__(self, raw, bzero, precision, dtype=np.float64):
+        self.raw = raw
+        self.bzero = bzero
+        self.precision = precision
+        self.dtype = np.dtype(dtype)
+        self.mask = None
+
+
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    @property
+    def ndim(self):
+        return self.raw.ndim
+
+    @property
+    def size(self):
+        return self.raw.size
+
+    def __len__(self):
+        return len(self.raw)
+
+
+
+    def __getitem__(self, index):
+        '''decode the selected values only'''
+        data = np.array(self.raw[index], dtype=self.dtype)
+        data += self.bzero
+        data /= self.precision
+        if self.mask is not None:
+            np.putmask(data, self.mask[index], np.nan)
+        if data.ndim == 0:
+            return data[()]
+        return data
+
+
+
+    def __array__(self, dtype=None):
+        '''decode everything'''
+        data = self[...]
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+
+
+    def astype(self, dtype):
+        '''decode everything into dtype'''
+        return np.asarray(self, dtype=dtype)
+
+
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        '''numpy functions and operators work on the decoded values'''
+        if any( isinstance(x, FixedPointArray) for x in kwargs.get('out', ()) ):
+            raise TypeError('FixedPointArray cannot be written to; decode it first (np.asarray)')
+        inputs = [ np.asarray(x) if isinstance(x, FixedPointArray) else x for x in inputs ]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    #::: x -= 1. falls back to x = x - 1., i.e. a decoded array
+    def _inplace(self, other):
+        return NotImplemented
+
+    __iadd__ = __isub__ = __imul__ = __idiv__ = __itruediv__ = __ifloordiv__ = __imod__ = __ipow__ = __imatmul__ = _inplace
+    __ilshift__ = __irshift__ = __iand__ = __ior__ = __ixor__ = _inplace
+
+
+
+    def set_nan(self, mask):
+        '''return nan wherever mask is True (in addition to earlier masks)'''
+        mask = np.reshape(mask, self.raw.shape)
+        if self.mask is None:
+            self.mask = mask
+        else:
+            self.mask = self.mask | mask
+
+
+
+    def __repr__(self):
+        return 'FixedPointArray(shape=%s, dtype=%s, bzero=%s, precision=%s)' % (self.shape, self.dtype, self.bzero, self.precision)
+
+
+
+
+###############################################################################
+# Lazy result dictionary (get(..., lazy=True))
+###############################################################################
+class LazyDict(collections.MutableMapping):
+    '''
+    The dictionary returned by get(..., lazy=True). The objects and times are
+    resolved when it is created, but each key is only read (and set_nan and
+    simplify applied) on first access, and then kept, e.g.
+
+        dic = ngtsio.get('NG0304-1115', 'CYCLE1706', long_list_of_keys, obj_id=46, lazy=True)
+        if dic['PERIOD'] < 86400.:
+            plot(dic['HJD'], dic['SYSREM_FLUX3'])    #only these three keys are read
+
+    It behaves like a dict; dic.loaded() lists the keys that have been read so far.
+    Keys that cannot be read raise a KeyError on first access.
+
+    The files stay open between the reads of the keys; dic.close() closes them,
+    and so does leaving a with block (with ngtsio.get(..., lazy=True) as dic: ...).
+    Keys read after close() open the files again.
+    '''
+
+    def __init__(self, read, keys, data=None, memo=None):
+        self.read = read
+        self.memo = memo
+        self.lazy_keys = []
+        for key in keys:
+            if key not in self.lazy_keys: self.lazy_keys.append(key)
+        self.data = dict(data or {})
+
+
+
+    def __getitem__(self, key):
+        if key not in self.data:
+            if key not in self.lazy_keys:
+                raise KeyError(key)
+            self.data[key] = self.read(key)
+        return self.data[key]
+
+
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+
+
+    def __delitem__(self, key):
+        if (key not in self.data) and (key not in self.lazy_keys):
+            raise KeyError(key)
+        self.data.pop(key, None)
+        if key in self.lazy_keys: self.lazy_keys.remove(key)
+
+
+
+    def __iter__(self):
+        for key in self.lazy_keys:
+            yield key
+        for key in self.data:
+            if key not in self.lazy_keys:
+                yield key
+
+
+
+    def __len__(self):
+        return len(self.lazy_keys) + len([ key for key in self.data if key not in self.lazy_keys ])
+
+
+
+    def __contains__(self, key):
+        return (key in self.lazy_keys) or (key in self.data)
+
+
+
+    def loaded(self):
+        '''the keys that have been read (or set) so far'''
+        return list(self.data)
+
+
+
+    def close(self):
+        '''close the files that the reads of the keys have opened (memo['handles'])'''
+        if self.memo is None:
+            return
+        handles = self.memo.pop('handles', {})
+        self.memo.pop('cache', None)
+        for hdulist in handles.values():
+            hdulist.close()
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+    def __repr__(self):
+        return 'LazyDict(keys=%s, loaded=%s)' % (list(self), self.loaded())
+
+
+
+class LazyMemo(dict):
+    '''what the reads of one LazyDict share (open file handles, cached columns, FLAGS); starts empty again when pickled'''
+
+    def __reduce__(self):
+        return (LazyMemo, ())
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:10:47 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import collections, multiprocessing
+from ngtsio_field import Field
+
+
+
+
+###############################################################################
+# Bulk getter for many fields (process pool)
+###############################################################################
+def get_many(requests, workers=None, fitsreader='fitsio'):
+    '''
+    Get data for many fields/objects at once, spread over a pool of processes.
+
+    Every request is a separate task, and its result is yielded as soon as it
+    has been read. The requests are ordered by field (largest fields first), and
+    each worker keeps the last MAX_FIELDS fields it has read open (ngtsio.Field),
+    so the requests of one field are spread over all workers, and every worker
+    opens each field only once, e.g.
+
+        requests = [ ('NG0304-1115', 'CYCLE1706', ['HJD','SYSREM_FLUX3'], {'obj_id':46}),
+                     ('NG0304-1115', 'CYCLE1706', ['HJD','SYSREM_FLUX3'], {'obj_id':47}),
+                     ('NG0522-2518', 'CYCLE1706', ['HJD','SYSREM_FLUX3'], {'obj_id':'bls'}) ]
+        for i, dic in ngtsio.get_many(requests, workers=32):
+            print requests[i][0], dic['OBJ_ID']
+
+    Parameters
+    ----------
+    requests : list of tuples
+        (fieldname, ngts_version, keys, selection), where selection is a dictionary
+        with any further arguments of ngtsio_get.get (e.g. obj_id, time_index,
+        set_nan, roots, fnames); selection can be omitted
+    workers : int
+        number of processes (default: number of CPUs); with workers=1 everything
+        is read in this process
+    fitsreader : str
+        default fitsreader, unless given in the selection
+
+    Yields
+    ------
+    (i, dic) :
+        the index of the request in requests, and the dictionary returned by get()
+        (or None if the field was not found), in order of completion
+
+    Errors in a worker (including sys.exit() calls of get()) are raised as RuntimeError.
+    '''
+
+    tasks = [ (field_kwargs, item) for field_kwargs, items in group_requests(requests, fitsreader) for item in items ]
+
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(tasks))
+
+    if workers <= 1:
+        try:
+            for task in tasks:
+                yield get_request(task)
+        finally:
+            close_fields()
+
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            for i, dic in pool.imap_unordered(get_request, tasks):
+                yield i, dic
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+
+def group_requests(requests, fitsreader):
+    '''
+    group the requests by field; returns a list of (field_kwargs, [(i, keys, selection), ...]),
+    the largest groups first so that they are started early
+    '''
+
+    groups = collections.OrderedDict()
+
+    for i, request in enumerate(requests):
+        if len(request) == 3:
+            fieldname, ngts_version, keys = request
+            selection = {}
+        else:
+            fieldname, ngts_version, keys, selection = request
+
+        selection = dict(selection)
+        selection.setdefault('fitsreader', fitsreader)
+        field_kwargs = { 'fieldname':fieldname, 'ngts_version':ngts_version,
+                         'fnames':selection.pop('fnames', None), 'root':selection.pop('root', None),
+                         'roots':selection.pop('roots', None), 'silent':True }
+        if isinstance(keys, str): keys = [keys]
+
+        groupkey = repr(sorted(field_kwargs.items()))
+        if groupkey not in groups:
+            groups[groupkey] = (field_kwargs, [])
+        groups[groupkey][1].append( (i, list(keys), selection) )
+
+    return sorted(groups.values(), key=lambda group: len(group[1]), reverse=True)
+
+
+
+#::: number of fields that each worker keeps open
+MAX_FIELDS = 8
+
+#::: the open fields of this worker (most recently used last)
+fields = collections.OrderedDict()
+
+
+
+def get_request(task):
+    '''read one request through the Field of its field, opened once per worker (runs in a worker)'''
+
+    field_kwargs, (i, keys, selection) = task
+
+    try:
+        field = get_field(field_kwargs)
+        selection = dict(selection)
+        selection.setdefault('silent', True)
+        return i, field.get(keys, **selection)
+
+    #::: get() exits on invalid input; make sure this does not take down the worker
+    except (Exception, SystemExit) as e:
+        raise RuntimeError( 'get_many failed for field '+str(field_kwargs['fieldname'])+' '
+                            +str(field_kwargs['ngts_version'])+': '+repr(e) )
+
+
+
+def get_field(field_kwargs):
+    '''the open Field of this worker for field_kwargs; the least recently used one is closed beyond MAX_FIELDS'''
+
+    fieldkey = repr(sorted(field_kwargs.items()))
+    if fieldkey in fields:
+        field = fields.pop(fieldkey)
+    else:
+        field = Field(**field_kwargs)
+    fields[fieldkey] = field
+
+    while len(fields) > MAX_FIELDS:
+        fields.popitem(last=False)[1].close()
+
+    return field
+
+
+
+def close_fields():
+    '''close all open fields of this process'''
+    while len(fields) > 0:
+        fields.popitem(last=False)[1].close()
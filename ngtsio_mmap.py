@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 11:02:15 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import os, collections, threading
+import numpy as np
+
+
+
+
+###############################################################################
+# Memory-mapped reader for uncompressed FITS images (fitsreader='mmap')
+###############################################################################
+'''
+The headers of each file are parsed once, and each image HDU is exposed as a
+read-only numpy.memmap of the data block on disk. Reads are served from the
+page cache, so repeated look-ups of single objects are almost free, and
+contiguous selections are returned as views without any copy.
+
+Note that the returned arrays keep the big-endian dtype of the file, and that
+views into the file are read-only.
+'''
+
+BLOCK = 2880
+
+BITPIX_DTYPES = {8:'>u1', 16:'>i2', 32:'>i4', 64:'>i8', -32:'>f4', -64:'>f8'}
+
+#::: number of memory maps that are kept open at the same time
+MAX_OPEN = 64
+
+hdus_cache = {}
+memmap_cache = collections.OrderedDict()
+
+#::: both caches are shared by all threads (ngtsio.aio, READ_WORKERS)
+cache_lock = threading.Lock()
+
+
+
+
+def read_image(fname, extname, ind_objs, ind_time, allobjects):
+    '''
+    read the requested objects (rows) and times (columns) of an image HDU via numpy.memmap
+
+    Contiguous selections are returned as views into the file, everything else
+    only touches (and copies) the requested pixels.
+    Raises ValueError if the HDU cannot be memory-mapped (e.g. tile-compressed images).
+    '''
+
+    image, bscale, bzero = get_memmap(fname, extname)
+
+    #::: objects
+    if allobjects == True:
+        rows = slice(None)
+    else:
+        rows = as_slice(ind_objs)
+
+    #::: times
+    cols = as_slice(ind_time)
+
+    #::: contiguous selection: view into the file
+    if isinstance(rows, slice) and isinstance(cols, slice):
+        data = np.asarray( image[rows, cols] )
+
+    #::: otherwise only read the requested pixels
+    elif isinstance(rows, slice):
+        data = np.asarray( image[rows][:, np.asarray(ind_time)] )
+    elif isinstance(cols, slice):
+        data = np.asarray( image[:, cols][np.asarray(ind_objs)] )
+    else:
+        data = np.asarray( image[np.ix_(np.asarray(ind_objs), np.asarray(ind_time))] )
+
+    return scale(data, bscale, bzero)
+
+
+
+def as_slice(ind):
+    '''return a slice if the indices are contiguous and increasing, else None'''
+    ind = np.asarray(ind)
+    if len(ind) > 0 and ind[-1]-ind[0] == len(ind)-1 and np.all(np.diff(ind) == 1):
+        return slice( int(ind[0]), int(ind[-1])+1 )
+    else:
+        return None
+
+
+
+def scale(data, bscale, bzero):
+    '''apply BSCALE/BZERO, only to the requested pixels'''
+    if bscale == 1 and bzero == 0:
+        return data
+    #::: unsigned integer convention (e.g. BITPIX=16, BZERO=32768)
+    elif data.dtype.kind == 'i' and bscale == 1 and bzero == 2**(8*data.dtype.itemsize-1):
+        return ( data.astype(np.int64) + int(bzero) ).astype( 'u'+str(data.dtype.itemsize) )
+    elif data.dtype.itemsize <= 2:
+        return data * np.float32(bscale) + np.float32(bzero)
+    else:
+        return data * float(bscale) + float(bzero)
+
+
+
+###############################################################################
+# Memory maps
+###############################################################################
+def get_memmap(fname, extname):
+    '''return (memmap, bscale, bzero) for an image HDU, reusing open memory maps'''
+
+    stat = os.stat(fname)
+    cachekey = (fname, str(extname).upper())
+
+    with cache_lock:
+        cached = memmap_cache.get(cachekey)
+        if (cached is not None) and (cached[0] == (stat.st_mtime, stat.st_size)):
+            #::: most recently used (move_to_end)
+            del memmap_cache[cachekey]
+            memmap_cache[cachekey] = cached
+            return cached[1:]
+
+    hdu = get_hdu(fname, extname)
+
+    if hdu['ZIMAGE'] or (hdu['XTENSION'] not in ('', 'IMAGE')):
+        raise ValueError('HDU '+str(extname)+' of '+fname+' is not an uncompressed image.')
+    if hdu['BITPIX'] not in BITPIX_DTYPES:
+        raise ValueError('BITPIX '+str(hdu['BITPIX'])+' of '+fname+' not understood.')
+    if len(hdu['SHAPE']) != 2:
+        raise ValueError('HDU '+str(extname)+' of '+fname+' is not a 2D image.')
+
+    image = np.memmap(fname, dtype=BITPIX_DTYPES[hdu['BITPIX']], mode='r',
+                      offset=hdu['OFFSET'], shape=hdu['SHAPE'])
+
+    with cache_lock:
+        memmap_cache.pop(cachekey, None)
+        memmap_cache[cachekey] = ((stat.st_mtime, stat.st_size), image, hdu['BSCALE'], hdu['BZERO'])
+        while len(memmap_cache) > MAX_OPEN:
+            memmap_cache.popitem(last=False)
+
+    return image, hdu['BSCALE'], hdu['BZERO']
+
+
+
+def get_hdu(fname, extname):
+    '''find an HDU by its EXTNAME (case insensitive, like fitsio) or by its number'''
+    hdus = get_hdus(fname)
+    if isinstance(extname, int):
+        return hdus[extname]
+    for hdu in hdus:
+        if hdu['EXTNAME'].upper() == str(extname).upper():
+            return hdu
+    raise ValueError('Extension '+str(extname)+' not found in '+fname+'.')
+
+
+
+###############################################################################
+# FITS header parsing
+###############################################################################
+def get_hdus(fname):
+    '''parse all headers of a FITS file once, cached by file modification time and size'''
+
+    stat = os.stat(fname)
+    fingerprint = (stat.st_mtime, stat.st_size)
+
+    with cache_lock:
+        cached = hdus_cache.get(fname)
+    if (cached is not None) and (cached[0] == fingerprint):
+        return cached[1]
+
+    hdus = []
+    with open(fname, 'rb') as f:
+        offset = 0
+        while offset < stat.st_size:
+            f.seek(offset)
+            cards, N_blocks = read_header(f)
+            if cards is None:
+                break
+            hdu = parse_header(cards)
+            hdu['OFFSET'] = offset + N_blocks*BLOCK
+            hdus.append(hdu)
+            N_data_blocks = (hdu['NBYTES'] + BLOCK - 1) // BLOCK
+            offset = hdu['OFFSET'] + N_data_blocks*BLOCK
+
+    with cache_lock:
+        hdus_cache[fname] = (fingerprint, hdus)
+
+    return hdus
+
+
+
+def read_header(f):
+    '''read 2880-byte header blocks until the END card, return the cards and the number of blocks'''
+    cards = []
+    N_blocks = 0
+    while True:
+        block = f.read(BLOCK)
+        if len(block) < BLOCK:
+            return None, N_blocks
+        N_blocks += 1
+        block = block.decode('ascii', 'replace')
+        for i in range(0, BLOCK, 80):
+            card = block[i:i+80]
+            if card[:8].strip() == 'END':
+                return cards, N_blocks
+            cards.append(card)
+
+
+
+def parse_header(cards):
+    '''extract the keywords needed to locate and interpret the data block'''
+
+    header = {}
+    for card in cards:
+        key = card[:8].strip()
+        if card[8:10] == '= ' and key not in header:
+            header[key] = parse_value(card[10:])
+
+    hdu = {}
+    hdu['XTENSION'] = str(header.get('XTENSION', '')).strip().upper()
+    hdu['EXTNAME'] = str(header.get('EXTNAME', '')).strip()
+    hdu['ZIMAGE'] = header.get('ZIMAGE', False) is True
+    hdu['BITPIX'] = int(header['BITPIX'])
+    hdu['BSCALE'] = header.get('BSCALE', 1)
+    hdu['BZERO'] = header.get('BZERO', 0)
+
+    naxes = [ int(header['NAXIS'+str(i+1)]) for i in range(int(header['NAXIS'])) ]
+    hdu['SHAPE'] = tuple(naxes[::-1]) #FITS axis order is reversed with respect to numpy
+
+    pcount = int(header.get('PCOUNT', 0))
+    gcount = int(header.get('GCOUNT', 1))
+    if len(naxes) == 0:
+        hdu['NBYTES'] = 0
+    else:
+        hdu['NBYTES'] = abs(hdu['BITPIX'])//8 * gcount * (pcount + int(np.prod(naxes)))
+
+    return hdu
+
+
+
+def parse_value(text):
+    '''parse the value of a header card (strings, logicals, integers and floats)'''
+    text = text.strip()
+    if text.startswith("'"):
+        end = text.find("'", 1)
+        while end != -1 and text[end+1:end+2] == "'":
+            end = text.find("'", end+2)
+        return text[1:end].replace("''", "'").rstrip()
+    value = text.split('/')[0].strip()
+    if value == 'T':
+        return True
+    elif value == 'F':
+        return False
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return float(value.replace('D','E'))
+        except ValueError:
+            return value
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:04:47 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import os, sys, collections, threading, contextlib
+import numpy as np
+import ngtsio_cache
+
+
+
+
+###############################################################################
+# In-memory cache of get() results
+###############################################################################
+'''
+If MAX_BYTES > 0, get() keeps the values it returns in memory, per key, and
+identical requests are answered from memory, e.g. when flipping between plots
+of the same object. Each key is cached separately, so a request that shares
+some keys with an earlier one only reads the other keys.
+
+An entry is identified by the field, version, the files (and their modification
+times and sizes), the key, and all parameters that change its value (objects,
+times, bls_rank, indexing, fitsreader, simplify, set_nan, flag_mask, preserve_dtype).
+The least recently used entries are dropped once all entries together hold more
+than MAX_BYTES; hits and misses are counted (see info()).
+
+The cache holds read-only copies of the arrays: get() returns the arrays it
+has read on a miss and a fresh copy on a hit, so callers may modify them in
+place (dic['FLUX3'] -= 1.) without changing what later requests receive.
+
+Off by default; set NGTSIO_RESULT_CACHE_MB (or ngtsio_results.MAX_BYTES) to use it.
+Requests with lazy=True or lazy_decode=True are never cached.
+'''
+MAX_BYTES = int( float(os.environ.get('NGTSIO_RESULT_CACHE_MB', 0)) * 2**20 )
+
+entries = collections.OrderedDict()
+counts = {'hits':0, 'misses':0, 'bytes':0}
+lock = threading.Lock()
+local = threading.local()
+
+MISSING = object()
+
+
+
+def enabled():
+    '''whether get() should go through the cache (not for the reads of the cache itself)'''
+    return (MAX_BYTES > 0) and not getattr(local, 'reading', False)
+
+
+
+@contextlib.contextmanager
+def reading():
+    '''get() calls within this context (in this thread) bypass the cache'''
+    previous = getattr(local, 'reading', False)
+    local.reading = True
+    try:
+        yield
+    finally:
+        local.reading = previous
+
+
+
+def lookup(cachekey):
+    '''a (writable) copy of the cached value, or MISSING'''
+    with lock:
+        if cachekey in entries:
+            value, nbytes = entries.pop(cachekey)
+            entries[cachekey] = (value, nbytes)
+            counts['hits'] += 1
+        else:
+            counts['misses'] += 1
+            return MISSING
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    return value
+
+
+
+def store(cachekey, value):
+    '''cache a read-only copy of value and drop the least recently used entries beyond MAX_BYTES; returns value itself'''
+    nbytes = value.nbytes if isinstance(value, (np.ndarray, np.generic)) else sys.getsizeof(value)
+    if nbytes > MAX_BYTES:
+        return value
+    cached = value
+    if isinstance(value, np.ndarray):
+        cached = value.copy()
+        cached.flags.writeable = False
+    with lock:
+        if cachekey in entries:
+            counts['bytes'] -= entries.pop(cachekey)[1]
+        entries[cachekey] = (cached, nbytes)
+        counts['bytes'] += nbytes
+        while counts['bytes'] > MAX_BYTES:
+            counts['bytes'] -= entries.popitem(last=False)[1][1]
+    return value
+
+
+
+def info():
+    '''hits, misses, number of entries, bytes in use and MAX_BYTES'''
+    with lock:
+        return {'hits':counts['hits'], 'misses':counts['misses'], 'entries':len(entries),
+                'bytes':counts['bytes'], 'max_bytes':MAX_BYTES}
+
+
+
+def clear():
+    '''drop all entries and reset the counters'''
+    with lock:
+        entries.clear()
+        counts.update(hits=0, misses=0, bytes=0)
+
+
+
+def file_state(fnames, selection):
+    '''the files of a request (fnames, and text files given as object/time selections) with their modification times and sizes'''
+    files = set()
+    for fname in list(fnames.values()) + list(selection.values()):
+        for f in (fname if isinstance(fname, list) else [fname]):
+            if isinstance(f, str) and os.path.isfile(f):
+                files.add(f)
+    return tuple( (f, ngtsio_cache.fingerprint(f)) for f in sorted(files) )
+
+
+
+def freeze(value):
+    '''hashable version of (nested) request arguments, to recognise identical requests'''
+    if isinstance(value, dict):
+        return tuple( (key, freeze(value[key])) for key in sorted(value) )
+    elif isinstance(value, np.ndarray):
+        return ('ndarray', value.dtype.str, value.shape, value.tobytes())
+    elif isinstance(value, (list, tuple)):
+        return tuple( freeze(x) for x in value )
+    else:
+        return value
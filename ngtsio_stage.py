@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 19:31:08 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import os, glob, time, shutil, hashlib, tempfile, contextlib, warnings
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+
+
+###############################################################################
+# Local staging of remote fits files (e.g. the prodstore on NFS)
+###############################################################################
+'''
+If STAGE_DIR is set, every fits file that get() opens is first copied into
+STAGE_DIR (on a local disk), and all reads are served from the local copy.
+Repeated analyses of the same fields then only pull each file over the network
+once.
+
+- The name of each copy contains the modification time and size of its source
+  file, so a copy is replaced as soon as the source file changes.
+- STAGE_DIR holds at most STAGE_MAX_BYTES; the least recently used copies are
+  removed first. Files larger than STAGE_MAX_BYTES are always read directly.
+- Several processes on the same node can share STAGE_DIR: each file is copied
+  by one process only (file locks), copies appear atomically, and copies that
+  are removed while another process reads them stay readable for that process.
+  A copy that is removed between local_fname and opening it is read from the
+  source file instead (open_local).
+- Temporary files of copies that were never finished (e.g. after a crash) are
+  removed once they have not been written to for STAGE_TMP_MAX_AGE seconds, and
+  the lock files of removed copies are removed with them.
+
+Staging is off by default. Set NGTSIO_STAGE_DIR (or ngtsio_stage.STAGE_DIR) to
+a local directory to use it, and NGTSIO_STAGE_MAX_GB (or ngtsio_stage.STAGE_MAX_BYTES)
+to limit its size (default: 100 GB).
+'''
+STAGE_DIR = os.environ.get('NGTSIO_STAGE_DIR', None)
+STAGE_MAX_BYTES = int( float(os.environ.get('NGTSIO_STAGE_MAX_GB', 100)) * 2**30 )
+
+#::: files are copied in blocks of this many bytes
+COPY_BLOCK = 2**24
+
+#::: temporary files (of unfinished copies) that have not been written to for this many seconds are removed
+STAGE_TMP_MAX_AGE = 3600
+
+
+
+def open_local(fname, open_file):
+    '''
+    open_file(local copy of fname); if the copy has been removed in the meantime
+    (e.g. by another process making room), open_file(fname) instead
+    '''
+    stagedfname = local_fname(fname)
+    try:
+        return open_file(stagedfname)
+    except (IOError, OSError):
+        if stagedfname == fname:
+            raise
+        return open_file(fname)
+
+
+
+def local_fname(fname):
+    '''
+    the local copy of fname (copied on first use), or fname itself if staging is off,
+    the file is larger than STAGE_MAX_BYTES, or it cannot be staged
+    '''
+    if STAGE_DIR is None:
+        return fname
+
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return fname
+    if stat.st_size > STAGE_MAX_BYTES:
+        return fname
+
+    stagedfname = staged_fname(fname, stat)
+    try:
+        #::: the modification time of a copy is the time it was last used (for the LRU order)
+        os.utime(stagedfname, None)
+        return stagedfname
+    except OSError:
+        pass
+
+    try:
+        return stage(fname, stat, stagedfname)
+    except (IOError, OSError) as e:
+        warnings.warn('Cannot stage '+fname+' into '+str(STAGE_DIR)+' ('+str(e)+'), reading it directly.')
+        return fname
+
+
+
+def staged_fname(fname, stat):
+    '''name of the local copy of the (current version of the) file fname'''
+    name = hashlib.md5( os.path.abspath(fname).encode('utf-8') ).hexdigest()
+    return os.path.join( STAGE_DIR, '%s_%d_%d%s' % (name, int(stat.st_mtime*1e6), stat.st_size, os.path.splitext(fname)[1]) )
+
+
+
+def stage(fname, stat, stagedfname):
+    '''copy fname to stagedfname (once, if several processes want it at the same time), after making room for it'''
+
+    if not os.path.exists(STAGE_DIR):
+        try: os.makedirs(STAGE_DIR)
+        except OSError:
+            if not os.path.isdir(STAGE_DIR): raise
+
+    name = os.path.basename(stagedfname).split('_',1)[0]
+
+    with locked( os.path.join(STAGE_DIR, '.'+name+'.lock') ):
+
+        #::: another process may have copied it while this one was waiting
+        if os.path.exists(stagedfname):
+            os.utime(stagedfname, None)
+            return stagedfname
+
+        make_room(stat.st_size)
+
+        fd, tmpfname = tempfile.mkstemp(dir=STAGE_DIR, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                with open(fname, 'rb') as f:
+                    shutil.copyfileobj(f, out, COPY_BLOCK)
+            stat_after = os.stat(fname)
+            if (stat_after.st_mtime, stat_after.st_size) != (stat.st_mtime, stat.st_size):
+                raise IOError('the file changed while it was copied')
+            #::: readable as any other new file (mkstemp creates it private)
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmpfname, 0o666 & ~umask)
+            os.rename(tmpfname, stagedfname)
+        except:
+            if os.path.exists(tmpfname): os.remove(tmpfname)
+            raise
+
+    #::: copies of older versions of the file
+    for oldfname in glob.glob( os.path.join(STAGE_DIR, name+'_*') ):
+        if oldfname != stagedfname:
+            try: os.remove(oldfname)
+            except OSError: pass
+
+    return stagedfname
+
+
+
+def make_room(nbytes):
+    '''remove the least recently used copies until nbytes more fit into STAGE_MAX_BYTES'''
+
+    with locked( os.path.join(STAGE_DIR, '.lock') ):
+
+        copies = []
+        locks = []
+        total = 0
+        now = time.time()
+        for entry in os.listdir(STAGE_DIR):
+            if entry.endswith('.lock'):
+                if entry != '.lock': locks.append(entry)
+                continue
+            try:
+                stat = os.stat(os.path.join(STAGE_DIR, entry))
+            except OSError:
+                continue
+            #::: copies that are being written (by this or other processes) count, but are never removed,
+            #::: unless they have been abandoned
+            if entry.startswith('.'):
+                if now - stat.st_mtime > STAGE_TMP_MAX_AGE:
+                    try:
+                        os.remove(os.path.join(STAGE_DIR, entry))
+                        continue
+                    except OSError:
+                        pass
+            else:
+                copies.append( (stat.st_mtime, stat.st_size, entry) )
+            total += stat.st_size
+
+        for mtime, size, entry in sorted(copies):
+            if total + nbytes <= STAGE_MAX_BYTES:
+                break
+            try:
+                os.remove(os.path.join(STAGE_DIR, entry))
+                total -= size
+                copies.remove( (mtime, size, entry) )
+            except OSError:
+                pass
+
+        #::: lock files of files without a copy
+        names = set( entry.split('_',1)[0] for mtime, size, entry in copies )
+        for entry in locks:
+            if entry[1:-len('.lock')] not in names:
+                remove_lock( os.path.join(STAGE_DIR, entry) )
+
+
+
+@contextlib.contextmanager
+def locked(lockfname):
+    '''hold an exclusive lock on lockfname (shared by all processes on this node; no lock without fcntl)'''
+    if fcntl is None:
+        yield
+        return
+    while True:
+        f = open(lockfname, 'a')
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        #::: the lock file may have been removed (remove_lock) while this process was waiting for it
+        try:
+            if os.fstat(f.fileno()).st_ino == os.stat(lockfname).st_ino:
+                break
+        except OSError:
+            pass
+        f.close()
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
+
+
+
+def remove_lock(lockfname):
+    '''remove a lock file, unless a process holds it right now'''
+    if fcntl is None:
+        return
+    try:
+        with open(lockfname, 'a') as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                return
+            os.remove(lockfname)
+    except (IOError, OSError):
+        pass
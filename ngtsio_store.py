@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:12:40 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import os, glob, json, tempfile, threading, warnings
+import numpy as np
+import fitsio
+import ngtsio_cache
+import ngtsio_get
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+
+
+###############################################################################
+# Chunked HDF5 stores of whole fields (ngtsio.convert)
+###############################################################################
+'''
+convert() copies all fits files of a field and version (CATALOGUE, IMAGELIST,
+all DATA images, SYSREM, DECORR, BLS incl. CANDIDATES, ...) into one HDF5 file
+in STORE_DIR. Images are stored in compressed chunks of obj_chunk objects x
+time_chunk exposures, table columns in chunks of TABLE_CHUNK rows, so that
+single objects or short time windows only touch a few chunks, and the whole
+field is opened once instead of one cfitsio open per key file.
+
+get() reads from the store transparently (fitsreader='fitsio' and 'mmap'):
+every fits file that has been converted, and has not changed since (modification
+time and size), is read from the store instead. fitsreader='pyfits' always reads
+the fits files.
+
+Set NGTSIO_STORE_DIR (or ngtsio_store.STORE_DIR) to move the stores, or set
+ngtsio_store.STORE_DIR = None to never read from them. Needs h5py.
+'''
+STORE_DIR = os.environ.get( 'NGTSIO_STORE_DIR', os.path.join(os.path.expanduser('~'), '.ngtsio_stores') )
+
+#::: default chunk shape of images (objects x exposures)
+OBJ_CHUNK = 8
+TIME_CHUNK = 4096
+
+#::: chunk length of table columns (rows)
+TABLE_CHUNK = 4096
+
+#::: images are copied in blocks of about this many bytes
+COPY_BLOCK = 2**26
+
+#::: the stores in STORE_DIR, and the open stores of this process
+stores = {'mtime':None, 'sources':{}, 'pid':None, 'files':{}}
+stores_lock = threading.Lock()
+
+
+
+def convert(fieldname, ngts_version, outfname=None, obj_chunk=OBJ_CHUNK, time_chunk=TIME_CHUNK,
+            compression='gzip', compression_opts=1, fnames=None, root=None, roots=None, silent=False):
+    '''
+    convert all fits files of a field and version into one chunked, compressed HDF5 store
+
+    Parameters
+    ----------
+    fieldname, ngts_version, fnames, root, roots, silent :
+        as in ngtsio_get.get
+    outfname : str
+        default: STORE_DIR/fieldname_ngts_version.h5 (where get() finds it)
+    obj_chunk, time_chunk : int
+        chunk shape of the images; small obj_chunk favours single objects,
+        small time_chunk favours short time windows
+    compression, compression_opts :
+        HDF5 filter of all datasets, e.g. 'gzip' and its level 0-9, 'lzf' and None, or None
+
+    Returns
+    -------
+    outfname : str
+    '''
+
+    if h5py is None:
+        raise ImportError('ngtsio.convert needs h5py.')
+
+    if (roots is None) and (fnames is None):
+        roots = ngtsio_get.standard_roots(fieldname, ngts_version, root, silent)
+    if fnames is None:
+        fnames = ngtsio_get.standard_fnames(fieldname, ngts_version, roots, silent)
+    if fnames is None:
+        raise ValueError('No fits files found for '+str(fieldname)+' '+str(ngts_version)+'.')
+
+    if outfname is None:
+        outfname = store_fname(fieldname, ngts_version)
+
+    #::: every fits file once (e.g. a megafile is given as several keys)
+    sources = {}
+    for key in sorted(fnames):
+        fname = fnames[key]
+        if isinstance(fname, str) and fname.endswith('.fits') and os.path.exists(fname):
+            fname = os.path.abspath(fname)
+            if fname not in sources:
+                sources[fname] = os.path.basename(fname)
+                while list(sources.values()).count(sources[fname]) > 1: sources[fname] = '_' + sources[fname]
+
+    filters = { 'compression':compression, 'compression_opts':compression_opts, 'shuffle':compression is not None }
+    if compression is None: del filters['compression_opts']
+
+    #::: written to a temporary file first, so that get() never sees a half-written store
+    if not os.path.exists(os.path.dirname(os.path.abspath(outfname))): os.makedirs(os.path.dirname(os.path.abspath(outfname)))
+    fd, tmpfname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(outfname)), suffix='.tmp')
+    os.close(fd)
+    try:
+        converted = {}
+        with h5py.File(tmpfname, 'w') as f:
+            f.attrs['fieldname'] = str(fieldname)
+            f.attrs['ngts_version'] = str(ngts_version)
+            for fname in sorted(sources):
+                fingerprint = ngtsio_cache.fingerprint(fname)
+                try:
+                    convert_fits(fname, f.create_group(sources[fname]), obj_chunk, time_chunk, filters)
+                except (TypeError, ValueError) as e:
+                    #::: e.g. variable length columns; this file is then always read from the fits file
+                    warnings.warn(fname+' cannot be stored and is skipped ('+str(e)+').')
+                    del f[sources[fname]]
+                    continue
+                converted[fname] = [sources[fname], fingerprint]
+                if not silent: print('converted', fname)
+            f.attrs['sources'] = json.dumps(converted)
+        #::: readable as any other new file (mkstemp creates it private)
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmpfname, 0o666 & ~umask)
+        os.rename(tmpfname, outfname)
+    except:
+        if os.path.exists(tmpfname): os.remove(tmpfname)
+        raise
+
+    #::: look at the stores again on the next read
+    with stores_lock:
+        stores['mtime'] = None
+
+    return outfname
+
+
+
+def convert_fits(fname, group, obj_chunk, time_chunk, filters):
+    '''copy all HDUs of a fits file into an HDF5 group, one subgroup per HDU ('0', '1', ...)'''
+
+    with fitsio.FITS(fname, vstorage='object') as hdulist:
+        for j, hdu in enumerate(hdulist):
+            g = group.create_group(str(j))
+            g.attrs['extname'] = str(hdu.get_extname())
+
+            if hdu.get_exttype() == 'IMAGE_HDU':
+                dims = hdu.get_dims() if hdu.has_data() else []
+                if len(dims) == 0:
+                    g.attrs['kind'] = 'empty'
+                elif len(dims) == 2:
+                    g.attrs['kind'] = 'image'
+                    convert_image(hdu, g, dims, obj_chunk, time_chunk, filters)
+                else:
+                    g.attrs['kind'] = 'image'
+                    g.create_dataset('data', data=hdu.read(), chunks=True, **filters)
+
+            else:
+                g.attrs['kind'] = 'table'
+                g.attrs['nrows'] = int(hdu.get_nrows())
+                colnames = [ str(x) for x in hdu.get_colnames() ]
+                g.attrs['colnames'] = json.dumps(colnames)
+                for k, column in enumerate(colnames):
+                    data = hdu.read(columns=column)
+                    if data.dtype.kind == 'O':
+                        raise TypeError('column '+column+' has variable length')
+                    if len(data) == 0:
+                        g.create_dataset('col%d' % k, data=data)
+                    else:
+                        g.create_dataset('col%d' % k, data=data, chunks=(min(TABLE_CHUNK, len(data)),)+data.shape[1:], **filters)
+
+
+
+def convert_image(hdu, g, dims, obj_chunk, time_chunk, filters):
+    '''copy a 2-D image in blocks of rows (whole chunks), so that big images never have to fit into memory'''
+    chunks = ( min(obj_chunk, dims[0]), min(time_chunk, dims[1]) )
+    dset = None
+    step = None
+    row = 0
+    while row < dims[0]:
+        if step is None:
+            block = hdu[0:chunks[0], :]
+            step = chunks[0] * max( 1, int( COPY_BLOCK // (chunks[0]*dims[1]*block.dtype.itemsize) ) )
+            dset = g.create_dataset('data', shape=tuple(dims), dtype=block.dtype, chunks=chunks, **filters)
+        else:
+            block = hdu[row:min(row+step, dims[0]), :]
+        dset[row:row+len(block)] = block
+        row += len(block)
+
+
+
+def store_fname(fieldname, ngts_version):
+    return os.path.join( STORE_DIR, str(fieldname)+'_'+str(ngts_version)+'.h5' )
+
+
+
+
+###############################################################################
+# Reading from stores (used by ngtsio_get.fitsio_open)
+###############################################################################
+def open_source(fname):
+    '''the StoreFile of the fits file fname if it has been converted into a store and not changed since, otherwise None'''
+
+    if (h5py is None) or (STORE_DIR is None):
+        return None
+
+    entry = get_sources().get( os.path.abspath(fname) )
+    if entry is None:
+        return None
+
+    storefname, group, fingerprint = entry
+    try:
+        if ngtsio_cache.fingerprint(fname) != fingerprint:
+            return None
+        return StoreFile(storefname, group)
+    except (IOError, OSError, KeyError):
+        return None
+
+
+
+def get_sources():
+    '''fits file -> (store, group, fingerprint) of all stores in STORE_DIR; scanned again whenever STORE_DIR changes'''
+
+    try:
+        mtime = os.stat(STORE_DIR).st_mtime
+    except OSError:
+        return {}
+
+    with stores_lock:
+        if stores['mtime'] != mtime:
+            sources = {}
+            for storefname in sorted(glob.glob(os.path.join(STORE_DIR, '*.h5'))):
+                try:
+                    with h5py.File(storefname, 'r') as f:
+                        converted = json.loads(f.attrs['sources'])
+                except (IOError, OSError, KeyError, ValueError):
+                    continue
+                for fname, (group, fingerprint) in converted.items():
+                    sources[ngtsio_cache.native_str(fname)] = (storefname, ngtsio_cache.native_str(group), fingerprint)
+            stores['mtime'], stores['sources'] = mtime, sources
+            stores['files'] = {}
+        return stores['sources']
+
+
+
+def get_store_hdus(storefname, group):
+    '''the HDUs of one converted fits file; every store is opened once per process, and shared by all reads'''
+    with stores_lock:
+        #::: open HDF5 files are not inherited by forked processes (e.g. get_many)
+        if stores['pid'] != os.getpid():
+            stores['pid'], stores['files'] = os.getpid(), {}
+        files = stores['files']
+        if storefname not in files:
+            files[storefname] = ( h5py.File(storefname, 'r'), {} )
+        f, groups = files[storefname]
+        if group not in groups:
+            groups[group] = [ StoreHDU(f[group][str(j)]) for j in range(len(f[group])) ]
+        return groups[group]
+
+
+
+class StoreFile(object):
+    '''one converted fits file inside a store, with the part of the interface of fitsio.FITS that ngtsio uses'''
+
+    def __init__(self, storefname, group):
+        self.hdus = get_store_hdus(storefname, group)
+
+
+
+    def __getitem__(self, ext):
+        '''HDU by number or EXTNAME (case-insensitive, as in fitsio)'''
+        if isinstance(ext, (int, np.integer)):
+            return self.hdus[ext]
+        for hdu in self.hdus:
+            if hdu.get_extname().upper() == str(ext).upper():
+                return hdu
+        raise IOError('extension not found: '+str(ext))
+
+
+
+    def close(self):
+        '''nothing to do, the store stays open (see get_store_hdus)'''
+        pass
+
+
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+class StoreHDU(object):
+    '''one HDU inside a store, with the part of the interface of fitsio's HDUs that ngtsio uses'''
+
+    def __init__(self, group):
+        self.extname = ngtsio_cache.native_str(group.attrs['extname'])
+        self.kind = ngtsio_cache.native_str(group.attrs['kind'])
+        if self.kind == 'table':
+            self.colnames = [ ngtsio_cache.native_str(x) for x in json.loads(group.attrs['colnames']) ]
+            self.nrows = int(group.attrs['nrows'])
+            self.columns = [ group['col%d' % k] for k in range(len(self.colnames)) ]
+        elif self.kind == 'image':
+            self.data = group['data']
+
+
+
+    def get_extname(self):
+        return self.extname
+
+
+
+    def get_colnames(self):
+        return list(self.colnames)
+
+
+
+    def get_nrows(self):
+        return self.nrows
+
+
+
+    def read(self, columns=None, rows=None):
+        '''
+        as fitsio: an image, or (rows of) one table column (columns is a str) or several columns (as a structured array);
+        rows are read sorted and unique
+        '''
+
+        if self.kind != 'table':
+            return self.data[...]
+
+        if rows is not None:
+            rows = np.unique( np.array(rows, ndmin=1, dtype='i8') )
+            if (len(rows) > 0) and ((rows[0] < 0) or (rows[-1] > self.nrows-1)):
+                raise ValueError('rows must be in [%d,%d]' % (0, self.nrows-1))
+
+        if isinstance(columns, str):
+            return self.read_column(columns, rows)
+
+        if columns is None:
+            columns = self.colnames
+        columns = [ str(x) for x in np.atleast_1d(columns) ]
+        data = [ self.read_column(column, rows) for column in columns ]
+        out = np.zeros( len(data[0]), dtype=[ (column, x.dtype, x.shape[1:]) for column, x in zip(columns, data) ] )
+        for column, x in zip(columns, data):
+            out[column] = x
+        return out
+
+
+
+    def read_column(self, column, rows=None):
+        '''(sorted, unique) rows of one column; only the chunks that hold any of the rows are read'''
+        dset = self.columns[ self.colnames.index(column) ]
+        if rows is None:
+            return dset[...]
+        if len(rows) == 0:
+            return dset[0:0]
+        #::: rows at most one chunk apart share a run, as the span between them touches no further chunk
+        chunk = (dset.chunks or (TABLE_CHUNK,))[0]
+        runs = ngtsio_get.get_runs(rows, max_gap=chunk-1)
+        return np.concatenate([ dset[start:stop][ rows[i_start:i_stop] - start ] for start, stop, i_start, i_stop in runs ])
+
+
+
+    def __getitem__(self, index):
+        '''image slices as in fitsio (integers keep their dimension), e.g. hdu[0,:] or hdu[10:20, 100:200]'''
+        if not isinstance(index, tuple):
+            index = (index,)
+        index = tuple( slice(i, i+1) if isinstance(i, (int, np.integer)) else i for i in index )
+        return self.data[index]
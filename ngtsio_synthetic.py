@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:40:12 2026
+
+@author:
+Maximilian N. Guenther
+Battcock Centre for Experimental Astrophysics,
+Cavendish Laboratory,
+JJ Thomson Avenue
+Cambridge CB3 0HE
+Email: mg719@cam.ac.uk
+"""
+
+import os, datetime
+import numpy as np
+import fitsio
+
+
+
+
+###############################################################################
+# Synthetic prodstore trees (for benchmarks and tests without real NGTS data)
+###############################################################################
+
+DATA_KEYS = ['HJD','FLUX3','FLUX3_ERR','FLAGS','CCDX','CCDY','CENTDX','CENTDX_ERR',
+             'CENTDY','CENTDY_ERR','SKYBKG']
+
+#::: first night and first action ID of the synthetic data; HJD starts at day START_HJD (in s as in NGTS files)
+START_DATE = '2015-11-04'
+START_ACTIONID = 108583
+START_HJD = 674
+
+
+
+def make_prodstore(outdir, fieldname='NG0304-1115', ngts_version='CYCLE1706',
+                   N_obj=1000, N_time=2000, N_nights=20, N_cands=50,
+                   seed=42):
+    '''
+    write a synthetic prodstore tree for one field and one version
+
+    Parameters
+    ----------
+    outdir : str
+        directory that takes the role of 'prodstore/', e.g. '/tmp/prodstore'
+    N_obj, N_time : int
+        size of all DATA images (N_obj x N_time)
+    N_nights : int
+        the N_time exposures are spread evenly over this many nights
+    N_cands : int
+        number of BLS candidates (5 ranks each)
+
+    The field has N_nights nights from START_DATE on, one action ID per night,
+    and a CANVAS text file with every second BLS candidate (see canvas_fname).
+
+    Returns
+    -------
+    roots : dict
+        the directories, as they would be found by ngtsio_get.standard_roots
+    '''
+
+    rng = np.random.RandomState(seed)
+
+    roots = {}
+    for pipe, key in [('MergePipe','nights'), ('SysremPipe','sysrem'),
+                      ('BLSPipe','bls'), ('DecorrPipe','decorr')]:
+        roots[key] = os.path.join( outdir, '0001', pipe+'_0_0_0_'+fieldname+'_'+ngts_version )
+        if not os.path.exists(roots[key]): os.makedirs(roots[key])
+
+    #::: CATALOGUE
+    obj_ids = np.array([ '%06d' % (i+1) for i in range(N_obj) ])
+    ra_fc, dec_fc = field_center(fieldname)
+    catalogue = np.zeros(N_obj, dtype=[('OBJ_ID','S26'),('RA','f8'),('DEC','f8'),
+                                       ('FLUX_MEAN','f8'),('MAG_MEAN','f8'),('CCD_X','f8'),('CCD_Y','f8')])
+    catalogue['OBJ_ID'] = obj_ids
+    catalogue['RA'] = ra_fc + rng.uniform(-1.,1.,N_obj)
+    catalogue['DEC'] = dec_fc + rng.uniform(-1.,1.,N_obj)
+    catalogue['FLUX_MEAN'] = 10**rng.uniform(2,5,N_obj)
+    catalogue['MAG_MEAN'] = 8. + rng.uniform(0,8,N_obj)
+    catalogue['CCD_X'] = rng.uniform(0,2048,N_obj)
+    catalogue['CCD_Y'] = rng.uniform(0,2048,N_obj)
+    write_table( fname(roots['nights'], fieldname, 'CATALOGUE'), catalogue, 'CATALOGUE' )
+
+    #::: IMAGELIST
+    night = np.repeat( np.arange(N_nights), int(np.ceil(1.*N_time/N_nights)) )[:N_time]
+    date0 = datetime.datetime.strptime(START_DATE, '%Y-%m-%d')
+    dates = [ (date0 + datetime.timedelta(days=int(n))).strftime('%Y-%m-%d') for n in range(N_nights) ]
+    hjd = ( START_HJD + night + np.tile(np.linspace(0.,0.4,int(np.ceil(1.*N_time/N_nights))), N_nights)[:N_time] ) * 24.*3600.
+    imagelist = np.zeros(N_time, dtype=[('ACTIONID','i8'),('DATE-OBS','S26'),('NIGHT','i4'),('AIRMASS','f8'),('IMAGE_ID','i8')])
+    imagelist['ACTIONID'] = START_ACTIONID + night
+    imagelist['DATE-OBS'] = [ dates[n] for n in night ]
+    imagelist['NIGHT'] = night
+    imagelist['AIRMASS'] = rng.uniform(1.,2.,N_time)
+    imagelist['IMAGE_ID'] = np.arange(N_time)
+    write_table( fname(roots['nights'], fieldname, 'IMAGELIST'), imagelist, 'IMAGELIST' )
+
+    #::: DATA images, one file per key
+    data = {}
+    for key in DATA_KEYS:
+        data[key] = make_image(key, N_obj, N_time, hjd, rng)
+        write_image( fname(roots['nights'], fieldname, key), data[key], key )
+
+    #::: SYSREM and DECORR
+    write_image( fname(roots['sysrem'], fieldname, 'SYSREM_FLUX3'),
+                 (data['FLUX3']*rng.normal(1.,0.001,(N_obj,N_time))).astype('f4'), 'SYSREM_FLUX3', primary=False )
+    write_image( fname(roots['decorr'], fieldname, 'DECORR_FLUX3'),
+                 (data['FLUX3']*rng.normal(1.,0.001,(N_obj,N_time))).astype('f4'), 'DECORR_FLUX', primary=False )
+
+    #::: BLS
+    ind_cands = np.sort( rng.choice(N_obj, size=min(N_cands,N_obj), replace=False) )
+    bls_catalogue = np.zeros(N_obj, dtype=[('OBJ_ID','S26'),('BMAG','f8'),('VMAG','f8'),('DILUTION_V','f8'),('NUM_CANDS','i4')])
+    bls_catalogue['OBJ_ID'] = obj_ids
+    bls_catalogue['BMAG'] = catalogue['MAG_MEAN'] + 0.5
+    bls_catalogue['VMAG'] = catalogue['MAG_MEAN']
+    bls_catalogue['DILUTION_V'] = rng.uniform(0,0.1,N_obj)
+    bls_catalogue['NUM_CANDS'][ind_cands] = 5
+    candidates = np.zeros(5*len(ind_cands), dtype=[('OBJ_ID','S26'),('RANK','i4'),('FLAGS','i4'),
+                                                 ('PERIOD','f8'),('WIDTH','f8'),('DEPTH','f8'),('EPOCH','f8'),('SDE','f8')])
+    candidates['OBJ_ID'] = np.repeat( obj_ids[ind_cands], 5 )
+    candidates['RANK'] = np.tile( np.arange(1,6), len(ind_cands) )
+    candidates['PERIOD'] = rng.uniform(0.5,10.,len(candidates)) * 24.*3600.
+    candidates['WIDTH'] = rng.uniform(1.,4.,len(candidates)) * 3600.
+    candidates['DEPTH'] = rng.uniform(0.001,0.05,len(candidates))
+    candidates['EPOCH'] = hjd[0] + rng.uniform(0.,10.,len(candidates)) * 24.*3600.
+    candidates['SDE'] = rng.uniform(5.,30.,len(candidates))
+    with fitsio.FITS( fname(roots['bls'], fieldname, 'BLS'), 'rw', clobber=True ) as hdulist:
+        hdulist.write( bls_catalogue, extname='CATALOGUE' )
+        hdulist.write( candidates, extname='CANDIDATES' )
+
+    #::: CANVAS text file (not found by standard_fnames, pass it via fnames['canvas'])
+    with open(canvas_fname(outdir, fieldname, ngts_version), 'w') as f:
+        f.write('OBJ_ID\tPERIOD\tEPOCH\tWIDTH\tDEPTH\n')
+        for i in ind_cands[::2]:
+            f.write('%d\t%f\t%f\t%f\t%f\n' % (i+1, rng.uniform(0.5,10.), START_HJD+rng.uniform(0,10), rng.uniform(0.01,0.1), rng.uniform(0.001,0.05)))
+    roots['dilution'] = None
+    roots['canvas'] = None
+
+    return roots
+
+
+
+def make_megafile(outdir, fieldname='NG0304-1115', N_obj=1000, N_time=2000, N_nights=20, seed=42):
+    '''
+    write a synthetic in-pipeline BLSPipe megafile, pass it via fnames={'BLSPipe_megafile':...}
+    '''
+
+    tmpdir = os.path.join(outdir, 'megafile_parts')
+    roots = make_prodstore(tmpdir, fieldname=fieldname, ngts_version='MEGAFILE',
+                           N_obj=N_obj, N_time=N_time, N_nights=N_nights, seed=seed)
+
+    megafile = os.path.join( outdir, fieldname+'_megafile.fits' )
+    with fitsio.FITS( megafile, 'rw', clobber=True ) as hdulist:
+        hdulist.write( None )
+        for key in ['CATALOGUE','IMAGELIST']:
+            hdulist.write( fitsio.read(fname(roots['nights'], fieldname, key), ext=key), extname=key )
+        for key in DATA_KEYS:
+            newkey = 'FLUX' if key=='FLUX3' else ('FLUX_ERR' if key=='FLUX3_ERR' else key)
+            hdulist.write( fitsio.read(fname(roots['nights'], fieldname, key), ext=0), extname=newkey )
+
+    return megafile
+
+
+
+###############################################################################
+# Helpers
+###############################################################################
+def field_center(fieldname):
+    '''RA and Dec of the field center in degree, from a name like NG0304-1115'''
+    ra = ( int(fieldname[2:4]) + int(fieldname[4:6])/60. ) * 15.
+    dec = int(fieldname[7:9]) + int(fieldname[9:11])/60.
+    if fieldname[6] == '-': dec = -dec
+    return ra, dec
+
+
+
+def fname(root, fieldname, key):
+    return os.path.join( root, fieldname+'_'+key+'.fits' )
+
+
+
+def canvas_fname(outdir, fieldname, ngts_version):
+    return os.path.join( outdir, 'canvas_'+fieldname+'_'+ngts_version+'.txt' )
+
+
+
+def make_image(key, N_obj, N_time, hjd, rng):
+    if key == 'HJD':
+        return np.tile( hjd, (N_obj,1) )
+    elif key == 'FLAGS':
+        return ( rng.uniform(0,1,(N_obj,N_time)) < 0.02 ).astype('i2') * rng.randint(1,64,(N_obj,N_time)).astype('i2')
+    elif key in ['CCDX','CCDY']:
+        return ( rng.uniform(0,2048,(N_obj,1)) * 32. + rng.normal(0,32.,(N_obj,N_time)) ).astype('i4')
+    elif key in ['CENTDX','CENTDY','CENTDX_ERR','CENTDY_ERR']:
+        return rng.normal(0,1024.,(N_obj,N_time)).astype('i4')
+    elif key in ['FLUX3_ERR']:
+        return rng.uniform(1.,100.,(N_obj,N_time)).astype('f4')
+    else:
+        return ( 10**rng.uniform(2,5,(N_obj,1)) * rng.normal(1.,0.01,(N_obj,N_time)) ).astype('f4')
+
+
+
+def write_image(fname, data, extname, primary=True):
+    with fitsio.FITS( fname, 'rw', clobber=True ) as hdulist:
+        if not primary: hdulist.write( None )
+        hdulist.write( data, extname=extname )
+
+
+
+def write_table(fname, data, extname):
+    with fitsio.FITS( fname, 'rw', clobber=True ) as hdulist:
+        hdulist.write( None )
+        hdulist.write( data, extname=extname )
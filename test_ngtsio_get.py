@@ -12,10 +12,12 @@ Email: mg719@cam.ac.uk
 """
 
 import numpy as np
-import sys
+import os, sys
 import timeit
+import fitsio
 
 import ngtsio
+import ngtsio_get
 
 keys =  [
         'OBJ_ID', 'RA', 'DEC', 'REF_FLUX', 'CLASS', 'CCD_X', 'CCD_Y', 'FLUX_MEAN', 'FLUX_RMS', 'MAG_MEAN', 'MAG_RMS', 'NPTS', 'NPTS_CLIPPED',
@@ -188,6 +190,669 @@ def compare_fitsreader_speed():
         
         
         
+def read_image_per_row(hdu, ind_objs, ind_time):
+    '''reference reader: one cfitsio call per object, as before the blocked reads'''
+    data = np.zeros(( len(ind_objs), len(ind_time) ))
+    for i, ind_singleobj in enumerate(ind_objs):
+        buf = hdu[slice(ind_singleobj,ind_singleobj+1), slice( ind_time[0], ind_time[-1]+1)]
+        if buf.shape[1] != len(ind_time):
+            ind_timeX = [x - ind_time[0] for x in ind_time]
+            buf = buf[:,ind_timeX]
+        data[i,:] = buf
+    return data
+
+
+
+def compare_block_read_speed(key='FLUX3', obj_row=range(1,4001,2), obj_gaps=[0,4,16,64]):
+    '''compare the blocked object reader in fitsio_get_data against the per-row loop'''
+    
+    roots = ngtsio_get.standard_roots('NG0304-1115', 'CYCLE1706', None, True)
+    fnames = ngtsio_get.standard_fnames('NG0304-1115', 'CYCLE1706', roots, True)
+    ind_objs = np.sort( np.array(obj_row) - 1 )
+    
+    with fitsio.FITS(fnames[key]) as hdulist:
+        hdu = hdulist[0]
+        ind_time = range( hdu.get_dims()[1] )
+        
+        data_per_row = read_image_per_row(hdu, ind_objs, ind_time)
+        print 'per row', timeit.timeit(lambda: read_image_per_row(hdu, ind_objs, ind_time), number=5)
+        
+        for obj_gap in obj_gaps:
+            data_blocks = ngtsio_get.fitsio_read_image(hdu, ind_objs, ind_time, False, obj_gap=obj_gap)
+            if not np.array_equal(data_per_row, data_blocks):
+                print 'WARNING: blocked read does not match the per-row read for obj_gap', obj_gap
+            print 'blocks (obj_gap='+str(obj_gap)+')', timeit.timeit(lambda: ngtsio_get.fitsio_read_image(hdu, ind_objs, ind_time, False, obj_gap=obj_gap), number=5)
+        
+        
+        
+def compare_field_speed(N=100):
+    '''per-call latency of ngtsio.get versus a persistent ngtsio.Field session, cold and warm'''
+    
+    obj_ids = range(1,N+1)
+    
+    def test_get():
+        for obj_id in obj_ids:
+            ngtsio.get('NG0304-1115', 'CYCLE1706', ['HJD','SYSREM_FLUX3','CCDX'], obj_id=obj_id, silent=True)
+        
+    def test_field_cold():
+        field = ngtsio.Field('NG0304-1115', 'CYCLE1706')
+        field.get(['HJD','SYSREM_FLUX3','CCDX'], obj_id=obj_ids[0])
+        field.close()
+        
+    field = ngtsio.Field('NG0304-1115', 'CYCLE1706')
+    field.get(['HJD','SYSREM_FLUX3','CCDX'], obj_id=obj_ids[0])
+    
+    def test_field_warm():
+        for obj_id in obj_ids:
+            field.get(['HJD','SYSREM_FLUX3','CCDX'], obj_id=obj_id)
+    
+    print 'ngtsio.get (per call)', timeit.timeit(test_get, number=1) / N
+    print 'Field.get, cold (per call)', timeit.timeit(test_field_cold, number=5) / 5
+    print 'Field.get, warm (per call)', timeit.timeit(test_field_warm, number=1) / N
+    
+    for obj_id in obj_ids[:10]:
+        compare_dic( ngtsio.get('NG0304-1115', 'CYCLE1706', ['HJD','SYSREM_FLUX3','CCDX'], obj_id=obj_id, silent=True),
+                     field.get(['HJD','SYSREM_FLUX3','CCDX'], obj_id=obj_id) )
+    field.close()
+        
+        
+        
+    
+def compare_objid_index_speed(N=100):
+    '''single-object OBJ_ID look-ups with and without the OBJ_ID index of the CATALOGUE (see ngtsio_cache.py)'''
+    
+    import ngtsio_cache
+    fnames = ngtsio_get.standard_fnames('NG0304-1115', 'CYCLE1706', ngtsio_get.standard_roots('NG0304-1115', 'CYCLE1706', None, True), True)
+    obj_ids = ngtsio_get.objid_6digit( map(str, range(1,N+1)) )
+    
+    def test_lookup():
+        for obj_id in obj_ids:
+            ngtsio_get.get_indobjs_from_objids(fnames, [obj_id], 'fitsio')
+    
+    cache_dir = ngtsio_cache.CACHE_DIR
+    ngtsio_cache.CACHE_DIR = None
+    print 'without index (per look-up)', timeit.timeit(test_lookup, number=1) / N
+    ngtsio_cache.CACHE_DIR = cache_dir
+    test_lookup()
+    print 'with index (per look-up)', timeit.timeit(test_lookup, number=1) / N
+        
+        
+        
+    
+def compare_bls_join_speed(keys=['PERIOD','DEPTH','WIDTH','SDE']):
+    '''all BLS candidates of a field, with and without the CANDIDATES index (see ngtsio_cache.py)'''
+    
+    import ngtsio_cache
+    
+    def test_bls():
+        ngtsio.get('NG0304-1115', 'CYCLE1706', keys, obj_id='bls', silent=True)
+    
+    cache_dir = ngtsio_cache.CACHE_DIR
+    ngtsio_cache.CACHE_DIR = None
+    print 'without index', timeit.timeit(test_bls, number=1)
+    ngtsio_cache.CACHE_DIR = cache_dir
+    test_bls()
+    print 'with index', timeit.timeit(test_bls, number=1)
+        
+        
+        
+    
+def compare_read_workers_speed(keys=['HJD','FLUX3','FLUX3_ERR','CCDX','CCDY','CENTDX','CENTDY','SKYBKG','FLAGS','SYSREM_FLUX3'], obj_row=range(1,2001,2), workers=[1,2,4,8]):
+    '''reading the per-key files of a prodstore request one after another versus in threads (ngtsio_get.READ_WORKERS)'''
+    
+    read_workers = ngtsio_get.READ_WORKERS
+    for fitsreader in ['fitsio','mmap']:
+        for N in workers:
+            ngtsio_get.READ_WORKERS = N
+            def test_get():
+                ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_row=obj_row, fitsreader=fitsreader, silent=True)
+            print fitsreader, 'READ_WORKERS =', N, min(timeit.repeat(test_get, number=1, repeat=3))
+    ngtsio_get.READ_WORKERS = read_workers
+        
+        
+        
+    
+def check_mmap_threads(keys=['FLUX3','FLAGS','CCDX','SKYBKG','SYSREM_FLUX3'], obj_id=46, N_threads=16, N=200, max_open=2, read_workers=8):
+    '''many threads reading with fitsreader='mmap' at the same time (shared memory maps, see ngtsio_mmap.cache_lock)'''
+    
+    import threading
+    import ngtsio_mmap
+    
+    dic_ref = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_id=obj_id, silent=True)
+    errors = []
+    
+    def test_get():
+        for i in range(N):
+            try:
+                dic = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_id=obj_id, fitsreader='mmap', silent=True)
+                for key in keys:
+                    if not np.array_equal(dic[key], dic_ref[key]):
+                        errors.append('values of '+key)
+            except Exception as e:
+                errors.append(repr(e))
+    
+    max_open, ngtsio_mmap.MAX_OPEN = ngtsio_mmap.MAX_OPEN, max_open
+    workers, ngtsio_get.READ_WORKERS = ngtsio_get.READ_WORKERS, read_workers
+    threads = [ threading.Thread(target=test_get) for i in range(N_threads) ]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    ngtsio_mmap.MAX_OPEN, ngtsio_get.READ_WORKERS = max_open, workers
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'of', N_threads*N, 'threaded mmap reads failed, e.g.', errors[0]
+    else:
+        print 'threaded mmap reads successful.'
+        
+        
+        
+def check_lazy_decode(keys=['CCDX','CCDY','CENTDX','CENTDY','FLAGS'], obj_row=range(1,101,3), fitsreaders=['fitsio','pyfits','mmap']):
+    '''lazy_decode=True against the decoded arrays, for indexing, arithmetic and numpy functions'''
+    
+    errors = []
+    for fitsreader in fitsreaders:
+        for set_nan in [False, True]:
+            dic = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_row=obj_row, fitsreader=fitsreader, set_nan=set_nan, silent=True)
+            dic_lazy = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_row=obj_row, fitsreader=fitsreader, set_nan=set_nan, lazy_decode=True, silent=True)
+            for key in keys:
+                if key == 'FLAGS': continue
+                x, lazy = dic[key], dic_lazy[key]
+                checks = [ ('asarray', np.asarray(lazy), x),
+                           ('index', lazy[1:3, 5:20], x[1:3, 5:20]),
+                           ('subtract', lazy - 1., x - 1.),
+                           ('rsubtract', 1. - lazy, 1. - x),
+                           ('multiply', 2 * lazy, 2 * x),
+                           ('divide', lazy / 3., x / 3.),
+                           ('nanmedian', np.nanmedian(lazy, axis=1), np.nanmedian(x, axis=1)),
+                           ('sqrt', np.sqrt(lazy), np.sqrt(x)) ]
+                copy = {key: lazy}
+                copy[key] -= 1.
+                checks.append( ('isubtract', copy[key], x - 1.) )
+                for name, value, value_ref in checks:
+                    if not np.allclose(value, value_ref, equal_nan=True):
+                        errors.append(fitsreader+' '+key+' set_nan='+str(set_nan)+': '+name)
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'lazy_decode results differ, e.g.', errors[0]
+    else:
+        print 'lazy_decode results identical.'
+        
+        
+        
+def check_lazy_close(keys=['HJD','FLUX3','FLAGS','CCDX','SYSREM_FLUX3','PERIOD'], obj_id=46, N=50):
+    '''LazyDict.close() (and leaving a with block) closes the files of the lazy reads (Linux only, counts /proc/self/fd)'''
+    
+    def N_open():
+        return len(os.listdir('/proc/self/fd'))
+    
+    dic_ref = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_id=obj_id, silent=True)
+    N_before = N_open()
+    errors = []
+    for i in range(N):
+        with ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_id=obj_id, lazy=True, silent=True) as dic:
+            for key in keys:
+                if not np.array_equal(dic[key], dic_ref[key]):
+                    errors.append('values of '+key)
+        #::: keys read after close() open the files again
+        dic = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_id=obj_id, lazy=True, silent=True)
+        dic['HJD']
+        dic.close()
+        if not np.array_equal(dic['FLUX3'], dic_ref['FLUX3']):
+            errors.append('values of FLUX3 after close')
+        dic.close()
+    N_after = N_open()
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'lazy reads differ, e.g.', errors[0]
+    elif N_after > N_before:
+        print 'WARNING:', N_after-N_before, 'files still open after', N, 'closed lazy dictionaries'
+    else:
+        print 'lazy dictionaries closed all files.'
+        
+        
+        
+def check_convert(keys=['OBJ_ID','HJD','FLUX3','FLUX3_ERR','FLAGS','CCDX','CENTDX','SYSREM_FLUX3','DECORR_FLUX3','PERIOD','DEPTH'],
+                  fitsreaders=['fitsio','mmap'], obj_chunk=8, time_chunk=64, table_chunk=16):
+    '''get() from a store written by ngtsio.convert (small chunks, in a temporary STORE_DIR) against get() from the fits files'''
+    
+    import tempfile, shutil
+    import ngtsio_store
+    
+    selections = [ {'obj_id':46},
+                   {'obj_row':[1,2,3,40,41,200,201,202]},
+                   {'obj_row':range(1,300,7), 'time_index':range(10,200,3)},
+                   {'time_index':range(0,50)} ]
+    
+    store_dir, table_chunk_0 = ngtsio_store.STORE_DIR, ngtsio_store.TABLE_CHUNK
+    ngtsio_store.STORE_DIR = None
+    dics_ref = [ ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), silent=True, **selection) for selection in selections ]
+    
+    ngtsio_store.STORE_DIR = tempfile.mkdtemp(prefix='ngtsio_check_convert_')
+    ngtsio_store.TABLE_CHUNK = table_chunk
+    errors = []
+    try:
+        ngtsio.convert('NG0304-1115', 'CYCLE1706', obj_chunk=obj_chunk, time_chunk=time_chunk, silent=True)
+        roots = ngtsio_get.standard_roots('NG0304-1115', 'CYCLE1706', None, True)
+        fnames = ngtsio_get.standard_fnames('NG0304-1115', 'CYCLE1706', roots, True)
+        fname = fnames.get('CATALOGUE') or fnames['BLSPipe_megafile']
+        if ngtsio_store.open_source(fname)['catalogue'].get_extname() != 'CATALOGUE':
+            errors.append('EXTNAME catalogue')
+        for fitsreader in fitsreaders:
+            for selection, dic_ref in zip(selections, dics_ref):
+                dic = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), fitsreader=fitsreader, silent=True, **selection)
+                for key in keys:
+                    if not np.array_equal(dic[key], dic_ref[key]) and not np.allclose(dic[key], dic_ref[key], rtol=0, atol=0, equal_nan=True):
+                        errors.append(fitsreader+' '+key+' '+str(sorted(selection)))
+    finally:
+        shutil.rmtree(ngtsio_store.STORE_DIR)
+        ngtsio_store.STORE_DIR, ngtsio_store.TABLE_CHUNK = store_dir, table_chunk_0
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'reads from the store differ from the fits files, e.g.', errors[0]
+    else:
+        print 'reads from the store identical.'
+        
+        
+        
+def check_time_major(N_obj=300, N_time=200, N_nights=4, N_new=50, time_index=[3,50,120,199]):
+    '''
+    routing of read_image to the time-major copies (ngtsio.transpose) on a synthetic prodstore (in a temporary
+    directory): copies are used for time selections while up to date (never for all exposures), skipped with a
+    warning once nights are appended, and extended by the new exposures (or rebuilt, if old exposures changed)
+    by the next transpose; that there is no copy is only looked up once
+    '''
+    
+    import tempfile, shutil, warnings
+    import ngtsio_cache, ngtsio_synthetic
+    
+    tmpdir = tempfile.mkdtemp(prefix='ngtsio_check_time_major_')
+    cache_dir, ngtsio_cache.CACHE_DIR = ngtsio_cache.CACHE_DIR, os.path.join(tmpdir, 'cache')
+    read_time_major, extends_time_major = ngtsio_get.read_time_major, ngtsio_get.extends_time_major
+    load_time_major = ngtsio_cache.load_time_major
+    calls = {'read_time_major':0, 'extends':[], 'load':0}
+    
+    def count_load(*args):
+        calls['load'] += 1
+        return load_time_major(*args)
+    
+    def count_read_time_major(*args, **kwargs):
+        calls['read_time_major'] += 1
+        return read_time_major(*args, **kwargs)
+    
+    def record_extends(*args):
+        calls['extends'].append( extends_time_major(*args) )
+        return calls['extends'][-1]
+    
+    def read(roots, time_index=time_index):
+        calls['read_time_major'] = 0
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            dic = ngtsio.get('NG0304-1115', 'CYCLE1706', ['FLUX3'], time_index=time_index, roots=roots, silent=True)
+        return dic['FLUX3'], calls['read_time_major'] > 0, any( 'time-major' in str(x.message) for x in w )
+    
+    ngtsio_get.read_time_major, ngtsio_get.extends_time_major = count_read_time_major, record_extends
+    ngtsio_cache.load_time_major = count_load
+    errors = []
+    try:
+        roots = ngtsio_synthetic.make_prodstore(os.path.join(tmpdir, 'prodstore'), 'NG0304-1115', 'CYCLE1706', N_obj, N_time, N_nights)
+        fname = ngtsio_get.standard_fnames('NG0304-1115', 'CYCLE1706', roots, True)['FLUX3']
+        image = fitsio.read(fname)
+        
+        #::: no copy
+        read(roots)
+        calls['load'] = 0
+        flux, routed, warned = read(roots)
+        if calls['load'] > 0: errors.append('missing copy looked up again')
+        if not np.array_equal(flux, image[:,time_index]): errors.append('values without any copy')
+        
+        #::: up-to-date copy
+        ngtsio.transpose('NG0304-1115', 'CYCLE1706', keys=['FLUX3'], roots=roots, silent=True)
+        flux, routed, warned = read(roots)
+        if not routed or warned: errors.append('up-to-date copy not used')
+        if not np.array_equal(flux, image[:,time_index]): errors.append('values from the up-to-date copy')
+        flux, routed, warned = read(roots, time_index=None)
+        if routed: errors.append('copy used for all exposures')
+        if not np.array_equal(flux, image): errors.append('values of all exposures')
+        
+        for case in ['appended', 'changed']:
+            #::: a new night, or a reprocessed first exposure
+            image = np.hstack([ image, image[:,:N_new]*1.01 ]).astype(image.dtype)
+            if case == 'changed': image[:,0] += 1.
+            ngtsio_synthetic.write_image(fname, image, 'FLUX3')
+            flux, routed, warned = read(roots)
+            if routed or not warned: errors.append(case+': outdated copy not skipped with a warning')
+            if not np.array_equal(flux, image[:,time_index]): errors.append(case+': values without the copy')
+            
+            calls['extends'] = []
+            ngtsio.transpose('NG0304-1115', 'CYCLE1706', keys=['FLUX3'], roots=roots, silent=True)
+            if calls['extends'] != [case == 'appended']: errors.append(case+': extended '+str(calls['extends']))
+            if not np.array_equal(ngtsio_cache.load_time_major(fname, 'FLUX3'), image.T): errors.append(case+': values of the new copy')
+            flux, routed, warned = read(roots)
+            if not routed or warned: errors.append(case+': new copy not used')
+            if not np.array_equal(flux, image[:,time_index]): errors.append(case+': values from the new copy')
+    finally:
+        ngtsio_get.read_time_major, ngtsio_get.extends_time_major = read_time_major, extends_time_major
+        ngtsio_cache.load_time_major = load_time_major
+        ngtsio_cache.CACHE_DIR = cache_dir
+        shutil.rmtree(tmpdir)
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'time-major checks failed, e.g.', errors[0]
+    else:
+        print 'time-major copies used, skipped and extended as expected.'
+        
+        
+        
+def check_result_cache(obj_id=46, max_MB=100):
+    '''hits, misses and partial-key requests of the in-memory result cache (ngtsio_results), with in-place changes by the caller'''
+    
+    import ngtsio_results
+    
+    def counts(keys, **kwargs):
+        info = ngtsio_results.info()
+        dic = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_id=obj_id, silent=True, **kwargs)
+        info_after = ngtsio_results.info()
+        return dic, (info_after['hits']-info['hits'], info_after['misses']-info['misses'])
+    
+    max_bytes, ngtsio_results.MAX_BYTES = ngtsio_results.MAX_BYTES, 0
+    dic_ref = ngtsio.get('NG0304-1115', 'CYCLE1706', ['FLUX3','HJD','FLAGS'], obj_id=obj_id, silent=True)
+    ngtsio_results.MAX_BYTES = int(max_MB * 2**20)
+    ngtsio_results.clear()
+    errors = []
+    try:
+        #::: (request, expected hits and misses per key incl. OBJ_ID)
+        for keys, kwargs, expected in [ (['FLUX3','HJD'], {}, (0,3)),
+                                        (['FLUX3','HJD'], {}, (3,0)),
+                                        (['FLUX3','FLAGS'], {}, (2,1)),
+                                        (['FLUX3'], {'set_nan':True}, (0,2)) ]:
+            dic, found = counts(keys, **kwargs)
+            if found != expected:
+                errors.append(str(keys)+' '+str(kwargs)+': (hits, misses) '+str(found)+' instead of '+str(expected))
+            for key in keys:
+                value_ref = dic_ref[key] if not kwargs else np.where(dic_ref['FLAGS'] > 0, np.nan, dic_ref[key])
+                if not np.allclose(dic[key], value_ref, rtol=0, atol=0, equal_nan=True):
+                    errors.append(str(keys)+' '+str(kwargs)+': values of '+key)
+                #::: the caller's arrays are writable, and changing them must not change the cache
+                try:
+                    dic[key] -= 1
+                except ValueError as e:
+                    errors.append(str(keys)+' '+str(kwargs)+': '+key+' not writable ('+str(e)+')')
+    finally:
+        ngtsio_results.MAX_BYTES = max_bytes
+        ngtsio_results.clear()
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'result cache checks failed, e.g.', errors[0]
+    else:
+        print 'result cache hits and misses as expected.'
+        
+        
+        
+def check_unknown_objids(obj_ids=[99999, [99999,99998], '099999'], fitsreaders=['fitsio','pyfits','mmap']):
+    '''requests of OBJ_IDs that are not in the CATALOGUE return None (get, get_many), as without the OBJ_ID index'''
+    
+    errors = []
+    for fitsreader in fitsreaders:
+        for obj_id in obj_ids:
+            try:
+                dic = ngtsio.get('NG0304-1115', 'CYCLE1706', ['HJD','FLUX3'], obj_id=obj_id, fitsreader=fitsreader, silent=True)
+                if dic is not None:
+                    errors.append(fitsreader+' '+str(obj_id)+': returned '+str(dic.get('OBJ_ID')))
+            except Exception as e:
+                errors.append(fitsreader+' '+str(obj_id)+': '+repr(e))
+    
+    for workers in [1, 2]:
+        requests = [ ('NG0304-1115', 'CYCLE1706', ['HJD','FLUX3'], {'obj_id':obj_id}) for obj_id in obj_ids ]
+        try:
+            for i, dic in ngtsio.get_many(requests, workers=workers):
+                if dic is not None:
+                    errors.append('get_many '+str(obj_ids[i])+': returned '+str(dic.get('OBJ_ID')))
+        except Exception as e:
+            errors.append('get_many: '+repr(e))
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'requests of unknown OBJ_IDs failed, e.g.', errors[0]
+    else:
+        print 'requests of unknown OBJ_IDs return None.'
+        
+        
+        
+def check_flag_mask(keys=['FLUX3','FLUX3_ERR','SYSREM_FLUX3','HJD','FLAGS'], obj_row=range(1,301,5), flag_masks=[None, 4, 1|8, 32], fitsreaders=['fitsio','pyfits','mmap']):
+    '''
+    set_nan with flag_mask against a manual FLAGS & flag_mask mask; with fitsreader='mmap', all-object
+    reads keep the keys without nan (HJD, FLAGS) as views into the files
+    '''
+    
+    errors = []
+    for fitsreader in fitsreaders:
+        dic_ref = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_row=obj_row, fitsreader=fitsreader, silent=True)
+        for flag_mask in flag_masks:
+            dic = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), obj_row=obj_row, fitsreader=fitsreader, set_nan=True, flag_mask=flag_mask, silent=True)
+            flagged = (dic_ref['FLAGS'] > 0) if flag_mask is None else ((dic_ref['FLAGS'].astype(int) & flag_mask) != 0)
+            for key in keys:
+                value_ref = np.where(flagged, np.nan, dic_ref[key]) if key in ngtsio_get.NAN_KEYS else dic_ref[key]
+                if not np.allclose(dic[key], value_ref, rtol=0, atol=0, equal_nan=True):
+                    errors.append(fitsreader+' flag_mask='+str(flag_mask)+': values of '+key)
+    
+    dic = ngtsio.get('NG0304-1115', 'CYCLE1706', list(keys), fitsreader='mmap', set_nan=True, flag_mask=4, silent=True)
+    for key in ['HJD','FLAGS']:
+        if dic[key].flags.owndata:
+            errors.append('mmap all objects: '+key+' was copied')
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'flag_mask checks failed, e.g.', errors[0]
+    else:
+        print 'flag_mask results as expected.'
+        
+        
+        
+def check_find_many(N_obj=5000, N_targets=2500, search_radius=0.01, chunksizes=[1000, 97, 1], seed=42):
+    '''
+    search_index_many (find_list) against search_index (find) on a synthetic sky index across RA 0/360,
+    with duplicate positions, targets without any match and several chunks
+    '''
+    import ngtsio_cache, ngtsio_find
+    
+    rng = np.random.RandomState(seed)
+    RA = np.mod( rng.uniform(-1., 1., N_obj), 360. )
+    DEC = rng.uniform(-12., -10., N_obj)
+    RA[1::50], DEC[1::50] = RA[::50], DEC[::50]
+    obj_ids = np.char.mod('%06i', np.arange(1, N_obj+1))
+    
+    #::: built in memory only (no cache directory)
+    cache_dir = ngtsio_cache.CACHE_DIR
+    ngtsio_cache.CACHE_DIR = None
+    try:
+        index = ngtsio_cache.get_sky_index('synthetic_catalogue.fits', lambda: (obj_ids, RA, DEC))
+    finally:
+        ngtsio_cache.CACHE_DIR = cache_dir
+    
+    #::: on objects, next to them on either side of RA 0/360, and far off
+    i = rng.randint(0, N_obj, N_targets)
+    RA_t = np.mod( RA[i] + rng.normal(0., search_radius, N_targets), 360. )
+    DEC_t = DEC[i] + rng.normal(0., search_radius, N_targets)
+    RA_t[::7], DEC_t[::7] = RA[i[::7]], DEC[i[::7]]
+    RA_t[1::11], RA_t[2::11] = 359.9999, 0.0001
+    DEC_t[3::13] = DEC_t[3::13] + 5.
+    
+    errors = []
+    expected = [ ngtsio_find.search_index(index, ra, dec, search_radius) for ra, dec in zip(RA_t, DEC_t) ]
+    for chunksize in chunksizes:
+        results = ngtsio_find.search_index_many(index, RA_t, DEC_t, search_radius, chunksize=chunksize)
+        if len(results) != N_targets:
+            errors.append('chunksize '+str(chunksize)+': '+str(len(results))+' results')
+            continue
+        for k, ((obj_ids1, sep1), (obj_ids2, sep2)) in enumerate(zip(expected, results)):
+            if not np.array_equal(obj_ids1, obj_ids2) or not np.allclose(sep1, sep2, rtol=0, atol=1e-12):
+                errors.append('chunksize '+str(chunksize)+', RA '+str(RA_t[k])+', DEC '+str(DEC_t[k])+': '+str(list(obj_ids1))+' vs '+str(list(obj_ids2)))
+    
+    N_matches = sum( len(x[0]) for x in expected )
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'batched cone searches differ, e.g.', errors[0]
+    else:
+        print 'batched cone searches identical (', N_matches, 'matches of', N_targets, 'targets ).'
+        
+        
+        
+        
+        
+        
+def check_canvas(N_obj=2000, N_canvas=700, seed=42):
+    '''
+    get_canvas_data (one crossmatch for all CANVAS keys, with and without the binary copy in the local cache)
+    against the per-object loop it replaced, incl. the rescaling of PERIOD and WIDTH, on a synthetic CANVAS file
+    '''
+    import tempfile, shutil, glob
+    import ngtsio_cache
+    
+    def get_canvas_data_per_object(fname, keys, dic):
+        canvasdata = np.genfromtxt(fname, dtype=None, names=True)
+        canvas_obj_ids = ngtsio_get.objid_6digit( canvasdata['OBJ_ID'].astype('|S6') )
+        for canvaskey in canvasdata.dtype.names:
+            if ('CANVAS_' + canvaskey) in keys:
+                dic[ 'CANVAS_' + canvaskey ] = np.zeros( len(dic['OBJ_ID']) ) * np.nan
+                for i, obj_id in enumerate( dic['OBJ_ID'] ):
+                    if obj_id in canvas_obj_ids:
+                        dic[ 'CANVAS_' + canvaskey ][i] = canvasdata[canvaskey][ canvas_obj_ids == obj_id ]
+                if ('CANVAS_' + canvaskey) == 'CANVAS_PERIOD':
+                     dic[ 'CANVAS_' + canvaskey ] *= 24.*3600.
+                if ('CANVAS_' + canvaskey) == 'CANVAS_WIDTH':
+                    for i, obj_id in enumerate( dic['OBJ_ID'] ):
+                        if obj_id in canvas_obj_ids:
+                            dic[ 'CANVAS_WIDTH' ][i] = ( canvasdata['WIDTH'][ canvas_obj_ids == obj_id ] * canvasdata['PERIOD'][ canvas_obj_ids == obj_id ] ) *24.*3600.
+        return dic
+    
+    def same(a, b):
+        return (a.shape == b.shape) and np.all( (a == b) | (np.isnan(a) & np.isnan(b)) )
+    
+    tmpdir = tempfile.mkdtemp(prefix='ngtsio_check_canvas_')
+    cache_dir = ngtsio_cache.CACHE_DIR
+    errors = []
+    try:
+        #::: WIDTH before PERIOD, unpadded OBJ_IDs, in random order
+        rng = np.random.RandomState(seed)
+        canvas_ids = rng.permutation(N_obj)[:N_canvas] + 1
+        fname = os.path.join(tmpdir, 'canvas.txt')
+        with open(fname, 'w') as f:
+            f.write('OBJ_ID\tWIDTH\tEPOCH\tPERIOD\tDEPTH\n')
+            for obj_id in canvas_ids:
+                f.write('%d\t%f\t%f\t%f\t%f\n' % (obj_id, rng.uniform(0.01,0.1), rng.uniform(0,10), rng.uniform(0.5,10.), rng.uniform(0.001,0.05)))
+        
+        obj_id_sets = {'all objects': np.arange(1, N_obj+1),
+                       'random objects': rng.choice(N_obj+100, 300) + 1,
+                       'one object in the CANVAS': canvas_ids[:1],
+                       'one object not in the CANVAS': np.setdiff1d(np.arange(1, N_obj+1), canvas_ids)[:1]}
+        key_sets = [['CANVAS_PERIOD','CANVAS_WIDTH','CANVAS_EPOCH','CANVAS_DEPTH'], ['CANVAS_WIDTH'], ['CANVAS_PERIOD','FLUX3']]
+        
+        for cache in [None, os.path.join(tmpdir, 'cache'), 'again']:
+            if cache != 'again':
+                ngtsio_cache.CACHE_DIR = cache
+            for name, obj_ids in sorted(obj_id_sets.items()):
+                for keys in key_sets:
+                    obj_ids_str = np.char.zfill( obj_ids.astype('S6'), 6 )
+                    expected = get_canvas_data_per_object(fname, keys, {'OBJ_ID':obj_ids_str.copy()})
+                    dic = ngtsio_get.get_canvas_data({'canvas':fname}, keys, {'OBJ_ID':obj_ids_str.copy()})
+                    if sorted(dic.keys()) != sorted(expected.keys()):
+                        errors.append(str(cache)+', '+name+': keys '+str(sorted(dic.keys())))
+                        continue
+                    for key in expected:
+                        if (key != 'OBJ_ID') and not same(dic[key], expected[key]):
+                            errors.append(str(cache)+', '+name+': '+key)
+                        
+        if len(glob.glob(os.path.join(tmpdir, 'cache', 'canvas_table', '*'))) != 1:
+            errors.append('no binary copy of the CANVAS file')
+            
+    finally:
+        ngtsio_cache.CACHE_DIR = cache_dir
+        shutil.rmtree(tmpdir)
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'CANVAS look-ups differ from the per-object loop, e.g.', errors[0]
+    else:
+        print 'CANVAS look-ups identical to the per-object loop.'
+        
+        
+        
+def check_cached_glob():
+    '''
+    ngtsio_cache.cached_glob against glob.glob on a temporary directory tree, while entries are added and removed:
+    listings are renewed when the modification time of a directory changes, and not trusted within the settle window
+    (entries added within the same mtime tick), also after being saved and loaded by another process
+    '''
+    import tempfile, shutil, glob, time
+    import ngtsio_cache
+    
+    def touch(*names):
+        for name in names:
+            if not os.path.exists(os.path.dirname(name)): os.makedirs(os.path.dirname(name))
+            open(name, 'w').close()
+    
+    tmpdir = tempfile.mkdtemp(prefix='ngtsio_check_glob_')
+    root = os.path.join(tmpdir, 'prodstore')
+    patterns = [ os.path.join(root, '*', '*.fits'), os.path.join(root, 'a_*', 'x.fits'), os.path.join(root, '*_1'),
+                 os.path.join(root, '[ab]_*', '*.fits'), os.path.join(root, '*', '.*'), os.path.join(root, 'c_*', '*') ]
+    state = (ngtsio_cache.CACHE_DIR, ngtsio_cache.LISTING_MAX_AGE, ngtsio_cache.listings, ngtsio_cache.listings_checked, ngtsio_cache.listings_changed)
+    errors = []
+    
+    def compare(case):
+        for pattern in patterns:
+            cached, listed = sorted(ngtsio_cache.cached_glob(pattern)), sorted(glob.glob(pattern))
+            if cached != listed:
+                errors.append(case+', '+pattern+': '+str(cached)+' vs '+str(listed))
+        
+    try:
+        #::: a fresh process, with every directory checked on every call
+        ngtsio_cache.CACHE_DIR = os.path.join(tmpdir, 'cache')
+        ngtsio_cache.LISTING_MAX_AGE = 0.
+        ngtsio_cache.listings, ngtsio_cache.listings_checked, ngtsio_cache.listings_changed = None, {}, set()
+        
+        touch(os.path.join(root, 'a_1', 'x.fits'), os.path.join(root, 'a_1', '.hidden'), os.path.join(root, 'b_2', 'y.fits'))
+        compare('first listing')
+        
+        #::: entries added and removed (the directory modification times change)
+        touch(os.path.join(root, 'a_1', 'z.fits'), os.path.join(root, 'c_1', 'w.fits'))
+        os.remove(os.path.join(root, 'b_2', 'y.fits'))
+        for dirname in [root, os.path.join(root, 'a_1'), os.path.join(root, 'b_2')]:
+            os.utime(dirname, (time.time(), time.time()+1.))
+        compare('added and removed')
+        
+        #::: an entry added within the same mtime tick, while the listing is younger than the settle window
+        t0 = time.time() - ngtsio_cache.LISTING_SETTLE_TIME/2.
+        os.utime(os.path.join(root, 'a_1'), (t0, t0))
+        compare('settle window, before')
+        touch(os.path.join(root, 'a_1', 'v.fits'))
+        os.utime(os.path.join(root, 'a_1'), (t0, t0))
+        compare('settle window, after')
+        
+        #::: ... and once the listing is older than the settle window: the cached listing is trusted
+        t1 = time.time() - 100.
+        os.utime(os.path.join(root, 'a_1'), (t1, t1))
+        compare('settled, before')
+        touch(os.path.join(root, 'a_1', 'u.fits'))
+        os.utime(os.path.join(root, 'a_1'), (t1, t1))
+        if os.path.join(root, 'a_1', 'u.fits') in ngtsio_cache.cached_glob(os.path.join(root, 'a_*', '*.fits')):
+            errors.append('settled, same mtime: the directory was listed again')
+        os.utime(os.path.join(root, 'a_1'), (t1+10., t1+10.))
+        compare('settled, changed mtime')
+        
+        #::: another process, starting from the saved listings
+        ngtsio_cache.listings, ngtsio_cache.listings_checked, ngtsio_cache.listings_changed = None, {}, set()
+        compare('saved listings')
+        if not os.path.exists(ngtsio_cache.listings_fname()):
+            errors.append('listings not saved')
+        shutil.rmtree(os.path.join(root, 'c_1'))
+        compare('saved listings, removed directory')
+        
+    finally:
+        ngtsio_cache.CACHE_DIR, ngtsio_cache.LISTING_MAX_AGE, ngtsio_cache.listings, ngtsio_cache.listings_checked, ngtsio_cache.listings_changed = state
+        shutil.rmtree(tmpdir)
+    
+    if len(errors) > 0:
+        print 'WARNING:', len(errors), 'cached globs differ from glob.glob, e.g.', errors[0]
+    else:
+        print 'cached globs identical to glob.glob.'
+        
+        
+        
     
 if __name__ == '__main__':    
 #    test(quickkeys)